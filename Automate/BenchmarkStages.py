@@ -0,0 +1,218 @@
+#! python3
+"""
+This program measures how long each stage of WaterDataParser.py takes, and how much memory it
+uses, converting sample files written by GenerateSampleData.py. It is used to see the effect of
+changes to the converter, and to catch a stage that has become slower before it is put to use.
+
+For each size asked for, it writes a sample file of that many rows for each template into a work
+folder, and then converts each file the way WaterDataParser.py does, one stage at a time:
+GetLabFileData, AverageRowData, SerializeData, FillAccessData, FillDupeAccessData,
+FillAccessFieldComments, MoveLtGtRowToTop, SanityChecks and WriteAccessDataFile. Stages that
+don't apply to a template, like averaging for anything but Cyano, are left out. For each stage it
+reports the time, the number of rows after the stage, and the peak memory allocated during the
+stage. The conversion runs as with -a, and the warnings files are left in the work folder.
+
+Tracing memory slows the stages down. Use -nm for times that are closer to those of a normal run.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -r N, --rows N        rows per sample file, may be repeated to measure several sizes (default 1000)
+  -t TYPE, --template TYPE
+                        template to measure, may be repeated (default all of them)
+  -d DIR, --dir DIR     work folder to use and keep (default a temporary folder, removed afterwards)
+  -s N, --seed N        seed for the sample files (default 1)
+  -nm, --noMemory       don't trace memory use
+  -o FILE, --output FILE
+                        also write the measurements to a JSON file, to compare with other runs
+
+Version History:
+
+2026-10-17 Original version
+"""
+
+## @details Fetches user input arguments, if any, and sets variables accordingly.
+def ParseArguments():
+    global sizes, templates, workDir, traceMemory, jsonFile
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r","--rows", type=int, action="append", metavar="N", help="rows per sample file, may be repeated")
+    parser.add_argument("-t","--template", action="append", choices=list(fileSuffixes.keys()), metavar="TYPE", help="template to measure, may be repeated")
+    parser.add_argument("-d","--dir", default="", metavar="DIR", help="work folder to use and keep")
+    parser.add_argument("-s","--seed", type=int, default=generator.seed, metavar="N", help="seed for the sample files")
+    parser.add_argument("-nm","--noMemory", action="store_true", help="don't trace memory use")
+    parser.add_argument("-o","--output", default="", metavar="FILE", help="also write the measurements to a JSON file")
+    args = parser.parse_args()
+    if args.rows :
+        sizes = args.rows
+    if args.template :
+        templates = args.template
+    workDir = args.dir
+    generator.seed = args.seed
+    traceMemory = not args.noMemory
+    jsonFile = args.output
+
+
+## @parblock @param [in] context ConversionContext of the file, from Converter.NewContext()
+## @param [in] fileType Type of file
+## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @return List of (stage name, routine) pairs, in the order ConvertAccessData() runs them.@endparblock
+##
+## Uses global fileSuffixes and labAttributes.
+def GetStages(context, fileType, processFileInfo):
+    settings = fileSuffixes[fileType]
+    stages = [("GetLabFileData", lambda: converter.GetLabFileData(context, fileType, processFileInfo["File"]))]
+    if "averageInRow" in settings.keys() :
+        stages.append(("AverageRowData", lambda: converter.AverageRowData(context, settings["averageInRow"])))
+    stages.append(("SerializeData", lambda: converter.SerializeData(context, settings["testsPerRow"])))
+    stages.append(("FillAccessData", lambda: converter.FillAccessData(context)))
+    if labAttributes[settings["lab"]]["dupeSupport"] :
+        stages.append(("FillDupeAccessData", lambda: converter.FillDupeAccessData(context)))
+    if settings["associated"] and processFileInfo["Field File"] :
+        stages.append(("FillAccessFieldComments", lambda: converter.FillAccessFieldComments(context, processFileInfo["Field File"])))
+    stages.append(("MoveLtGtRowToTop", lambda: converter.MoveLtGtRowToTop(context)))
+    stages.append(("SanityChecks", lambda: converter.SanityChecks(context, processFileInfo["Date"])))
+    stages.append(("WriteAccessDataFile", lambda: converter.WriteAccessDataFile(context, fileType, converter.YearMonthDay(processFileInfo["Date"]))))
+    return(stages)
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @return Tuple of the list of dictionaries, one per stage, with the stage name, seconds, rows after the
+## stage and peak bytes, and the integer number of warnings.@endparblock
+## Converts one input file a stage at a time, in its own ConversionContext. MoveLtGtRowToTop is
+## only run when there is a row with < or >, as in ConvertAccessData().
+##
+## Uses global traceMemory and measuredConverter.
+def MeasureFile(fileType, processFileInfo):
+    context = measuredConverter.NewContext(fileType, processFileInfo)
+    measures = []
+    ltGtFound = False
+    for name, stage in GetStages(context, fileType, processFileInfo) :
+        if name == "MoveLtGtRowToTop" and not ltGtFound :
+            continue
+        if traceMemory :
+            tracemalloc.reset_peak()
+            startBytes = tracemalloc.get_traced_memory()[0]
+        startTime = time.perf_counter()
+        result = stage()
+        seconds = time.perf_counter() - startTime
+        peakBytes = tracemalloc.get_traced_memory()[1] - startBytes if traceMemory else 0
+        if name == "FillAccessData" :
+            ltGtFound = result
+        rows = len(context.accessData) if context.accessData else len(context.labData)
+        measures.append({"Stage":name, "Seconds":seconds, "Rows":rows, "Peak Bytes":peakBytes})
+    converter.CloseWarning(context)
+    return(measures, context.warningCount)
+
+
+## @parblock @param [in] rows Integer number of rows per sample file
+## @return List of dictionaries, one per template, with the template, rows, warnings and stage measures.@endparblock
+## Writes the sample files for one size into the For Script folder of the work folder, replacing
+## those of the last size, and measures each of the templates asked for. The associated
+## VMMtempdepth file is always written, so field comments are measured.
+##
+## Uses global templates.
+def MeasureSize(rows):
+    for name in os.listdir("For Script") :
+        os.remove("For Script"+os.sep+name)
+    fileTypes = list(templates)
+    for fileType in templates :
+        associated = fileSuffixes[fileType]["associated"]
+        if associated and associated not in fileTypes :
+            fileTypes.append(associated)
+    generator.WriteSampleFiles("For Script", fileTypes, rows)
+
+    results = []
+    for fileType in templates :
+        for processFileInfo in converter.GetProjectInputFileList(fileType) :
+            measures, warnings = MeasureFile(fileType, processFileInfo)
+            results.append({"Template":fileType, "Rows":rows, "Warnings":warnings, "Stages":measures})
+    return(results)
+
+
+## @parblock @param [in] results List of dictionaries from MeasureSize()@endparblock
+## Prints the measurements as a table, with a total line for each file.
+def PrintMeasures(results):
+    print('{:>10}  {:<16}{:<26}{:>10}{:>12}{:>10}'.format("Rows", "Template", "Stage", "Seconds", "Rows out", "Peak MB"))
+    for result in results :
+        for measure in result["Stages"] :
+            print('{:>10}  {:<16}{:<26}{:>10.3f}{:>12}{:>10.1f}'.format(result["Rows"], result["Template"], measure["Stage"], measure["Seconds"],
+                                                                      measure["Rows"], measure["Peak Bytes"] / 1048576))
+        total = sum(measure["Seconds"] for measure in result["Stages"])
+        peak = max(measure["Peak Bytes"] for measure in result["Stages"])
+        print('{:>10}  {:<16}{:<26}{:>10.3f}{:>12}{:>10.1f}'.format(result["Rows"], result["Template"], "Total", total,
+                                                                  str(result["Warnings"])+" warn", peak / 1048576))
+
+
+#
+#  program main
+#
+
+import sys, os.path, argparse, time, json, shutil, tempfile, tracemalloc
+try :
+    import resource
+except ImportError :
+    # not on Windows, the peak for the whole run is then not reported
+    resource = None
+
+# the converter and the sample generator are in the same folder as this file
+automateDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, automateDir)
+import WaterDataParser as converter
+import GenerateSampleData as generator
+from WaterDataParser import fileSuffixes, labAttributes
+
+## List of the numbers of rows per sample file to measure
+sizes = [1000]
+## List of the templates to measure
+templates = list(fileSuffixes.keys())
+## String pathname of the work folder, empty to use a temporary folder
+workDir = ""
+## Boolean true to trace memory use
+traceMemory = True
+## String pathname of a JSON file to write the measurements to, or empty
+jsonFile = ""
+## Converter the files are measured with, made from the site data of the work folder
+measuredConverter = None
+
+if __name__ == "__main__" :
+
+    ParseArguments()
+
+    keepDir = bool(workDir)
+    if not keepDir :
+        workDir = tempfile.mkdtemp(prefix="WaterDataBenchmark")
+    os.makedirs(workDir+os.sep+"For Script", exist_ok=True)
+    os.makedirs(workDir+os.sep+"Automate", exist_ok=True)
+    shutil.copy(automateDir+os.sep+"projectSites.txt", workDir+os.sep+"Automate")
+    if jsonFile :
+        jsonFile = os.path.abspath(jsonFile)
+    os.chdir(workDir)
+
+    # the sample generator draws its sites from the globals, the conversions from the Converter's config
+    converter.ReadWriteSiteData("Automate")
+    measuredConverter = converter.Converter("Automate")
+    if traceMemory :
+        tracemalloc.start()
+
+    ## List of the measurements of each file, for all the sizes
+    results = []
+    for rows in sizes :
+        results = results + MeasureSize(rows)
+
+    if traceMemory :
+        tracemalloc.stop()
+    PrintMeasures(results)
+    if resource is not None :
+        # ru_maxrss is in kilobytes on Linux
+        print("Peak resident memory of the run: "+'{:.1f}'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)+" MB")
+    if jsonFile :
+        with open(jsonFile, 'w') as outputFile:
+            json.dump(results, outputFile, indent=1)
+        print("Wrote the measurements to "+jsonFile)
+
+    os.chdir(automateDir)
+    if not keepDir :
+        shutil.rmtree(workDir)
+
+    exit(0)
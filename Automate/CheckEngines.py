@@ -0,0 +1,191 @@
+#! python3
+"""
+This program checks that the conversion engines of WaterDataParser.py write the same upload files.
+The row-at-a-time engine, the column-at-a-time engine (-col) and the streaming engine (-s) share the
+rules of the conversion, but each reads, drops, numbers and orders the rows in its own way, so a change
+that works for one and not the others shows up here. Run it after changing any rule of the conversion.
+
+It writes sample files with GenerateSampleData.py, then converts a copy of them in a work folder of
+its own for each engine, running WaterDataParser.py with -a -nfm -nai -nss and the engine's option,
+so the Activity_ID index and site statistics of the Automate folder are neither used nor changed.
+The number of data entries and warnings of each engine are compared with those of the row-at-a-time
+engine, and so are the upload files: line for line for -col, and with their lines sorted for -s, as
+the streaming engine writes the rows held for dupes and the < or > row in a different order. The
+warnings files of -col are compared with their lines sorted, as it finds problems a column at a
+time. Those of -s are not compared, as its warnings list Activity_IDs in the order it writes them.
+
+It prints the differences found, and exits with 1 if there are any, 0 if not.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -r N, --rows N        rows per sample file (default 2000)
+  -t TYPE, --template TYPE
+                        template to check, may be repeated (default all of them)
+  -s N, --seed N        seed for the sample files (default 1)
+  -d DIR, --dir DIR     work folder to use and keep (default a temporary folder, removed afterwards)
+
+Version History:
+
+2026-10-17 Original version
+"""
+
+## @details Fetches user input arguments, if any, and sets variables accordingly.
+def ParseArguments():
+    global rows, templates, workDir
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r","--rows", type=int, default=rows, metavar="N", help="rows per sample file")
+    parser.add_argument("-t","--template", action="append", choices=list(fileSuffixes.keys()), metavar="TYPE", help="template to check, may be repeated")
+    parser.add_argument("-s","--seed", type=int, default=generator.seed, metavar="N", help="seed for the sample files")
+    parser.add_argument("-d","--dir", default="", metavar="DIR", help="work folder to use and keep")
+    args = parser.parse_args()
+    rows = args.rows
+    if args.template :
+        templates = args.template
+    generator.seed = args.seed
+    workDir = args.dir
+
+
+## @parblock @param [in] engine Name of the engine, a key of engines
+## @param [in] sampleDir String pathname of the folder of sample files
+## @return Tuple of the string pathname of the engine's work folder, and the converter's summary line without the time taken.@endparblock
+## Sets up a work folder for the engine, with a copy of the converter, projectSites.txt and the
+## sample files, and converts the sample files in it. The converter's output is only printed if it
+## fails.
+def ConvertWithEngine(engine, sampleDir):
+    engineDir = workDir+os.sep+engine
+    if os.path.exists(engineDir) :
+        shutil.rmtree(engineDir)
+    os.makedirs(engineDir+os.sep+"Automate")
+    shutil.copy(automateDir+os.sep+"WaterDataParser.py", engineDir+os.sep+"Automate")
+    shutil.copy(automateDir+os.sep+"projectSites.txt", engineDir+os.sep+"Automate")
+    shutil.copytree(sampleDir, engineDir+os.sep+"For Script")
+    command = [sys.executable, "WaterDataParser.py", "-a", "-nfm", "-nai", "-nss"] + engines[engine]
+    completed = subprocess.run(command, cwd=engineDir+os.sep+"Automate", capture_output=True, text=True)
+    if completed.returncode != 0 :
+        print(completed.stdout + completed.stderr)
+        print("The "+engine+" engine failed with exit code "+str(completed.returncode))
+        exit(1)
+    summary = completed.stdout.strip().splitlines()[-1]
+    print("Converted with the "+engine+" engine: "+summary)
+    return(engineDir, summary.rsplit(" in ", 1)[0])
+
+
+## @parblock @param [in] fileName String pathname of a file
+## @param [in] ordered Boolean true to keep the lines in file order, false to sort them
+## @return List of the lines of the file, or None if there is no such file.@endparblock
+def ReadLines(fileName, ordered):
+    if not os.path.isfile(fileName) :
+        return(None)
+    with open(fileName, 'r', newline='') as inputFile:
+        lines = inputFile.read().splitlines()
+    return(lines if ordered else sorted(lines))
+
+
+## @parblock @param [in] engine Name of the engine compared
+## @param [in] fileName String name of the file compared
+## @param [in] expected List of lines written by the row-at-a-time engine
+## @param [in] found List of lines written by the engine, or None if it wrote no such file
+## @return Integer number of differing lines.@endparblock
+## Prints the first few lines that differ between the two files, with their line numbers.
+def CompareLines(engine, fileName, expected, found):
+    if found is None :
+        print(engine+": "+fileName+" was not written")
+        return(len(expected))
+    differences = [(number, expectedLine, foundLine) for number, (expectedLine, foundLine) in enumerate(zip(expected, found), 1) if expectedLine != foundLine]
+    differenceCount = len(differences) + abs(len(expected) - len(found))
+    if differenceCount :
+        print(engine+": "+fileName+" differs in "+str(differenceCount)+" lines, "+str(len(found))+" lines against "+str(len(expected)))
+        for number, expectedLine, foundLine in differences[:maxShown] :
+            print("    line "+str(number)+"\n      default: "+expectedLine[:maxWidth]+"\n      "+engine+": "+foundLine[:maxWidth])
+    return(differenceCount)
+
+
+## @parblock @param [in] conversions Dictionary of the work folder and summary line of each engine, from ConvertWithEngine()
+## @return Integer number of differences, over all the engines and files.@endparblock
+## Compares the summary line and the upload and warnings files of each engine with those of the
+## row-at-a-time engine. Warnings files are compared sorted. For the engines in sortedEngines, upload
+## files are compared sorted, and warnings files not at all.
+def CompareEngines(conversions):
+    baseDir, baseSummary = conversions["default"]
+    differenceCount = 0
+    for engine, (engineDir, summary) in conversions.items() :
+        if engine == "default" :
+            continue
+        if summary != baseSummary :
+            print(engine+": "+summary+", against "+baseSummary)
+            differenceCount = differenceCount + 1
+        folders = [("For Upload", False)] if engine in sortedEngines else [("For Upload", False), ("For Script", True)]
+        for folder, warningsOnly in folders :
+            ordered = not warningsOnly and engine not in sortedEngines
+            for fileName in sorted(os.listdir(baseDir+os.sep+folder)) :
+                if warningsOnly and not (fileName.startswith("Warnings_") and fileName.endswith(".txt")) :
+                    continue
+                expected = ReadLines(baseDir+os.sep+folder+os.sep+fileName, ordered)
+                found = ReadLines(engineDir+os.sep+folder+os.sep+fileName, ordered)
+                differenceCount = differenceCount + CompareLines(engine, folder+os.sep+fileName, expected, found)
+    return(differenceCount)
+
+
+#
+#  program main
+#
+
+import sys, os.path, argparse, shutil, subprocess, tempfile
+
+# the converter and the sample generator are in the same folder as this file
+automateDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, automateDir)
+import WaterDataParser as converter
+import GenerateSampleData as generator
+from WaterDataParser import fileSuffixes
+
+## Dictionary of the WaterDataParser.py options of each engine checked, the first is the one compared against
+engines = {"default":[], "columnar":["-col"], "streaming":["-s"]}
+## List of the engines whose upload rows are compared sorted, as they write them in a different order
+sortedEngines = ["streaming"]
+## Integer number of rows per sample file
+rows = 2000
+## List of the templates to check
+templates = list(fileSuffixes.keys())
+## String pathname of the work folder, empty to use a temporary folder
+workDir = ""
+## Integer number of differing lines printed per file
+maxShown = 5
+## Integer number of characters printed of each differing line
+maxWidth = 200
+
+if __name__ == "__main__" :
+
+    ParseArguments()
+
+    keepDir = bool(workDir)
+    if not keepDir :
+        workDir = tempfile.mkdtemp(prefix="WaterDataEngines")
+    workDir = os.path.abspath(workDir)
+
+    # the sites are read from projectSites.txt in the Automate folder, next to this file
+    converter.ReadWriteSiteData(automateDir)
+    sampleDir = workDir+os.sep+"Samples"
+    if os.path.exists(sampleDir) :
+        shutil.rmtree(sampleDir)
+    fileTypes = list(templates)
+    for fileType in templates :
+        associated = fileSuffixes[fileType]["associated"]
+        if associated and associated not in fileTypes :
+            fileTypes.append(associated)
+    generator.WriteSampleFiles(sampleDir, fileTypes, rows)
+
+    ## Dictionary of the work folder and summary line of each engine
+    conversions = {}
+    for engine in engines.keys() :
+        conversions[engine] = ConvertWithEngine(engine, sampleDir)
+    differenceCount = CompareEngines(conversions)
+
+    if not keepDir :
+        shutil.rmtree(workDir)
+    if differenceCount :
+        print("The engines differ in "+str(differenceCount)+" places")
+        exit(1)
+    print("The engines wrote the same files")
+    exit(0)
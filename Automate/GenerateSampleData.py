@@ -0,0 +1,336 @@
+#! python3
+"""
+This program writes synthetic input files for WaterDataParser.py, for testing and for measuring
+performance. For one file date, it writes a YYYYMMDD_forscript_<template>.csv file for each of
+the templates in the fileSuffixes of WaterDataParser.py: MWRA, VMMtempdepth, Flagging,
+AlphaLabResults and Cyano, with the number of data rows asked for, from a thousand to ten million.
+
+The files look like the lab and field files the program is used with. They include duplicate
+(FDUP) samples, including AlphaLabResults triplicates, censored values with < and >, ROV sample addresses in the MWRA file, field times
+that sometimes disagree with the lab times, and a share of invalid rows: empty Site IDs, sites that
+are not in projectSites.txt, and results that are not numbers. The samples are spread over the weeks
+around the file date, and no site is sampled twice on a day, so the Activity_IDs are unique apart
+from those of the invalid rows. A file with more samples than the sites can have in the weeks
+around the file date goes on to the days after them, whose dates are too far from the file date.
+
+The same seed gives the same files.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -r N, --rows N        number of data rows per file (default 1000)
+  -d YYYYMMDD, --date YYYYMMDD
+                        date for the file names (default 20200603)
+  -t TYPE, --template TYPE
+                        template to write, may be repeated (default all of them)
+  -o DIR, --output DIR  folder to write the files to (default the "For Script" folder)
+  -s N, --seed N        seed for the random values (default 1)
+  -iv F, --invalid F    share of data rows made invalid (default 0.01)
+
+Version History:
+
+2026-10-17 Large files go on to later days instead of repeating the sampling events, so the Activity_IDs stay unique.
+2026-10-17 AlphaLabResults duplicates are made for every analysis, with some triplicates.
+2026-10-17 Original version
+"""
+
+## @details Fetches user input arguments, if any, and sets variables accordingly.
+def ParseArguments():
+    global rowCount, fileDate, templates, outputDir, seed, invalidShare
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r","--rows", type=int, default=rowCount, metavar="N", help="number of data rows per file")
+    parser.add_argument("-d","--date", default=YearMonthDay(fileDate), metavar="YYYYMMDD", help="date for the file names")
+    parser.add_argument("-t","--template", action="append", choices=list(fileSuffixes.keys()), metavar="TYPE", help="template to write, may be repeated")
+    parser.add_argument("-o","--output", default="", metavar="DIR", help="folder to write the files to")
+    parser.add_argument("-s","--seed", type=int, default=seed, metavar="N", help="seed for the random values")
+    parser.add_argument("-iv","--invalid", type=float, default=invalidShare, metavar="F", help="share of data rows made invalid")
+    args = parser.parse_args()
+    rowCount = args.rows
+    try :
+        fileDate = datetime.strptime(args.date, "%Y%m%d").date()
+    except ValueError :
+        parser.error("-d needs the date as YYYYMMDD")
+    if args.template :
+        templates = args.template
+    outputDir = args.output
+    seed = args.seed
+    invalidShare = args.invalid
+
+
+## @parblock @param [in] lab Which lab performs the analysis
+## @param [in] fieldTests List of tests reported one per column, left out of the list
+## @return List of parameter names the lab reports, one per analysis.@endparblock
+## Finds the parameters whose analysis the lab has a method for. Names that are only alternate
+## spellings of another parameter, like "E. Coli", are left out.
+##
+## Uses global analysisCodes and analysisNames.
+def GetLabParameters(lab, fieldTests):
+    parameters = []
+    abbreviations = []
+    for parameter in analysisCodes.keys() :
+        abbr = analysisCodes[parameter]["abbrev"]
+        if abbr in analysisNames[lab].keys() and abbr not in abbreviations and parameter not in fieldTests :
+            abbreviations.append(abbr)
+            parameters.append(parameter)
+    return(parameters)
+
+
+## @parblock @param [in] unitID Integer unit code
+## @return String unit name, as a lab writes it.@endparblock
+##
+## Uses global unitCodes.
+def GetUnitName(unitID):
+    for unit in unitCodes.keys() :
+        if unitCodes[unit] == unitID :
+            return(unit)
+    return("")
+
+
+## @parblock @param [in] sites List of site names of the project
+## @return Generator of (sample datetime, site) pairs, without end.@endparblock
+## Gives the sampling events: every site on the file date, then every site on the days before and
+## after it, out to the number of days allowed by maxDateDiff, then every site on each day after
+## those, most of them too far from the file date. No site is sampled twice on a day, so the
+## Activity_IDs stay unique. The time of day of an event only depends on its site and date, so the
+## lab and field files agree on it.
+##
+## Uses global fileDate and maxDateDiff.
+def SampleEvents(sites):
+    days = [0]
+    for day in range(1, int(maxDateDiff)) :
+        days = days + [-day, day]
+    days = chain(days, count(int(maxDateDiff)))
+    for day in days :
+        sampleDay = datetime.combine(fileDate, datetime.min.time()) + timedelta(days=day)
+        for index, site in enumerate(sites) :
+            minutes = (index * 15 + abs(day) * 5) % 240
+            yield(sampleDay + timedelta(hours=6, minutes=minutes), site)
+
+
+## @parblock @param [in] sampleTime datetime of the sample
+## @return String date and time in the form the lab files use, such as 6/3/2020 7:15@endparblock
+def LabDateTime(sampleTime):
+    return(str(sampleTime.month)+"/"+str(sampleTime.day)+"/"+str(sampleTime.year)+" "+str(sampleTime.hour)+":"+'{:02d}'.format(sampleTime.minute))
+
+
+## @parblock @param [in] parameter String name of the analysis
+## @param [in] random Random number generator
+## @return String result as a lab reports it.@endparblock
+## Most results are numbers within the expected limits of the analysis. Some are censored, below
+## the detection limit or above the top of the range, and a few are outside the expected limits.
+##
+## Uses global analysisCodes.
+def MakeResult(parameter, random):
+    upper = analysisCodes[parameter]["upper"]
+    lower = max(analysisCodes[parameter]["lower"], 0.0)
+    chance = random.random()
+    if chance < 0.08 :
+        return("<"+'{:.3g}'.format(lower + (upper - lower) * 0.001 + 0.001))
+    if chance < 0.10 :
+        return(">"+'{:.4g}'.format(upper * 0.5))
+    if chance < 0.11 :
+        return('{:.4g}'.format(upper * random.uniform(1.1, 2.0)))
+    return('{:.4g}'.format(random.uniform(lower, lower + (upper - lower) * 0.3)))
+
+
+## @parblock @param [in] row Dictionary of one row of lab data
+## @param [in] resultColumns List of the result columns of the row
+## @param [in] random Random number generator@endparblock
+## Makes a row invalid in one of the ways seen in real files: an empty Site ID, a site that is not
+## in projectSites.txt, or a result that is not a number.
+def MakeInvalid(row, resultColumns, random):
+    chance = random.random()
+    if chance < 0.3 :
+        row["Site ID"] = ""
+    elif chance < 0.6 :
+        row["Site ID"] = row["Site ID"][:-4]+"XX99"
+    else :
+        row[random.choice(resultColumns)] = "N/A"
+
+
+## @parblock @param [in] random Random number generator
+## @return Generator of dictionaries, rows of an MWRA file.@endparblock
+## An MWRA file has one row per test. Each ROV sample starts with a Sample Address row, and about one
+## sample in twenty has a duplicate, with Site ID FDUP and the original site in the FDUP? column.
+## The site is the last four characters of the MWRA Site ID, so shorter site names are not used.
+def MwraRows(random):
+    parameters = GetLabParameters("MWRA", [])
+    sites = [site for site in WaterDataParser.projectSites["VMM"] if len(site) == 4]
+    sampleNumber = 0
+    for eventCount, (sampleTime, site) in enumerate(SampleEvents(sites)) :
+        sampleSites = [site]
+        if eventCount % 20 == 7 :
+            sampleSites.append("FDUP")
+        for sampleSite in sampleSites :
+            baseRow = {"Site ID":"CRWA"+sampleSite, "Description":"", "X Trip":"", "Sampled By":"CRWA", "Test Location":"MWRA",
+                       "Status":"Complete", "Date/Time":LabDateTime(sampleTime), "Analyzed On":"", "Analysis":"", "Batch":"",
+                       "X Result Flags":"", "FDUP?":site if sampleSite == "FDUP" else "", "X Sample Flags":"", "Test Comment":"nil"}
+            if sampleSite.startswith("ROV") :
+                row = dict(baseRow)
+                row.update({"Sample Number":sampleNumber, "Sample ID":"", "Parameter":"Sample Address",
+                            "Formatted Entry":str(random.randint(1, 400))+" Charles River Rd", "Display String":""})
+                yield(row)
+            for parameter in parameters :
+                sampleNumber = sampleNumber + 1
+                row = dict(baseRow)
+                row.update({"Sample Number":sampleNumber, "Sample ID":"S"+'{:07d}'.format(sampleNumber), "Parameter":parameter,
+                            "Formatted Entry":MakeResult(parameter, random), "Display String":GetUnitName(analysisNames["MWRA"][analysisCodes[parameter]["abbrev"]]["unitID"])})
+                if random.random() < 0.02 :
+                    row["Test Comment"] = "sample received warm"
+                yield(row)
+
+
+## @parblock @param [in] random Random number generator
+## @return Generator of dictionaries, rows of a VMMtempdepth file.@endparblock
+## One row per sample, with temperature, depth and sometimes a field comment. Some times are two
+## hours off from the lab times, and some rows are for FDUP samples, whose depth and temperature
+## are not used.
+def VmmTempDepthRows(random):
+    for eventCount, (sampleTime, site) in enumerate(SampleEvents(WaterDataParser.projectSites["VMM"])) :
+        if random.random() < 0.03 :
+            sampleTime = sampleTime + timedelta(hours=2)
+        yield({"Site ID":site, "Date/Time":LabDateTime(sampleTime), "Temperature (C)":'{:.1f}'.format(random.uniform(8.0, 27.0)),
+               "Depth (ft)":'{:.1f}'.format(random.uniform(0.5, 6.0)),
+               "Field Comments":random.choice(["", "", "", "clear", "murky, fast flow", "geese upstream"])})
+        if eventCount % 20 == 7 :
+            yield({"Site ID":"FDUP", "Date/Time":LabDateTime(sampleTime), "Temperature (C)":"", "Depth (ft)":"", "Field Comments":""})
+
+
+## @parblock @param [in] random Random number generator
+## @return Generator of dictionaries, rows of a Flagging file.@endparblock
+## One row per sample with E. coli, temperature and depth. About one sample in ten has a duplicate,
+## marked "yes" in the FDUP? column.
+def FlaggingRows(random):
+    sampleNumber = 0
+    for eventCount, (sampleTime, site) in enumerate(SampleEvents(WaterDataParser.projectSites["FLG"])) :
+        for fdup in ["", "yes"] if eventCount % 10 == 3 else [""] :
+            sampleNumber = sampleNumber + 1
+            yield({"Sample ID":"GL"+'{:07d}'.format(sampleNumber), "Site ID":site, "Date/Time":LabDateTime(sampleTime),
+                   "E. coli":MakeResult("E. coli", random), "Temperature (C)":'{:.1f}'.format(random.uniform(8.0, 27.0)),
+                   "Depth (ft)":'{:.1f}'.format(random.uniform(1.0, 12.0)), "Field Comments":random.choice(["", "", "boat ramp busy"]), "FDUP?":fdup})
+
+
+## @parblock @param [in] random Random number generator
+## @return Generator of dictionaries, rows of an AlphaLabResults file.@endparblock
+## One row per test, for the VMM sites. About one sample in twenty has a duplicate, with Site ID
+## FDUP and the original site in the FDUP? column, and one in a hundred has two, a triplicate.
+def AlphaRows(random):
+    parameters = GetLabParameters("Alpha", [])
+    sampleNumber = 0
+    for eventCount, (sampleTime, site) in enumerate(SampleEvents(WaterDataParser.projectSites["VMM"])) :
+        sampleSites = [site]
+        if eventCount % 20 == 11 :
+            sampleSites.append("FDUP")
+        if eventCount % 100 == 11 :
+            sampleSites.append("FDUP")
+        for sampleSite in sampleSites :
+            for parameter in parameters :
+                sampleNumber = sampleNumber + 1
+                yield({"Sample ID":"L"+'{:07d}'.format(sampleNumber), "Site ID":sampleSite, "Date/Time":LabDateTime(sampleTime),
+                       "Parameter":parameter, "Formatted Entry":MakeResult(parameter, random), "FDUP?":site if sampleSite == "FDUP" else ""})
+
+
+## @parblock @param [in] random Random number generator
+## @return Generator of dictionaries, rows of a Cyano file.@endparblock
+## One row per sample, with three replicates each of phycocyanin and chlorophyll A. Some replicates
+## are blank, and about one sample in ten has a duplicate, marked "yes" in the FDUP? column.
+def CyanoRows(random):
+    for eventCount, (sampleTime, site) in enumerate(SampleEvents(WaterDataParser.projectSites["CYN"])) :
+        for fdup in ["", "yes"] if eventCount % 10 == 5 else [""] :
+            row = {"Site ID":site, "Date/Time":LabDateTime(sampleTime), "FDUP?":fdup, "Temperature (C)":'{:.1f}'.format(random.uniform(8.0, 27.0)),
+                   "Depth (ft)":'{:.1f}'.format(random.uniform(0.5, 3.0)), "Field Comments":random.choice(["", "", "scum on surface"]), "x":""}
+            for rep in ["1", "2", "3"] :
+                for column in ["FQ PC Rep"+rep+" (ug/L)", "FQ CA Rep"+rep+" (ug/L)"] :
+                    # any replicate can be blank, now and then all of them, which leaves the result out
+                    row[column] = "" if random.random() < 0.05 else '{:.2f}'.format(random.uniform(0.5, 60.0))
+            yield(row)
+
+
+## @parblock @param [in] fileType Type of file, one of the templates of fileSuffixes
+## @param [in] fileName String pathname of the file to write
+## @param [in] rows Integer number of data rows to write
+## @param [in] random Random number generator
+## @return Integer number of rows written.@endparblock
+## Writes one input file, a row at a time, so even very large files use little memory. The heading
+## row has the template's column names.
+##
+## Uses global fileSuffixes and invalidShare.
+def WriteSampleFile(fileType, fileName, rows, random):
+    columns = fileSuffixes[fileType]["columns"]
+    resultColumns = fileSuffixes[fileType]["testsPerRow"] if fileSuffixes[fileType]["testsPerRow"] else ["Formatted Entry"]
+    if "averageInRow" in fileSuffixes[fileType].keys() :
+        resultColumns = [column for column in columns if column.find(" Rep") > -1]
+    with open(fileName, 'w', newline='') as csvfile:
+        sampleWriter = csv.writer(csvfile)
+        sampleWriter.writerow(columns)
+        rowCount = 0
+        for row in rowMakers[fileType](random) :
+            if rowCount >= rows :
+                break
+            if row["Site ID"] and row["Site ID"][-4:] != "FDUP" and row.get("Parameter", "") != "Sample Address" and random.random() < invalidShare :
+                MakeInvalid(row, resultColumns, random)
+            sampleWriter.writerow([row.get(column, "") for column in columns])
+            rowCount = rowCount + 1
+    csvfile.close()
+    return(rowCount)
+
+
+## @parblock @param [in] dir String pathname of the folder to write the files to
+## @param [in] fileTypes List of templates to write
+## @param [in] rows Integer number of data rows per file@endparblock
+## Writes a sample input file for each template, and prints their names.
+##
+## Uses global fileDate and seed.
+def WriteSampleFiles(dir, fileTypes, rows):
+    os.makedirs(dir, exist_ok=True)
+    for fileType in fileTypes :
+        # each template gets its own generator, so the files don't depend on which others are written
+        random = Random(str(seed)+fileType)
+        fileName = dir+os.sep+YearMonthDay(fileDate)+"_forscript_"+fileType+".csv"
+        written = WriteSampleFile(fileType, fileName, rows, random)
+        print("Wrote "+str(written)+" rows to "+fileName)
+
+
+#
+#  program main
+#
+
+import sys, os.path, argparse, csv
+from datetime import datetime, timedelta
+from random import Random
+from itertools import chain, count
+
+# the templates, analyses and sites come from the converter itself
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import WaterDataParser
+from WaterDataParser import fileSuffixes, analysisCodes, analysisNames, unitCodes, maxDateDiff
+from WaterDataParser import ReadWriteSiteData, YearMonthDay
+
+## Integer number of data rows per file
+rowCount = 1000
+## datetime date object for the file names
+fileDate = datetime(2020, 6, 3).date()
+## List of the templates to write
+templates = list(fileSuffixes.keys())
+## String pathname of the folder to write to, empty for the "For Script" folder
+outputDir = ""
+## Integer seed for the random values
+seed = 1
+## Float share of the data rows made invalid
+invalidShare = 0.01
+
+## Dictionary of the row generator for each template
+rowMakers = {"MWRA":MwraRows, "VMMtempdepth":VmmTempDepthRows, "Flagging":FlaggingRows, "AlphaLabResults":AlphaRows, "Cyano":CyanoRows}
+
+if __name__ == "__main__" :
+
+    ParseArguments()
+
+    # the sites are read from projectSites.txt in the Automate folder, next to this file
+    ReadWriteSiteData(os.path.dirname(os.path.abspath(__file__)))
+
+    if not outputDir :
+        outputDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))+os.sep+"For Script"
+    WriteSampleFiles(outputDir, templates, rowCount)
+
+    exit(0)
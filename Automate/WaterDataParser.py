@@ -15,9 +15,58 @@ optional arguments:
   -i, --interactive   queries user for instruction on warning conditions (default)
   -a, --auto          run without user queries on warnings
   -nfm, --noFileMove  inhibit removal of source files, for debug
+  -col, --columnar    convert using the column-at-a-time engine
+  -s, --stream        stream rows to the output file with flat memory use, runs without user queries on warnings
+  -j N, --jobs N      convert input files in N worker processes, runs without user queries on warnings
+  -p, --pipeline      read the next input files and write the upload files in the background while converting, runs without user queries on warnings
+  -f, --force         convert every input file, even if unchanged since the last run
+  -w [SECONDS], --watch [SECONDS]
+                      keep running, converting input files as they arrive, looking every SECONDS (default 10), runs without user queries on warnings
+  -dr FILE, --dumpRules FILE
+                      write the collection method, activity type and analytical method rules to a CSV file, and quit
+  -m DIR, --metrics DIR
+                      write the time, rows, warnings and bytes of each input file and stage to DIR, as JSON and as a Prometheus textfile, and time each sanity check rule
+  -db FILE, --database FILE
+                      also write the Access data to the SQLite database FILE, replacing rows with the same Activity_ID
+  -nai, --noActivityIndex
+                      don't check the Activity_IDs against those of past upload files, nor record them
+  -rs, --replicateStats
+                      also write the number, average, standard deviation and CV of the replicates of each averaged result to a CSV file next to the warnings files
+  -ss DIR, --siteStats DIR
+                      add the results of the upload files in DIR to the site statistics used by the Reporting_Result range check, and quit
+  -nss, --noSiteStats
+                      check Reporting_Results against the fixed limits only, without the site statistics, and don't add the imported upload files to them
+  -pq, --parquet      also write the Access data to a typed Parquet file next to each upload file, needs pyarrow
+  -bf START END, --backfill START END
+                      convert the input files dated START to END (YYYYMMDD) in the -src folder again, in parallel, into the -o folder, without moving them, resuming an unfinished backfill
+  -src DIR, --source DIR
+                      folder of the input files for -bf (default For Script/Processed Files)
+  -o DIR, --output DIR
+                      folder for the upload and warnings files of -bf (default Backfill)
   
 Version History:
 
+2026-10-17 Reporting_Results are checked against statistics of the past results of their site and analysis, in Automate/siteStatistics.db, once there are enough of them, rather than against fixed limits. The statistics are fed by the upload files moved to For Upload/Uploaded Archive once imported. Added -ss, which adds the results of past upload files to the statistics, and -nss.
+2026-10-17 The rows made by serializing tests on the same row are SerialRows, holding only the test and its entry, and sharing the other fields of the input row instead of copying them.
+2026-10-17 Replicates are averaged a column at a time, and a sample with no replicate values is left out instead of stopping the program. Added -rs, which writes the replicate statistics of the averaged results.
+2026-10-17 The Activity_IDs of each upload file are checked against an index of those of past upload files, in Automate/activityIndex.db, and warned of if found in one that was imported, that is moved to For Upload/Uploaded Archive, or in another one of the same run; -nai turns this off.
+2026-10-17 Added -p, which reads the next input files ahead and writes the upload files and moves the input files in the background, overlapping them with the conversions.
+2026-10-17 Added the Converter class, which compiles the site data and tables once and converts files in memory, for use from other Python programs. The script converts its input files with one too, and worker processes use the tables compiled by the main process. Each conversion is given its own ConversionContext and the tables are read only, so a Converter can convert files from several threads at once, with the same results whatever the working directory.
+2026-10-17 Access data rows are AccessRow objects with a slot per heading instead of dictionaries, and are written to the upload files as tuples.
+2026-10-17 Added -bf, which converts archived input files in a date range again into a separate folder, in parallel, with a checkpoint so an unfinished backfill can be resumed.
+2026-10-17 Added -pq, which also writes the Access data of each input file to a Parquet file with typed columns, when pyarrow is installed.
+2026-10-17 Added -db, which also writes the Access data of each input file to a SQLite database in one transaction, replacing rows with the same Activity_ID.
+2026-10-17 Added -m, which writes the time and rows in and out of each stage, the rows dropped, the warnings by check and the bytes read and written, per input file, as JSON and as a Prometheus textfile.
+2026-10-17 When not in interactive mode, warnings are collected per input file, with repeats counted, and written once as a text file and a JSON Lines file.
+2026-10-17 Added watch mode (-w), which keeps running and converts input files as they arrive, reloading projectSites.txt when it changes.
+2026-10-17 A manifest of content hashes in the Automate folder lets a re-run reuse the output of input files that have not changed; -f converts them all.
+2026-10-17 The collection method, activity type and analytical method rules are compiled into one table per run, which -dr writes out for checking.
+2026-10-17 The sanity checks are a table of rules run in one pass over lookup tables compiled once per run, with a per-rule summary of warnings, and with -m of time.
+2026-10-17 Added the streaming conversion (-s), which writes rows as they are converted, for input files too large to hold in memory.
+2026-10-17 Dates are parsed by trying the format that last worked for the column first, and parsed dates are kept in a bounded cache. Added ParseManyDateTimes() for whole columns.
+2026-10-17 Added -j to convert input files in parallel worker processes. The per-file state is kept in a ConversionContext, and each input file gets its own warnings file. Input files are moved if that file had no warnings.
+2026-10-17 Added the optional columnar conversion engine (-col), which applies the Access rules once per distinct value, analysis and site of a column.
+
 2020-4-21 Changed RPD_percent test limits to 20% for all tests except E. coli and Enterococci
 2020-4-19 Added version history, support for Alpha test of Chloride, changed sample fractions to be per-lab rather than per-test. Changed to new templates for input files.
 Updated collection id's. Commented out incomplete support for Survey123 and ne_cyano_data_entry input files. Added support for importing site info from a separate file.
@@ -35,7 +84,8 @@ Removed un-hyphenated VMM sites MBD, MBU, HBD, HBU, CBU, and CBD.
 
 ## @details Fetches user input arguments, if any, and sets variables accordingly. 
 def ParseArguments():
-    global interactive, fileMove
+    global interactive, fileMove, columnar, jobs, pipeline, streaming, dumpRulesFile, forceConvert, watchSeconds, metricsDir, databaseFile, parquetExport
+    global backfillDates, backfillSource, backfillOutput, activityIndexFile, replicateStats, siteStatsFile, siteStatsHistory, timeRules
 
     if len(sys.argv) > 1:
         parser = argparse.ArgumentParser(description = __doc__)
@@ -43,6 +93,23 @@ def ParseArguments():
         parser.add_argument("-i","--interactive", action="store_true", help="queries user for instruction on warning conditions")
         parser.add_argument("-a","--auto", action="store_true", help="run without user queries on warnings (default)")
         parser.add_argument("-nfm","--noFileMove", action="store_true", help="inhibit removal of source files, for debug")
+        parser.add_argument("-col","--columnar", action="store_true", help="convert using the column-at-a-time engine")
+        parser.add_argument("-s","--stream", action="store_true", help="stream rows to the output file with flat memory use, runs without user queries on warnings")
+        parser.add_argument("-j","--jobs", type=int, default=1, metavar="N", help="convert input files in N worker processes, runs without user queries on warnings")
+        parser.add_argument("-p","--pipeline", action="store_true", help="read the next input files and write the upload files in the background while converting, runs without user queries on warnings")
+        parser.add_argument("-f","--force", action="store_true", help="convert every input file, even if unchanged since the last run")
+        parser.add_argument("-w","--watch", type=float, nargs="?", const=10.0, default=0, metavar="SECONDS", help="keep running, converting input files as they arrive, looking every SECONDS (default 10), runs without user queries on warnings")
+        parser.add_argument("-dr","--dumpRules", metavar="FILE", help="write the collection method, activity type and analytical method rules to a CSV file, and quit")
+        parser.add_argument("-m","--metrics", metavar="DIR", help="write the time, rows, warnings and bytes of each input file and stage to DIR, as JSON and as a Prometheus textfile, and time each sanity check rule")
+        parser.add_argument("-db","--database", metavar="FILE", help="also write the Access data to the SQLite database FILE, replacing rows with the same Activity_ID")
+        parser.add_argument("-nai","--noActivityIndex", action="store_true", help="don't check the Activity_IDs against those of past upload files, nor record them")
+        parser.add_argument("-rs","--replicateStats", action="store_true", help="also write the number, average, standard deviation and CV of the replicates of each averaged result to a CSV file next to the warnings files")
+        parser.add_argument("-ss","--siteStats", metavar="DIR", help="add the results of the upload files in DIR to the site statistics used by the Reporting_Result range check, and quit")
+        parser.add_argument("-nss","--noSiteStats", action="store_true", help="check Reporting_Results against the fixed limits only, without the site statistics, and don't add the imported upload files to them")
+        parser.add_argument("-pq","--parquet", action="store_true", help="also write the Access data to a typed Parquet file next to each upload file, needs pyarrow")
+        parser.add_argument("-bf","--backfill", nargs=2, metavar=("START","END"), help="convert the input files dated START to END (YYYYMMDD) in the -src folder again, in parallel, into the -o folder, without moving them, resuming an unfinished backfill")
+        parser.add_argument("-src","--source", metavar="DIR", help="folder of the input files for -bf (default For Script/Processed Files)")
+        parser.add_argument("-o","--output", metavar="DIR", help="folder for the upload and warnings files of -bf (default Backfill)")
         args = parser.parse_args()
         if args.noFileMove :
             fileMove = False
@@ -50,38 +117,141 @@ def ParseArguments():
             interactive = True
         if args.auto :
             interactive = False
+        if args.columnar :
+            columnar = True
+        if args.stream :
+            streaming = True
+            interactive = False
+        if args.jobs > 1 :
+            jobs = args.jobs
+            interactive = False
+        if args.pipeline :
+            if args.jobs > 1 or args.stream or args.backfill :
+                parser.error("-p is not used with -j, -s or -bf")
+            pipeline = True
+            interactive = False
+        if args.force :
+            forceConvert = True
+        if args.watch :
+            watchSeconds = args.watch
+            interactive = False
+        if args.dumpRules :
+            # the working directory is changed by SetPath()
+            dumpRulesFile = os.path.abspath(args.dumpRules)
+        if args.metrics :
+            metricsDir = os.path.abspath(args.metrics)
+            timeRules = True
+        if args.database :
+            databaseFile = os.path.abspath(args.database)
+        if args.noActivityIndex :
+            activityIndexFile = ""
+        if args.replicateStats :
+            replicateStats = True
+        if args.siteStats :
+            if args.noSiteStats :
+                parser.error("-ss is not used with -nss")
+            # the working directory is changed by SetPath()
+            siteStatsHistory = os.path.abspath(args.siteStats)
+        if args.noSiteStats :
+            siteStatsFile = ""
+        if args.parquet :
+            if pyarrow is None :
+                parser.error("-pq needs the pyarrow package, install it with: pip install pyarrow")
+            parquetExport = True
+        if args.backfill :
+            try :
+                backfillDates = tuple(datetime.strptime(date, "%Y%m%d").date() for date in args.backfill)
+            except ValueError :
+                parser.error("-bf needs the START and END dates as YYYYMMDD")
+            interactive = False
+            fileMove = False
+            if args.jobs <= 1 :
+                jobs = os.cpu_count() or 1
+        elif args.source or args.output :
+            parser.error("-src and -o are only used with -bf")
+        if args.source :
+            backfillSource = os.path.abspath(args.source)
+        if args.output :
+            backfillOutput = os.path.abspath(args.output)
+
+
+## @parblock @param [in] dir Name of the folder to index
+## @return Dictionary of the pathnames of the input files found, keyed by (sample date, template).@endparblock
+## Lists the folder once, and indexes the files named like input files by the date and the template
+## in their names. Files of unknown templates and the warnings files are left out.
+##
+## Uses global fileSuffixes.
+def IndexInputFiles(dir) :
+    inputIndex = {}
+    dateMatch = '2[0-9][0-9][0-9][01][0-9][0-3][0-9]' # this breaks in the year 3000!
+    with os.scandir(dir) as entries :
+        for entry in entries :
+            if not fnmatch.fnmatch(entry.name, dateMatch+"_forscript_*.csv") :
+                continue
+            fileType = entry.name[len("YYYYMMDD_forscript_"):-len(".csv")]
+            if fileType in fileSuffixes.keys() and entry.is_file() :
+                fileDate = GetDateTimeObject(runContext, entry.name[0:8], "File Name").date()
+                inputIndex[(fileDate, fileType)] = dir+os.sep+entry.name
+    return(inputIndex)
 
 
 ## @parblock @param [in] fileType String that sets the file suffix to look for.
+## @param [in] inputIndex Dictionary of the input files in the For Script folder, from IndexInputFiles(), or None to list the folder
+## @param [in] archiveIndex Dictionary of the input files already moved, from IndexInputFiles(), used for associated files only
 ## @return Returns a list of project input files found, with a dictionary of info for each file.@endparblock
-## Scans the folder of data files for filename matches, returns a sorted list to be processed.
+## Looks up the files of one template in the index of the For Script folder, returns a list sorted by date to be processed.
 ## Each item in the list is a dictionary of filename, sample date, and if applicable, another
 ## associated file.
 ## For VMM lab files, the associated file is a "_forscript_VMMtempdepth.csv" file of 
 ## the same date.
 ##    
 ## Uses global fileSuffixes.
-def GetProjectInputFileList(fileType) :
-    dir = "For Script"
-    SetPath(dir)
+def GetProjectInputFileList(fileType, inputIndex=None, archiveIndex=None) :
+    if inputIndex is None :
+        inputIndex = IndexInputFiles("For Script")
     fileList = []
-    flgFiles = []
-    dateMatch = '2[0-9][0-9][0-9][01][0-9][0-3][0-9]' # this breaks in the year 3000!
-    projectInputMatch = "_forscript_"+fileType+".csv"
-    flgFiles = fnmatch.filter(os.listdir(dir), dateMatch+projectInputMatch)
-    for file in flgFiles :
+    for fileDate, indexType in sorted(inputIndex.keys()) :
+        if indexType != fileType :
+            continue
         auxFile = ""
-        fileDate = GetDateTimeObject(file[0:8]).date()
-        filepath = dir+os.sep+file
-
         if fileSuffixes[fileType]["associated"]:
             # see if there is a corresponding Field file, if so, add to list
-            auxFile = fnmatch.filter(os.listdir(dir), YearMonthDay(fileDate)+"_forscript_"+fileSuffixes[fileType]["associated"]+".csv")
-            if len(auxFile) > 0 :
-                auxFile = dir+os.sep+auxFile[0]
-        fileList.append({"File":filepath,"Date":fileDate, "Field File":auxFile})
+            auxKey = (fileDate, fileSuffixes[fileType]["associated"])
+            if auxKey in inputIndex.keys() :
+                auxFile = inputIndex[auxKey]
+            elif archiveIndex and auxKey in archiveIndex.keys() :
+                auxFile = archiveIndex[auxKey]
+        fileList.append({"File":inputIndex[(fileDate, fileType)],"Date":fileDate, "Field File":auxFile})
     return(fileList)
 
+
+## @parblock @param [in] archiveDir Name of the folder in For Script that converted files are moved to, where
+## associated files are also looked for, or empty
+## @return List of (fileType, file info) pairs of all the input files to convert, in the order of fileTypes.@endparblock
+## Works out the whole plan of a run from one listing of the For Script folder, see IndexInputFiles().
+## The archive folder is only listed if an associated file is missing from the For Script folder.
+## Prints the templates for which no input files were found.
+##
+## Uses global fileTypes and fileSuffixes.
+def GetWorkPlan(archiveDir="") :
+    dir = "For Script"
+    inputIndex = IndexInputFiles(dir)
+    archiveIndex = None
+    if archiveDir and os.path.isdir(dir+os.sep+archiveDir) :
+        for fileDate, fileType in inputIndex.keys() :
+            associated = fileSuffixes[fileType]["associated"]
+            if associated and (fileDate, associated) not in inputIndex.keys() :
+                archiveIndex = IndexInputFiles(dir+os.sep+archiveDir)
+                break
+    workPlan = []
+    for fileType in fileTypes :
+        fileList = GetProjectInputFileList(fileType, inputIndex, archiveIndex)
+        if len(fileList) == 0 :
+            print("No input files found for file type "+fileType)
+        for processFileInfo in fileList :
+            workPlan.append((fileType, processFileInfo))
+    return(workPlan)
+
 ## @parblock @param [in] dir Name of folder to seek for input files.@endparblock
 ## If the folder is not found, it is looked for in the directory above, and if it is found there,
 ## the script working directory is set to the directory above (..) 
@@ -96,16 +266,18 @@ def SetPath(dir) :
         print("Did not find data file folder '"+dir+"' - Quitting!")
         exit(1)
 
-## @parblock @param [in] dir Name of folder to seek for site info file.@endparblock
+## @parblock @param [in] context ConversionContext the warnings are kept in
+## @param [in] dir Name of folder to seek for site info file.
+## @param [in] writeMissing Boolean true to create the site info file from the internal site lists when it is missing
+## @return Tuple of the dictionaries of the site lists per project, the site collection method exceptions and the
+## depth collection method exceptions.@endparblock
 ## This routine sets up the per-project site lists, and the dictionary of site collection method
 ## exceptions (sites that do not use basket from bridge C-BABR). 
-## If the "projectSites.txt" is not found in the Automate folder, this routine will create it.
+## If the "projectSites.txt" is not found in the Automate folder, this routine will create it,
+## unless writeMissing is false, when the internal site lists are only used.
 ## Once created, the site info file can be edited separately without needing to edit this
 ## Python script.
-##
-## Sets global projectSites and siteCollectionExceptions.
-def ReadWriteSiteData(dir) :
-    global projectSites, siteCollectionExceptions, depthCollectionExceptions
+def ReadSiteData(context, dir, writeMissing=True) :
     dirFound = os.path.exists(dir)
     siteFile = dir+os.sep+"projectSites.txt"
     if dirFound and os.path.exists(siteFile):
@@ -125,7 +297,7 @@ def ReadWriteSiteData(dir) :
             a = objectFile.readline()
         depthCollectionExceptions = json.loads(a)
         objectFile.close()
-        return()
+        return((projectSites, siteCollectionExceptions, depthCollectionExceptions))
 
     ## Dictionary giving tuples of site names legal per project, keyed by project name
     projectSites = {"VMM":("35CS","59CS","90CS","130S","165S","199S","229S","267S","269T","290S","318S","343S","387S","400S","447S","484S","521S","534S","567S","591S","609S","621S","635S","648S","662S","675S","012S","700S","715S","729S","743S","760T","763S","773S","784S", "MB-D", "MB-U", "HB-D", "HB-U", "CB-U", "CB-D", "QC","ROV1","ROV2"),
@@ -136,9 +308,12 @@ def ReadWriteSiteData(dir) :
     #
     depthCollectionExceptions = {}
 
-    if dirFound and not os.path.exists(siteFile):
+    if dirFound and not writeMissing :
+        Warning(context, "Expected site data file "+siteFile+" not found, using internal site lists.")
+
+    elif dirFound and not os.path.exists(siteFile):
         # file is missing, create it?
-        Warning("Expected site data file "+siteFile+" not found, re-create from internal data?")
+        Warning(context, "Expected site data file "+siteFile+" not found, re-create from internal data?")
         objectFile = open(siteFile, 'w')
         objectFile.write("# Water Sample Site Info\n")
         objectFile.write("#\n")
@@ -153,220 +328,922 @@ def ReadWriteSiteData(dir) :
         objectFile.close()
     
     else :
-        Warning("Unable to find "+dir+" folder, using internal site lists.")
-        
+        Warning(context, "Unable to find "+dir+" folder, using internal site lists.")
+    return((projectSites, siteCollectionExceptions, depthCollectionExceptions))
+
+
+## @parblock @param [in] dir Name of folder to seek for site info file.
+## @param [in] writeMissing Boolean true to create the site info file from the internal site lists when it is missing@endparblock
+## Reads the site info file into the globals of the same names, see ReadSiteData(), for the programs
+## that import this file for its site lists, such as GenerateSampleData.py. The conversions use the
+## site data of their ConverterConfig instead, see CompileConfig().
+##
+## Sets global projectSites, siteCollectionExceptions and depthCollectionExceptions.
+def ReadWriteSiteData(dir, writeMissing=True) :
+    global projectSites, siteCollectionExceptions, depthCollectionExceptions
+    projectSites, siteCollectionExceptions, depthCollectionExceptions = ReadSiteData(runContext, dir, writeMissing)
 
 
 ## @parblock @param [in] fileType Type of file, sets expected column headings for reading the file
 ## @param [in] labFile String pathname to the lab data file to get the data from.@endparblock
 ## Reads the lab report file containing the sample data measurements, puts the data into labData.
 ##
-## Uses global fileSuffixes, fills labData.
-def GetLabFileData ( fileType, labFile ) :
+## Uses global fileSuffixes, fills context labData.
+def GetLabFileData ( context, fileType, labFile ) :
+    for row in ReadLabRows(context, fileType, labFile) :
+        context.labData.append(row)
+
+
+## @parblock @param [in] fileName String pathname of the input file to read
+## @param [in] newline None to translate line endings, or '' to leave them for the csv module, as with open()
+## @return Text file object for reading the file.@endparblock
+## Opens an input file for reading. When the pipeline has already read the file ahead, see
+## ReadInputFiles(), its contents are read from memory instead, decoded as open() would. The
+## contents are only used once, after that the file is read from the folder again.
+##
+## Uses global prefetchedFiles and readBufferSize.
+def OpenInputFile ( fileName, newline=None ) :
+    contents = prefetchedFiles.pop(fileName, None)
+    if contents is None :
+        return(open(fileName, 'r', newline=newline, buffering=readBufferSize))
+    return(io.TextIOWrapper(io.BytesIO(contents), newline=newline))
+
+
+## @parblock @param [in] fileType Type of file, sets expected column headings for reading the file
+## @param [in] labFile String pathname to the lab data file to get the data from.
+## @return Generator of dictionaries, one per row of lab data.@endparblock
+## Reads the lab report file one row at a time. The header row and rows with an empty Site ID are skipped.
+## Only the columns of the template's projection are kept, see ReadLabFields().
+##
+## Uses global labProjections.
+def ReadLabRows ( context, fileType, labFile ) :
+    keys = labProjections[fileType]["Keys"]
+    for fields in ReadLabFields(context, fileType, labFile) :
+        yield(dict(zip(keys, fields)))
+
+
+## @parblock @param [in] fileType Type of file, sets expected column headings for reading the file
+## @param [in] labFile String pathname to the lab data file to get the data from.
+## @return Generator of tuples of the projected fields, one per row of lab data, in the order of the projection's keys.@endparblock
+## Reads the lab report file with the template's projection from CompileLabProjections(), in large
+## blocks. Rows with an empty Site ID are counted and skipped before anything is made from them, and
+## only the fields of the columns the conversion uses are taken from the others. Blank lines and the
+## header row are skipped. A short row gets None for its missing fields, as with csv.DictReader.
+##
+## Uses global labProjections.
+def ReadLabFields ( context, fileType, labFile ) :
     
     # By specifying the header names rather than reading them from the file, we avoid bad
     # characters which might occur at the beginning of the file. We also avoid duplicate "Name" columns
-    labKeys = fileSuffixes[fileType]["columns"]
+    projection = labProjections[fileType]
+    getFields = projection["Getter"]
+    siteIndex = projection["Site Index"]
+    width = projection["Width"]
         
-    with open(labFile, 'r') as csvfile:
-        labfilereader = csv.DictReader(csvfile, fieldnames = labKeys, dialect='excel')
-        labHeader = {}
+    with OpenInputFile(labFile) as csvfile:
+        labfilereader = csv.reader(csvfile, dialect='excel')
+        headerFound = False
         for row in labfilereader:
-            if len(labHeader) == 0:
-                labHeader = row # header row not currently used
-            else :
-                if not row["Site ID"]:
-                    # omit empty data rows
-                    continue
-                labData.append(row)
+            if not row :
+                continue
+            if not headerFound :
+                headerFound = True # header row not currently used
+                continue
+            if siteIndex >= len(row) or not row[siteIndex] :
+                # omit empty data rows
+                context.droppedRows["Empty Site ID"] = context.droppedRows["Empty Site ID"] + 1
+                continue
+            if len(row) < width :
+                row = row + [None] * (width - len(row))
+            yield(getFields(row))
     csvfile.close()
 
 
+## @return Dictionary of the projection of each template, keyed by file type.
+## Compiles the columns of each template in fileSuffixes into the fields that are read from it: the
+## columns in usedLabColumns, the template's tests, and the replicates it averages. Placeholder
+## columns like "x" and lab columns that are never used are left out. Each projection has the
+## column names ("Keys"), an operator.itemgetter of their indexes in a row ("Getter"), the index of
+## the Site ID, and the width a row needs for all the indexes.
+##
+## Uses global fileSuffixes and usedLabColumns.
+def CompileLabProjections():
+    projections = {}
+    for fileType, settings in fileSuffixes.items() :
+        # a repeated heading keeps the last column of that name, as csv.DictReader does
+        keyIndex = {}
+        for index, key in enumerate(settings["columns"]) :
+            keyIndex[key] = index
+        prefixes = tuple(settings["averageInRow"].values()) if "averageInRow" in settings.keys() else ()
+        keys = tuple(key for key in keyIndex.keys() if key in usedLabColumns or key in settings["testsPerRow"] or key.startswith(prefixes))
+        indexes = [keyIndex[key] for key in keys]
+        replicates = {}
+        for parameter, prefix in (settings["averageInRow"].items() if "averageInRow" in settings.keys() else ()) :
+            replicates[parameter] = tuple(key for key in keys if key.startswith(prefix))
+        projections[fileType] = {"Keys":keys, "Getter":operator.itemgetter(*indexes), "Site Index":keyIndex["Site ID"],
+                                 "Width":max(indexes) + 1, "Replicates":replicates}
+    return(projections)
+
+
 ## @parblock @param [in] avgParameters Dictionary of result, component pairs. @endparblock
 ## This routine averages multiple cells in the data row into a single value reported as calculated.
 ## For each result, a key is added to the lab data by the result name, which consists of the average of 
 ## each item in the row that has the component string in the beginning of the key name.
 ##
-## Modifies global labData.
-def AverageRowData(avgParameters):
-    global labData
-    for row in labData:
-        for parameter in avgParameters.keys():
-            keyMatch = avgParameters[parameter]
-            total = 0.0
-            count = 0
-            for key in row.keys():
-                if str(key).startswith(keyMatch) and IsNumber(row[key]):
-                    total = total + float(row[key])
-                    count = count + 1
-            row[parameter] = '{:4.2f}'.format(total/float(count), 0)               
-    
-    
-    
+## Modifies context labData.
+def AverageRowData(context, avgParameters):
+    AverageLabRows(context, context.labData, avgParameters)
+
+
+## @parblock @param [in] rows List of lab data row dictionaries
+## @param [in] avgParameters Dictionary of result, component pairs. @endparblock
+## Averages the replicate cells of a list of lab data rows, as described for AverageRowData(), a
+## replicate column at a time, see AverageReplicates(). The replicate columns of each result are
+## those found by CompileLabProjections() for the template. A row with no replicate values for a
+## result gets an empty result, which SerializeData() leaves out.
+## With -rs, the replicate statistics of each row are kept for WriteReplicateStats().
+##
+## Uses global labProjections and replicateStats, and context fileType.
+def AverageLabRows(context, rows, avgParameters):
+    replicateKeys = labProjections[context.fileType]["Replicates"]
+    parameterStats = []
+    for parameter in avgParameters.keys():
+        replicates = [[row[key] for row in rows] for key in replicateKeys[parameter]]
+        counts, averages, deviations, variations = AverageReplicates(replicates, replicateStats)
+        for row, average in zip(rows, averages) :
+            row[parameter] = average
+        parameterStats.append(zip([parameter] * len(rows), counts, averages, deviations, variations))
+    if replicateStats :
+        for row, *rowStats in zip(rows, *parameterStats) :
+            for stats in rowStats :
+                context.replicateRows.append((row["Site ID"], row["Date/Time"], row.get("FDUP?", "")) + stats)
+
+
+## @parblock @param [in] replicates List of the value lists of one result's replicate columns, one list per column
+## @param [in] spread Boolean true to also find the standard deviations
+## @return Tuple of lists, one item per row: the number of replicates that are numbers, their average
+## formatted for the lab data, empty when there are none, and their sample standard deviation and
+## coefficient of variation in percent, None when there are fewer than two or spread is false.@endparblock
+## Averages the replicate columns of a result for many rows at once. Each value is parsed once, and
+## blank or invalid values are left out. When NumPy is available, the sums, counts and standard
+## deviations are array operations over a replicates by rows matrix. The replicates are added in
+## column order, so the averages are the same with or without NumPy.
+def AverageReplicates(replicates, spread=False):
+    values = []
+    found = []
+    for column in replicates :
+        columnValues = []
+        columnFound = []
+        for value in column :
+            try :
+                columnValues.append(float(value))
+                columnFound.append(True)
+            except (TypeError, ValueError) :
+                columnValues.append(0.0)
+                columnFound.append(False)
+        values.append(columnValues)
+        found.append(columnFound)
+
+    if numpy is not None and len(values) :
+        valueMatrix = numpy.asarray(values, dtype=float)
+        foundMatrix = numpy.asarray(found, dtype=bool)
+        counts = foundMatrix.sum(axis=0)
+        # adding 0.0 last gives the sum of 0.0 and the replicates, as the row loop does
+        means = (valueMatrix.sum(axis=0) + 0.0) / numpy.maximum(counts, 1)
+        deviations = [None] * len(counts)
+        if spread :
+            squares = numpy.where(foundMatrix, valueMatrix - means, 0.0) ** 2
+            deviations = numpy.sqrt(squares.sum(axis=0) / numpy.maximum(counts - 1, 1)).tolist()
+        counts = counts.tolist()
+        means = means.tolist()
+    else :
+        counts = [sum(rowFound) for rowFound in zip(*found)]
+        means = [sum(rowValues) / max(count, 1) for rowValues, count in zip(zip(*values), counts)]
+        deviations = [None] * len(counts)
+        if spread :
+            deviations = [(sum((value - mean) ** 2 for value, isFound in zip(rowValues, rowFound) if isFound) / max(count - 1, 1)) ** 0.5
+                          for rowValues, rowFound, mean, count in zip(zip(*values), zip(*found), means, counts)]
+
+    averages = ['{:4.2f}'.format(mean) if count else "" for mean, count in zip(means, counts)]
+    deviations = [deviation if count > 1 else None for deviation, count in zip(deviations, counts)]
+    variations = [100.0 * deviation / mean if deviation is not None and mean else None for deviation, mean in zip(deviations, means)]
+    return(counts, averages, deviations, variations)
+
+
+## @details One measurement of a lab data row with several tests per row, made by SerializeRows(). It
+## holds only the test name and its entry, read as "Parameter" and "Formatted Entry", and reads every
+## other field from the lab data row it came from, which all of that row's measurements share rather
+## than each getting a copy. Writing a field first gives the measurement its own copy of the row, so
+## the row's other measurements don't see the change. keys() are those of the lab data row, for
+## checking which columns the template has.
+class SerialRow :
+    __slots__ = ("labRow", "parameter", "entry")
+
+    ## @parblock @param [in] labRow Dictionary of the lab data row the measurement is from
+    ## @param [in] parameter String name of the test
+    ## @param [in] entry String result of the test@endparblock
+    def __init__(self, labRow, parameter, entry) :
+        self.labRow = labRow
+        self.parameter = parameter
+        self.entry = entry
+
+    def __getitem__(self, key) :
+        if key == "Parameter" :
+            return(self.parameter)
+        if key == "Formatted Entry" :
+            return(self.entry)
+        return(self.labRow[key])
+
+    def __setitem__(self, key, value) :
+        if key == "Parameter" :
+            self.parameter = value
+        elif key == "Formatted Entry" :
+            self.entry = value
+        else :
+            self.labRow = dict(self.labRow)
+            self.labRow[key] = value
+
+    def keys(self) :
+        return(self.labRow.keys())
+
+
 ## @parblock @param [in] testsPerRow List of string test names that appear on the same row of lab data. @endparblock
 ## Creates a new row of data per measurement, so that the labData has one measure per row.
 ##
-## Rewrites the global labData.
-def SerializeData(testsPerRow) :
-    global labData
+## Rewrites the context labData.
+def SerializeData(context, testsPerRow) :
     if testsPerRow :
-        passAlongKeys = labData[0].keys() - testsPerRow
-        serialLabData = []
-        
-        for row in labData :
-            skipTempDepth = False
-            if "analysis_rep" in row.keys() and IsNumber(row["analysis_rep"]) and int(row["analysis_rep"]) > 1 :
-                skipTempDepth = True
-            for test in testsPerRow :
-                if skipTempDepth and test not in fileSuffixes[fileType]["testsToAverage"]:
-                    continue
-                else :
-                    if row[test] : # only fill rows with contents
-                        serialRow = {}
-                        for key in passAlongKeys :
-                            serialRow[key] = row[key]
-                        serialRow["Parameter"] = test
-                        serialRow["Formatted Entry"] = row[test]
-                        serialLabData.append(serialRow)
-                
-        labData = serialLabData
+        context.labData = list(SerializeRows(context, context.labData, testsPerRow))
+
+
+## @parblock @param [in] labRows Iterable of lab data row dictionaries
+## @param [in] testsPerRow List of string test names that appear on the same row of lab data.
+## @return Generator of lab data rows with one measure per row.@endparblock
+## Generator version of SerializeData(), which yields the new rows as each input row is read.
+## The new rows are SerialRows, which share the fields of the input row.
+##
+## Uses context fileType.
+def SerializeRows(context, labRows, testsPerRow) :
+    for row in labRows :
+        skipTempDepth = False
+        if "analysis_rep" in row.keys() and IsNumber(row["analysis_rep"]) and int(row["analysis_rep"]) > 1 :
+            skipTempDepth = True
+        for test in testsPerRow :
+            if skipTempDepth and test not in fileSuffixes[context.fileType]["testsToAverage"]:
+                continue
+            else :
+                if row[test] : # only fill rows with contents
+                    yield(SerialRow(row, test, row[test]))
     
     
 ## @details Based on the data from the lab report file, fill in the fields for access database data. 
 ##    
 ## There is a row in the Access file for each row in the lab data file, unless there is no measurement. 
 ## For each field in each row in the access data, rules are implemented to fill the field from 
-## the input data. 
+## the input data, see FillAccessRow().
 ## Dupe info and VMM field comments are filled in elsewhere.
 ##    
-## Uses global projectCode, labData, siteCollectionExceptions, and depthCollectionExceptions, fills accessData, rovAddresses, siteRows, siteTestRows, dupeSiteRows.
-def FillAccessData():
+## Uses context labData, fills context accessData, dupeSiteRows.
+def FillAccessData(context):
+    rowCount = 0
+    ltGtFound = False
+    for labRow in context.labData:
+        accessDataRow, activityID, dupeSite = FillAccessRow(context, labRow)
+        if accessDataRow is None :
+            continue
+        if dupeSite :
+            # save the dupe row index for later
+            context.dupeSiteRows[rowCount] = dupeSite
+        if IsCensoredRow(accessDataRow) :
+            ltGtFound = True
+        context.accessData.append(accessDataRow)
+        rowCount = rowCount + 1
+    return(ltGtFound)
+
+
+## @parblock @param [in] labRow Dictionary of one row of lab data, with one measure
+## @return Tuple of the Access data row (None if there is no valid result), the Activity_ID (None if the
+## row makes no Access data row), and the dupe site name for FDUP rows (None otherwise).@endparblock
+## Fills in the fields of one Access data row from one row of lab data.
+## Sample Address rows are saved to rovAddresses, and depth and temperature rows of FDUP samples are
+## skipped, neither makes an Access data row.
+##    
+## Uses global siteCollectionExceptions and depthCollectionExceptions, and context projectCode, lab and fileType,
+## fills context rovAddresses and siteRows.
+def FillAccessRow(context, labRow):
 
     # Here are the Access file output headings:
     #accessHeadings = ["Activity_ID","Lab_ID","Date_Collected","Time_Collected","Site_ID","Project_ID","Component_ID","Actual_Result","Actual_Result_Unit_ID","Activity_Type_ID","Actual_Result_Type_ID","Result_Sample_Fraction","Reporting_Result","Reporting_Result_Unit_ID","Reporting_Result_Type_ID","Collection_ID","Analytical_Method_ID","Associated_ID","Data_Type_ID","Media_Type_ID","Media_Subdivision_ID","Relative_Depth_ID","Result_Comment","Field_Comment","Event_Comment","QAQC_Comment","Percent_RPD","QAQC_Status"]
 
     # There is a row in the Access file for each row in the lab data file. Each of the columns
-    # in the Access file is implemented as a dictionary key. For each key there is a rule for
+    # in the Access file is a field of an AccessRow, set by its heading. For each field there is a rule for
     # translating the input data to the output file.
-    rowCount = 0
-    ltGtFound = False
-    for labRow in labData:
-        site = GetSiteId(labRow)
+    site = ApplyFdupColumn(context, labRow)
+
+    if site != "FDUP" and site not in context.config.projectSites[context.projectCode] :
+        response = WarningWithReplace(context, "Found unknown site identifier: "+site+" not in project "+context.projectCode)
+        if response:
+            site = response
+            labRow["Site ID"] = site
+    # cover the condition of the Sample Address, with no measure data
+    if labRow["Parameter"] == "Sample Address" :
+        # save the Sample Address to put into the Field Comment, in the row with the data
+        context.rovAddresses[(site, AccessFormatDate(GetSampleDateTime(context, labRow)))] = labRow["Formatted Entry"]
+        return(None, None, None)
         
-        # This block allows specifying FDUP as FDUP or yes in the FDUP column
-        if "FDUP?" in labRow.keys() and labRow["FDUP?"] and site != "FDUP" :
-            fdup = labRow["FDUP?"].lower()
-            if site in projectSites[projectCode] and (fdup == "fdup" or fdup.find("y") > -1) :
-                #labData[rowCount]["FDUP?"] = site
-                #labData[rowCount]["Site ID"] = "FDUP"
-                labRow["FDUP?"] = site
-                labRow["Site ID"] = "FDUP"
-                site = "FDUP"
+    # don't make duplicates of depth or temp measures:
+    if site == "FDUP" and (labRow["Parameter"] == "Depth (ft)" or labRow["Parameter"] == "Temperature (C)") :
+        context.droppedRows["FDUP depth/temperature"] = context.droppedRows["FDUP depth/temperature"] + 1
+        return(None, None, None)
+        
+    # otherwise, fill each column in accessHeadings:
+    accessDataRow = AccessRow()
+    activityID = GetActivityId(context, context.projectCode, labRow)
+    accessDataRow.Activity_ID = activityID
+    if labAttributes[context.lab]["labID"] and not (labRow["Parameter"] == "Depth (ft)" or labRow["Parameter"] == "Temperature (C)"):
+        accessDataRow.Lab_ID = labRow["Sample ID"]
+    else :
+        accessDataRow.Lab_ID = "None"
+    sampleDateTime = GetSampleDateTime(context, labRow)
+    accessDataRow.Date_Collected = AccessFormatDate(sampleDateTime)
+    accessDataRow.Time_Collected = AccessFormatTime(sampleDateTime)
+    accessDataRow.Site_ID = site
+    context.siteRows.append(site) # save which sites processed, for later
+    dupeSite = None
+    if site == "FDUP" :
+        if labRow["FDUP?"] in context.config.projectSites[context.projectCode]:
+            dupeSite = labRow["FDUP?"]
+        else:
+            dupeSite = "FDUP"
+            response = WarningWithReplace(context, "Dupe site "+labRow["FDUP?"]+" is invalid for project "+context.projectCode)
+            if response :
+                dupeSite = response
+
+    accessDataRow.Project_ID = projectCodes[context.projectCode]
+    parameter = labRow["Parameter"] # an unknown parameter was replaced by GetActivityId()
+    
+    # data and < > rules:
+    result = labRow["Formatted Entry"]
+    resultFields = GetResultFields(result, parameter in fileSuffixes[context.fileType].get("averageInRow", {}))
+    if resultFields is None :
+        Warning(context, accessDataRow.Activity_ID + " has invalid Formatted Entry result :"+result)
+        context.droppedRows["Invalid Formatted Entry"] = context.droppedRows["Invalid Formatted Entry"] + 1
+        return(None, activityID, dupeSite)
+    accessDataRow.Actual_Result = result
+    accessDataRow.Reporting_Result, accessDataRow.Actual_Result_Type_ID, accessDataRow.Reporting_Result_Type_ID, comment = resultFields
+    if comment is None :
+        comment = GetTestComment(labRow["Test Comment"]) if context.fileType == "MWRA" else ""
+    accessDataRow.Result_Comment = comment
+
+    (accessDataRow.Component_ID, unitID, accessDataRow.Activity_Type_ID, accessDataRow.Result_Sample_Fraction,
+     accessDataRow.Collection_ID, accessDataRow.Analytical_Method_ID, accessDataRow.Data_Type_ID) = GetAnalysisSiteFields(context, parameter, site)
+    if "Display String" in labRow.keys():
+        unitID = unitCodes[labRow["Display String"]]
+    accessDataRow.Actual_Result_Unit_ID = unitID
+    accessDataRow.Reporting_Result_Unit_ID = unitID
+    accessDataRow.Associated_ID = "" # dupe info to be filled in later
+    accessDataRow.Media_Type_ID = mediaTypes["Water"]
+    accessDataRow.Media_Subdivision_ID = mediaSubtypes["Surface Water"]
+    accessDataRow.Relative_Depth_ID = relativeDepthTypes["Surface"]
+    accessDataRow.Field_Comment = ""
+    if "Field Comments" in labRow.keys() and len(labRow["Field Comments"]) > 0 :
+        accessDataRow.Field_Comment = labRow["Field Comments"]
+    accessDataRow.Event_Comment = ""
+    accessDataRow.QAQC_Comment = "" # dupe info to be filled in later
+    accessDataRow.Percent_RPD = "" # dupe info to be filled in later
+    accessDataRow.QAQC_Status = "Preliminary"
+    return(accessDataRow, activityID, dupeSite)
+
+
+## @parblock @param [in] result String Formatted Entry of a lab data row
+## @param [in] averaged Boolean true if the result is the average of the replicates of a Cyano test
+## @return Tuple of the Reporting_Result, Actual_Result_Type_ID, Reporting_Result_Type_ID and Result_Comment, the
+## comment None to keep the lab's, or None if the result is not valid.@endparblock
+## The data and < > rules. The < or > is removed from censored values, and values below the detection
+## limit are halved. Both engines fill the result fields with this.
+def GetResultFields(result, averaged):
+    if averaged :
+        return((result, resultTypes["Calculated"], resultTypes["Calculated"], 'Average of Replicates'))
+    if result.find("<") > -1 and IsNumber(result.strip("<")) :
+        return((float(result.strip("<"))/2, resultTypes["Actual"], resultTypes["Calculated"], 'Changed censored value, removed "<" symbol, halved value'))
+    if result.find(">") > -1 and IsNumber(result.strip(">")) :
+        return((float(result.strip(">")), resultTypes["Actual"], resultTypes["Calculated"], 'Changed censored value, removed ">" symbol'))
+    if IsNumber(result) :
+        return((result, resultTypes["Actual"], resultTypes["Actual"], None))
+    return(None)
+
+
+## @parblock @param [in] testComment String Test Comment of an MWRA lab data row
+## @return String Result_Comment, empty if the lab left no comment.@endparblock
+def GetTestComment(testComment):
+    if len(testComment) > 1 and testComment != "nil" :
+        return(testComment)
+    return("")
+
+
+## @parblock @param [in] parameter String name of the analysis, one of analysisCodes
+## @param [in] site String site identifier
+## @return Tuple of the Component_ID, default Unit_ID, Activity_Type_ID, Result_Sample_Fraction, Collection_ID,
+## Analytical_Method_ID and Data_Type_ID.@endparblock
+## The fields of an Access data row that only depend on its analysis and site, from the method rule,
+## see GetMethodRule(). Both engines fill these fields with this, the columnar engine once per
+## analysis and site of the file.
+def GetAnalysisSiteFields(context, parameter, site):
+    rule = GetMethodRule(context, parameter, site)
+    return((analysisCodes[parameter]["code"], rule["Unit_ID"], rule["Activity_Type_ID"], rule["Result_Sample_Fraction"],
+            rule["Collection_ID"], rule["Analytical_Method_ID"], rule["Data_Type_ID"]))
+
+
+## @parblock @param [in] labRow Dictionary of one row of lab data
+## @return String site identifier, FDUP for dupe samples.@endparblock
+## Gets the site of the row. This allows specifying FDUP as FDUP or yes in the FDUP? column: in that
+## case the site is moved to the FDUP? column and the Site ID becomes FDUP.
+##
+## Uses context projectCode.
+def ApplyFdupColumn(context, labRow):
+    site = GetSiteId(context, labRow)
+    if "FDUP?" in labRow.keys() and labRow["FDUP?"] and site != "FDUP" :
+        fdup = labRow["FDUP?"].lower()
+        if site in context.config.projectSites[context.projectCode] and (fdup == "fdup" or fdup.find("y") > -1) :
+            labRow["FDUP?"] = site
+            labRow["Site ID"] = "FDUP"
+            site = "FDUP"
+    return(site)
+
+
+## @parblock @param [in] accessDataRow AccessRow of one row of Access data
+## @return True if the result had a < or > symbol removed.@endparblock
+## Censored values are the only results reported as calculated from an actual result.
+def IsCensoredRow(accessDataRow):
+    return(accessDataRow.Actual_Result_Type_ID == resultTypes["Actual"] and accessDataRow.Reporting_Result_Type_ID == resultTypes["Calculated"])
+
+
+# Routines for the columnar conversion engine, used with -col
+
+## @parblock @param [in] fileType Type of file, sets expected column headings for reading the file
+## @param [in] labFile String pathname to the lab data file to get the data from.
+## @return Dictionary of column lists keyed by column heading.@endparblock
+## Columnar version of GetLabFileData(). Reads the lab report file into one list per column rather
+## than one dictionary per row, with the same projection and skipped rows, see ReadLabFields().
+##
+## Uses global labProjections.
+def GetLabFileColumns(context, fileType, labFile) :
+    keys = labProjections[fileType]["Keys"]
+    rows = list(ReadLabFields(context, fileType, labFile))
+    labColumns = {}
+    for position, key in enumerate(keys) :
+        labColumns[key] = [row[position] for row in rows]
+    return(labColumns)
+
+
+## @parblock @param [in] labColumns Dictionary of column lists, from GetLabFileColumns()
+## @param [in] avgParameters Dictionary of result, component pairs. @endparblock
+## Columnar version of AverageRowData(), with the replicate columns taken as they are.
+##
+## Uses global labProjections and replicateStats, and context fileType.
+def AverageColumnData(context, labColumns, avgParameters):
+    replicateKeys = labProjections[context.fileType]["Replicates"]
+    rowCount = len(labColumns["Site ID"])
+    parameterStats = []
+    for parameter in avgParameters.keys():
+        counts, averages, deviations, variations = AverageReplicates([labColumns[key] for key in replicateKeys[parameter]], replicateStats)
+        labColumns[parameter] = averages
+        parameterStats.append(zip([parameter] * rowCount, counts, averages, deviations, variations))
+    if replicateStats :
+        for site, sampleTime, fdup, *rowStats in zip(labColumns["Site ID"], labColumns["Date/Time"], labColumns.get("FDUP?", [""] * rowCount), *parameterStats) :
+            for stats in rowStats :
+                context.replicateRows.append((site, sampleTime, fdup) + stats)
+
 
-        if site != "FDUP" and site not in projectSites[projectCode] :
-            response = WarningWithReplace("Found unknown site identifier: "+site+" not in project "+projectCode)
+## @parblock @param [in] labColumns Dictionary of column lists, from GetLabFileColumns()
+## @param [in] testsPerRow List of string test names that appear on the same row of lab data.
+## @return Dictionary of column lists with one measurement per row.@endparblock
+## Columnar version of SerializeData(). The rows to keep are worked out as a list of
+## (row, test) pairs, then each pass-along column is gathered once for the whole file.
+##
+## Uses context fileType.
+def SerializeColumns(context, labColumns, testsPerRow) :
+    if not testsPerRow :
+        return(labColumns)
+    passAlongKeys = labColumns.keys() - testsPerRow
+    rowCount = len(labColumns["Site ID"])
+    reps = labColumns["analysis_rep"] if "analysis_rep" in labColumns.keys() else [None] * rowCount
+    rowIndex = []
+    parameters = []
+    entries = []
+    for index in range(rowCount) :
+        skipTempDepth = IsNumber(reps[index]) and int(reps[index]) > 1
+        for test in testsPerRow :
+            if skipTempDepth and test not in fileSuffixes[context.fileType]["testsToAverage"]:
+                continue
+            entry = labColumns[test][index]
+            if entry : # only fill rows with contents
+                rowIndex.append(index)
+                parameters.append(test)
+                entries.append(entry)
+
+    serialColumns = {}
+    for key in passAlongKeys :
+        column = labColumns[key]
+        serialColumns[key] = [column[index] for index in rowIndex]
+    serialColumns["Parameter"] = parameters
+    serialColumns["Formatted Entry"] = entries
+    return(serialColumns)
+
+
+## @parblock @param [in] labColumns Dictionary of column lists, from SerializeColumns()
+## @return Boolean true if < or > was found in any of the "Actual_Result" fields.@endparblock
+## Columnar version of FillAccessData(). The same rules are applied, see FillAccessRow(), but per
+## column rather than per row. Only the site names, the Activity_IDs and the dupe sites, which can
+## ask the user, are worked out row by row. Everything else is worked out once per distinct value
+## and shared by the rows that have it:
+##    - the date fields, once per Date/Time, see ParseManyDateTimes()
+##    - the analysis, once per Parameter
+##    - the result fields, once per Formatted Entry, see GetResultFields()
+##    - the method rule fields, once per analysis and site, see GetAnalysisSiteFields()
+##    - the units, once per Display String, and the comments, once per Test Comment
+##
+## The finished fields are turned into accessData rows at the end, so the rest of the program is unchanged.
+##
+## Uses global siteCollectionExceptions and depthCollectionExceptions, and context projectCode, lab and fileType, fills context accessData, rovAddresses, siteRows, dupeSiteRows.
+def FillAccessDataColumns(context, labColumns):
+    rowTotal = len(labColumns["Site ID"])
+    siteIds = labColumns["Site ID"]
+    parameters = labColumns["Parameter"]
+    entries = labColumns["Formatted Entry"]
+    fdups = labColumns["FDUP?"] if "FDUP?" in labColumns.keys() else None
+    legalSites = context.config.projectSites[context.projectCode]
+
+    # site names, including the FDUP? column conventions and user replacement of unknown sites
+    sites = [site[-4:] for site in siteIds] if context.lab == "MWRA" else list(siteIds)
+    for index in range(rowTotal) :
+        site = sites[index]
+        if fdups is not None and fdups[index] and site != "FDUP" :
+            fdup = fdups[index].lower()
+            if site in legalSites and (fdup == "fdup" or fdup.find("y") > -1) :
+                fdups[index] = site
+                siteIds[index] = "FDUP"
+                site = "FDUP"
+                sites[index] = site
+        if site != "FDUP" and site not in legalSites :
+            response = WarningWithReplace(context, "Found unknown site identifier: "+site+" not in project "+context.projectCode)
             if response:
-                site = response
-                labRow["Site ID"] = site
-        # cover the condition of the Sample Address, with no measure data
-        if labRow["Parameter"] == "Sample Address" :
-            # save the Sample Address to put into the Field Comment, in the row with the data
-            sampleDateTime = GetSampleDateTime(labRow)
-            siteDateKey = site+YearMonthDay(sampleDateTime)
-            rovAddresses[siteDateKey] = labRow["Formatted Entry"]
-            continue
-            
-        # don't make duplicates of depth or temp measures:
-        if site == "FDUP" and (labRow["Parameter"] == "Depth (ft)" or labRow["Parameter"] == "Temperature (C)") :
+                sites[index] = response
+                siteIds[index] = response
+    idSites = [site[-4:] for site in siteIds] if context.lab == "MWRA" else siteIds
+
+    # sample dates, each distinct date string is parsed once
+    if "Sampled Time" in labColumns.keys() :
+        dateStrings = [date+" "+time for date, time in zip(labColumns["Date/Time"], labColumns["Sampled Time"])]
+    else :
+        dateStrings = labColumns["Date/Time"]
+    dateFields = {}
+    for dateString, sampleDateTime in zip(dateStrings, ParseManyDateTimes(context, dateStrings, "Date/Time")) :
+        if dateString not in dateFields.keys() :
+            dateFields[dateString] = (YearMonthDay(sampleDateTime), AccessFormatDate(sampleDateTime), AccessFormatTime(sampleDateTime))
+
+    # sample addresses and FDUP depth and temperature rows do not make output rows
+    used = []
+    for index in range(rowTotal) :
+        parameter = parameters[index]
+        if parameter == "Sample Address" :
+            context.rovAddresses[(sites[index], dateFields[dateStrings[index]][1])] = entries[index]
+        elif sites[index] == "FDUP" and (parameter == "Depth (ft)" or parameter == "Temperature (C)") :
+            context.droppedRows["FDUP depth/temperature"] = context.droppedRows["FDUP depth/temperature"] + 1
             continue
-            
-        # otherwise, fill each column in accessHeadings:
-        accessDataRow = {}
-        activityID = GetActivityId(projectCode, labRow)
-        accessDataRow["Activity_ID"] = activityID
-        if labAttributes[lab]["labID"] and not (labRow["Parameter"] == "Depth (ft)" or labRow["Parameter"] == "Temperature (C)"):
-            accessDataRow["Lab_ID"] = labRow["Sample ID"]
         else :
-            accessDataRow["Lab_ID"] = "None"
-        sampleDateTime = GetSampleDateTime(labRow)
-        accessDataRow["Date_Collected"] = AccessFormatDate(sampleDateTime)
-        accessDataRow["Time_Collected"] = AccessFormatTime(sampleDateTime)
-        accessDataRow["Site_ID"] = site
-        siteRows.append(site) # save which sites processed, for later
+            used.append(index)
+
+    # analysis info, each distinct parameter is checked once
+    resolved = {}
+    for index in used :
+        parameter = parameters[index]
+        if parameter not in resolved.keys() :
+            resolved[parameter] = parameter
+            if parameter not in analysisCodes.keys():
+                resolved[parameter] = WarningWithReplace(context, "Found unknown parameter: '"+str(parameter)+"' Legal values are " +", ".join(analysisCodes.keys()))
+        parameters[index] = resolved[parameter]
+
+    reps = labColumns["analysis_rep"] if "analysis_rep" in labColumns.keys() else None
+    abbreviations = {parameter:analysisCodes[parameter]["abbrev"] for parameter in resolved.values()}
+    activityIds = []
+    for index in used :
+        if reps is not None and IsNumber(reps[index]) :
+            count = "0"+reps[index]
+        elif idSites[index] == "FDUP" :
+            count = "02"
+        else :
+            count = "01"
+        activityIds.append(context.projectCode + dateFields[dateStrings[index]][0] + idSites[index] + abbreviations[parameters[index]] + count)
+
+    # the result fields, the same for each Formatted Entry of an analysis that is or isn't averaged
+    averaged = fileSuffixes[context.fileType].get("averageInRow", {})
+    resultFields = {}
+    results = []
+    for index in used :
+        key = (entries[index], parameters[index] in averaged)
+        if key not in resultFields.keys() :
+            resultFields[key] = GetResultFields(*key)
+        results.append(resultFields[key])
+
+    # the method rule fields, the same for each analysis and site
+    siteFields = {}
+    for index in used :
+        key = (parameters[index], sites[index])
+        if key not in siteFields.keys() :
+            siteFields[key] = GetAnalysisSiteFields(context, *key)
+    if "Display String" in labColumns.keys() :
+        unitIds = {display:unitCodes[display] for display in set(labColumns["Display String"][index] for index in used)}
+    if context.fileType == "MWRA" :
+        testComments = {comment:GetTestComment(comment) for comment in set(labColumns["Test Comment"][index] for index in used)}
+
+    ltGtFound = False
+    rowCount = 0
+    for position, index in enumerate(used) :
+        site = sites[index]
+        parameter = parameters[index]
+        activityID = activityIds[position]
+        context.siteRows.append(site) # save which sites processed, for later
+        dupeSite = ""
         if site == "FDUP" :
-            # save the dupe row index for later
-            if labRow["FDUP?"] in projectSites[projectCode]:
-                dupeSiteRows[rowCount] = labRow["FDUP?"]
+            if fdups[index] in legalSites:
+                dupeSite = fdups[index]
             else:
-                dupeSiteRows[rowCount] = "FDUP"
-                response = WarningWithReplace("Dupe site "+labRow["FDUP?"]+" is invalid for project "+projectCode)
+                dupeSite = "FDUP"
+                response = WarningWithReplace(context, "Dupe site "+fdups[index]+" is invalid for project "+context.projectCode)
                 if response :
-                    dupeSiteRows[activityID] = response
-
-        accessDataRow["Project_ID"] = projectCodes[projectCode]
-        accessDataRow["Component_ID"] = GetAnalysisInfo(labRow)["code"]
-        # here we save the row indexed by activityID, for later use
-        siteTestRows[activityID] = rowCount
-        
-        # data and < > rules:
-        accessDataRow["Result_Comment"] = ""
-        if fileType == "MWRA" and len(labRow["Test Comment"]) > 1 and labRow["Test Comment"] != "nil":
-            accessDataRow["Result_Comment"] = labRow["Test Comment"]
-        result = labRow["Formatted Entry"]
-        accessDataRow["Actual_Result"] = result
-        accessDataRow["Actual_Result_Type_ID"] = resultTypes["Actual"]
-        if "averageInRow" in fileSuffixes[fileType].keys() and labRow["Parameter"] in fileSuffixes[fileType]["averageInRow"].keys():
-            accessDataRow["Reporting_Result"] = result
-            accessDataRow["Actual_Result_Type_ID"] = resultTypes["Calculated"]
-            accessDataRow["Reporting_Result_Type_ID"] = resultTypes["Calculated"]
-            accessDataRow["Result_Comment"] = 'Average of Replicates'
-        elif result.find("<") > -1 and IsNumber(result.strip("<")) :
-            accessDataRow["Reporting_Result"] = float(result.strip("<"))/2
-            accessDataRow["Result_Comment"] = 'Changed censored value, removed "<" symbol, halved value'
-            accessDataRow["Reporting_Result_Type_ID"] = resultTypes["Calculated"]
-            ltGtFound = True
-        elif (result.find(">")) > -1 and IsNumber(result.strip(">")) :
-            accessDataRow["Reporting_Result"] = float(result.strip(">"))
-            accessDataRow["Result_Comment"] = 'Changed censored value, removed ">" symbol'
-            accessDataRow["Reporting_Result_Type_ID"] = resultTypes["Calculated"]
-            ltGtFound = True
-        elif IsNumber(result) :
-            accessDataRow["Reporting_Result"] = result
-            accessDataRow["Reporting_Result_Type_ID"] = resultTypes["Actual"]
-        else :
-            Warning(accessDataRow["Activity_ID"] + " has invalid Formatted Entry result :"+result)
+                    dupeSite = response
+        if results[position] is None :
+            Warning(context, activityID + " has invalid Formatted Entry result :"+entries[index])
+            context.droppedRows["Invalid Formatted Entry"] = context.droppedRows["Invalid Formatted Entry"] + 1
             continue
-            
-        abbr = GetAnalysisInfo(labRow)["abbrev"]
-        if "Display String" in labRow.keys():
-            accessDataRow["Actual_Result_Unit_ID"] = unitCodes[labRow["Display String"]]
+        if dupeSite :
+            # save the dupe row index for later
+            context.dupeSiteRows[rowCount] = dupeSite
+
+        dates = dateFields[dateStrings[index]]
+        accessDataRow = AccessRow()
+        accessDataRow.Activity_ID = activityID
+        if labAttributes[context.lab]["labID"] and not (parameter == "Depth (ft)" or parameter == "Temperature (C)"):
+            accessDataRow.Lab_ID = labColumns["Sample ID"][index]
         else :
-            accessDataRow["Actual_Result_Unit_ID"] = analysisNames[lab][abbr]["unitID"]
-        accessDataRow["Activity_Type_ID"] = GetActivityType(labRow["Parameter"], site)
-        accessDataRow["Result_Sample_Fraction"] = analysisNames[lab][abbr]["fraction"]
-        accessDataRow["Reporting_Result_Unit_ID"] = accessDataRow["Actual_Result_Unit_ID"]
-        accessDataRow["Collection_ID"] = GetCollectionMethod(labRow["Parameter"], site, siteCollectionExceptions, depthCollectionExceptions)
-        accessDataRow["Analytical_Method_ID"] = analysisNames[lab][abbr]["name"]
-        accessDataRow["Associated_ID"] = "" # dupe info to be filled in later
-        accessDataRow["Data_Type_ID"] = dataTypes["Critical"]
-        if labRow["Parameter"] in nonCriticalTests :
-            accessDataRow["Data_Type_ID"] = dataTypes["Non-critical"]
-        accessDataRow["Media_Type_ID"] = mediaTypes["Water"]
-        accessDataRow["Media_Subdivision_ID"] = mediaSubtypes["Surface Water"]
-        accessDataRow["Relative_Depth_ID"] = relativeDepthTypes["Surface"]
-        accessDataRow["Field_Comment"] = ""
-        if "Field Comments" in labRow.keys() and len(labRow["Field Comments"]) > 0 :
-            accessDataRow["Field_Comment"] = labRow["Field Comments"]
-        accessDataRow["Event_Comment"] = ""
-        accessDataRow["QAQC_Comment"] = "" # dupe info to be filled in later
-        accessDataRow["Percent_RPD"] = "" # dupe info to be filled in later
-        accessDataRow["QAQC_Status"] = "Preliminary"
-
-        accessData.append(accessDataRow)
+            accessDataRow.Lab_ID = "None"
+        accessDataRow.Date_Collected = dates[1]
+        accessDataRow.Time_Collected = dates[2]
+        accessDataRow.Site_ID = site
+        accessDataRow.Project_ID = projectCodes[context.projectCode]
+        accessDataRow.Actual_Result = entries[index]
+        accessDataRow.Reporting_Result, accessDataRow.Actual_Result_Type_ID, accessDataRow.Reporting_Result_Type_ID, comment = results[position]
+        if comment is None :
+            comment = testComments[labColumns["Test Comment"][index]] if context.fileType == "MWRA" else ""
+        accessDataRow.Result_Comment = comment
+        (accessDataRow.Component_ID, unitID, accessDataRow.Activity_Type_ID, accessDataRow.Result_Sample_Fraction,
+         accessDataRow.Collection_ID, accessDataRow.Analytical_Method_ID, accessDataRow.Data_Type_ID) = siteFields[(parameter, site)]
+        if "Display String" in labColumns.keys():
+            unitID = unitIds[labColumns["Display String"][index]]
+        accessDataRow.Actual_Result_Unit_ID = unitID
+        accessDataRow.Reporting_Result_Unit_ID = unitID
+        accessDataRow.Associated_ID = "" # dupe info to be filled in later
+        accessDataRow.Media_Type_ID = mediaTypes["Water"]
+        accessDataRow.Media_Subdivision_ID = mediaSubtypes["Surface Water"]
+        accessDataRow.Relative_Depth_ID = relativeDepthTypes["Surface"]
+        accessDataRow.Field_Comment = ""
+        if "Field Comments" in labColumns.keys() and len(labColumns["Field Comments"][index]) > 0 :
+            accessDataRow.Field_Comment = labColumns["Field Comments"][index]
+        accessDataRow.Event_Comment = ""
+        accessDataRow.QAQC_Comment = "" # dupe info to be filled in later
+        accessDataRow.Percent_RPD = "" # dupe info to be filled in later
+        accessDataRow.QAQC_Status = "Preliminary"
+        if IsCensoredRow(accessDataRow) :
+            ltGtFound = True
+
+        context.accessData.append(accessDataRow)
         rowCount = rowCount + 1
     return(ltGtFound)
 
 
+# Routines for the streaming conversion, used with -s
+
+## @parblock @param [in] fileType Type of file, sets expected column headings for reading the file
+## @param [in] labFile String pathname to the lab data file to get the data from.
+## @return Generator of lab data rows with one measure per row.@endparblock
+## Chains the reading, averaging and serializing of lab data rows, so rows are produced one at a time.
+##
+## Uses global fileSuffixes.
+def StreamLabRows(context, fileType, labFile):
+    labRows = ReadLabRows(context, fileType, labFile)
+    if "averageInRow" in fileSuffixes[fileType].keys() :
+        labRows = AverageRows(context, labRows, fileSuffixes[fileType]["averageInRow"])
+    if fileSuffixes[fileType]["testsPerRow"] :
+        labRows = SerializeRows(context, labRows, fileSuffixes[fileType]["testsPerRow"])
+    return(labRows)
+
+
+## @parblock @param [in] labRows Iterable of lab data row dictionaries
+## @param [in] avgParameters Dictionary of result, component pairs.
+## @return Generator of the lab data rows, with averages added.@endparblock
+## Generator version of AverageRowData(). Rows are averaged in batches of averageBatchSize rows,
+## so the averages are still array operations while only a batch is held.
+##
+## Uses global averageBatchSize.
+def AverageRows(context, labRows, avgParameters):
+    batch = []
+    for row in labRows :
+        batch.append(row)
+        if len(batch) >= averageBatchSize :
+            AverageLabRows(context, batch, avgParameters)
+            yield from batch
+            batch = []
+    AverageLabRows(context, batch, avgParameters)
+    yield from batch
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] labFile String pathname to the lab data file
+## @return Tuple of a dictionary of the number of dupes expected per original, keyed as by GetDupeKey(), and the number of lab data rows.@endparblock
+## First, quick pass over the lab data for a streaming conversion. It collects the two things that
+## are needed before rows can be written in order: which original samples have dupes, and how many,
+## so that only those rows are held back until their dupes are found, and the ROV sample addresses,
+## which can come after the rows they apply to. Both are small compared to the file. No warnings are
+## issued, problems are reported by the second pass.
+##
+## Uses context projectCode and lab, fills context rovAddresses.
+def IndexStreamDupes(context, fileType, labFile):
+    dupeCounts = {}
+    rowCount = 0
+    for labRow in StreamLabRows(context, fileType, labFile) :
+        rowCount = rowCount + 1
+        site = ApplyFdupColumn(context, labRow)
+        parameter = labRow["Parameter"]
+        if parameter == "Sample Address" :
+            context.rovAddresses[(site, AccessFormatDate(GetSampleDateTime(context, labRow)))] = labRow["Formatted Entry"]
+        elif site == "FDUP" and labAttributes[context.lab]["dupeSupport"] and parameter in analysisCodes.keys() \
+                and not (parameter == "Depth (ft)" or parameter == "Temperature (C)") \
+                and labRow["FDUP?"] in context.config.projectSites[context.projectCode] :
+            # the key GetDupeKey() makes from the Access row
+            key = (projectCodes[context.projectCode], AccessFormatDate(GetSampleDateTime(context, labRow)), labRow["FDUP?"], analysisCodes[parameter]["code"])
+            dupeCounts[key] = dupeCounts.get(key, 0) + 1
+    # the second pass averages the same rows again
+    context.replicateRows = []
+    return(dupeCounts, rowCount)
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] labFile String pathname to the lab data file
+## @param [in] dupeCounts Dictionary of dupes expected per original, from IndexStreamDupes()
+## @return Generator of finished Access data rows, except for field comments.@endparblock
+## Second pass of a streaming conversion. Each lab data row is filled by FillAccessRow() and yielded
+## straight away, except for originals with dupes and their dupes. These are held, keyed by
+## GetDupeKey(), until the original and all of its dupes are found. The group is then filled by
+## FillDupeGroups() and yielded, original first. Which original the dupes go to is decided by
+## ClaimDupeOriginal(), as for FillDupeAccessData().
+##
+## Uses context lab.
+def StreamAccessRows(context, fileType, labFile, dupeCounts):
+    heldGroups = {}
+    originals = set()
+    for labRow in StreamLabRows(context, fileType, labFile) :
+        accessDataRow, activityID, dupeSite = FillAccessRow(context, labRow)
+        context.siteRows.clear() # not used here, and would grow with the file
+        if accessDataRow is None :
+            continue
+        if dupeSite and labAttributes[context.lab]["dupeSupport"] :
+            key = GetDupeKey(accessDataRow, dupeSite)
+            group = heldGroups.setdefault(key, [None, []])
+            group[1].append((accessDataRow, dupeSite))
+        else :
+            key = GetDupeKey(accessDataRow, accessDataRow.Site_ID)
+            if key not in dupeCounts.keys() or not ClaimDupeOriginal(context, originals, key, accessDataRow, True) :
+                yield(accessDataRow)
+                continue
+            group = heldGroups.setdefault(key, [None, []])
+            group[0] = accessDataRow
+        if group[0] is not None and len(group[1]) >= dupeCounts.get(key, 0) :
+            del heldGroups[key]
+            FillDupeGroups([group])
+            yield(group[0])
+            for dupeRow, site in group[1] :
+                yield(dupeRow)
+
+    # originals some of whose dupes had no valid result, and dupes with no original
+    for origRow, dupes in heldGroups.values() :
+        if origRow is None :
+            for dupeRow, site in dupes :
+                Warning(context, "No original sample found for activity ID "+GetDupeActivityId(dupeRow.Activity_ID, site, 1) + " dupe test, skipping")
+                yield(dupeRow)
+            continue
+        FillDupeGroups([(origRow, dupes)])
+        yield(origRow)
+        for dupeRow, site in dupes :
+            yield(dupeRow)
+
+
+## @parblock @param [in] fileType Type of file, sets the project, lab and expected column headings
+## @param [in] labFile String pathname to the lab data file
+## @param [in] fieldFile String pathname to the associated field file, or empty
+## @param [in] fileDate datetime date object for the date that's part of the input file name
+## @return Number of Access data rows written.@endparblock
+## Converts a lab data file to its Access upload file without holding the file in memory. Rows flow from
+## the reader through StreamAccessRows(), get their field comments and sanity checks, and are written as
+## they are produced. The whole-file steps use small side indexes instead:
+##    - dupes, see IndexStreamDupes() and StreamAccessRows()
+##    - the < or > row for MoveLtGtRowToTop() is held back, rows are written to a ".part" file, and
+##      the upload file is put together at the end as the header, that row, then the ".part" file
+##    - the duplicate Activity_ID check keeps a set of the Activity_IDs written so far
+##    - Associated_IDs are checked at the end, against that set, for the dupe rows only
+##
+## The rows are the same as for the other engines, but dupe pairs are written together. The two passes
+## are recorded as the stages IndexStreamDupes and StreamAccessDataFile, see RecordStage(). With -db and
+## -pq, the rows of the finished upload file are then written to the database and the Parquet file,
+## and the rows with warnings are recorded for the site statistics, see RecordWarnedIds().
+## The Activity_IDs are looked up in the Activity_ID index from the same set, see CheckPastActivityIds().
+##
+## Uses global accessHeadings, fileSuffixes, uploadDir, databaseFile, parquetExport, activityIndexFile and siteStatsFile.
+def StreamAccessDataFile(context, fileType, labFile, fieldFile, fileDate):
+    startTime = time.perf_counter()
+    dupeCounts, rowCount = IndexStreamDupes(context, fileType, labFile)
+    emptyRows = context.droppedRows["Empty Site ID"]
+    RecordStage(context, "IndexStreamDupes", startTime, rowCount, rowCount + emptyRows)
+    startTime = time.perf_counter()
+    fieldInfo = None
+    fieldMismatches = []
+    if fileSuffixes[fileType]["associated"] and fieldFile :
+        fieldInfo = ReadFieldComments(context, fieldFile)
+    legal = GetLegalValues(context)
+    activityIds = set()
+    duplicateIds = []
+    dupeRows = []
+    ltGtRow = None
+    records = 0
+
+    MakeDirIfNeeded(".", uploadDir)
+    uploadFile = GetUploadFileName(fileType, fileDate)
+    partFile = uploadFile+".part"
+    with open(partFile, 'w', newline='') as csvfile:
+        accessFileWriter = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+        for row in StreamAccessRows(context, fileType, labFile, dupeCounts) :
+            if fieldInfo is not None :
+                fieldTime = FillRowFieldComment(context, row, fieldInfo, AccessTimeMinutes(row.Time_Collected))
+                if fieldTime :
+                    fieldMismatches.append((row, fieldTime))
+            if row.Activity_ID in activityIds :
+                duplicateIds.append(row.Activity_ID)
+            activityIds.add(row.Activity_ID)
+            if row.Associated_ID :
+                # its Associated_ID can only be checked once all rows are seen
+                dupeRows.append(row)
+            else :
+                SanityCheckRow(context, row, fileDate, legal, activityIds)
+            records = records + 1
+            if ltGtRow is None and (row.Actual_Result.find("<") > -1 or row.Actual_Result.find(">") > -1) :
+                ltGtRow = row
+            else :
+                accessFileWriter.writerow(row.values())
+    csvfile.close()
+
+    if fieldInfo is not None :
+        WarnFieldTimes(context, fieldMismatches, fieldFile, fieldInfo)
+    if len(duplicateIds) :
+        Warning(context, "Duplicate Activity_ID values: "+", ".join(duplicateIds))
+    for row in dupeRows :
+        SanityCheckRow(context, row, fileDate, legal, activityIds)
+    # the second pass reads the same empty rows again
+    context.droppedRows["Empty Site ID"] = emptyRows
+    RecordStage(context, "StreamAccessDataFile", startTime, records)
+
+    if records == 0 :
+        os.remove(partFile)
+        return(0)
+    if activityIndexFile :
+        startTime = time.perf_counter()
+        CheckPastActivityIds(context, activityIds, uploadFile)
+        RecordStage(context, "CheckPastActivityIds", startTime, records)
+    with open(uploadFile, 'w', newline='') as csvfile:
+        accessFileWriter = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+        accessFileWriter.writerow(accessHeadings)
+        if ltGtRow is not None :
+            accessFileWriter.writerow(ltGtRow.values())
+        with open(partFile, 'r', newline='') as partfile:
+            shutil.copyfileobj(partfile, csvfile)
+    csvfile.close()
+    os.remove(partFile)
+
+    # the rows are read back from the upload file, so memory use stays flat
+    if databaseFile :
+        startTime = time.perf_counter()
+        with open(uploadFile, 'r', newline='') as csvfile:
+            WriteAccessDatabase(csv.DictReader(csvfile))
+        RecordStage(context, "WriteAccessDatabase", startTime, records)
+    if siteStatsFile :
+        RecordWarnedIds(uploadFile, context.warnedIds)
+    if parquetExport :
+        startTime = time.perf_counter()
+        with open(uploadFile, 'r', newline='') as csvfile:
+            WriteAccessParquetFile(csv.DictReader(csvfile), uploadFile[:-len(".csv")]+".parquet")
+        RecordStage(context, "WriteAccessParquetFile", startTime, records)
+    return(records)
+
+
 ## @parblock @param [in] fieldFile File pathname for the VMM temp & depth file that corresponds to the MWRA lab data file of the same date.@endparblock
 ## Based on contents of a separate file, fill in the comments fields in the 
 ## access data. For a given site and a given sample date, if the fieldFile 
@@ -374,70 +1251,129 @@ def FillAccessData():
 ##
 ## This routine also performs a check that the sample Time_Collected between the lab data and the fieldFile,
 ## for non-dupe samples, are the same or at least agree within 30 minutes.
+##
+## The rows are joined to the field file on their (Site_ID, Date_Collected) key, which is filled in when
+## the row is made, so no dates are parsed again here. The sample times of all the rows are turned into
+## minutes at once, each distinct Time_Collected only once, and the rows whose times don't agree are
+## reported in one warning by WarnFieldTimes() once the join is done.
+##    
+## Uses context rovAddresses, modifies context accessData.
+def FillAccessFieldComments( context, fieldFile ) :  
+    fieldInfo = ReadFieldComments(context, fieldFile)
+    minutes = {}
+    for timeCollected in set(row.Time_Collected for row in context.accessData) :
+        minutes[timeCollected] = AccessTimeMinutes(timeCollected)
+    mismatches = []
+    for row in context.accessData:
+        fieldTime = FillRowFieldComment(context, row, fieldInfo, minutes[row.Time_Collected])
+        if fieldTime :
+            mismatches.append((row, fieldTime))
+    WarnFieldTimes(context, mismatches, fieldFile, fieldInfo)
+
+
+## @parblock @param [in] fieldFile File pathname for the VMM temp & depth file
+## @return Dictionary of the field file comments and sample times, each keyed by (site, date) as in the
+## Access data, and the name of the date column.@endparblock
+## Reads the comments and sample times from the field file, for FillRowFieldComment(). The dates are
+## keyed as AccessFormatDate() writes Date_Collected, and the times are kept as minutes since midnight,
+## with the time as read for the warnings.
+def ReadFieldComments( context, fieldFile ) :
+    siteKey = ""
+    commentKey = ""
+    dateKey = ""
+    noComments = True
+    siteComments = {}
+    siteTimes = {}
+    with OpenInputFile(fieldFile, newline='') as csvfile:
+        commentfilereader = csv.DictReader(csvfile, dialect='excel')
+        for row in commentfilereader:
+            if siteKey == "" or commentKey == "" or dateKey == "" :
+                for key in row.keys():
+                    if key.find("Site") > -1 :
+                        siteKey = key
+                    elif key.find("Date") > -1 :
+                        dateKey = key
+                    elif key.find("Comment") > -1 :
+                        commentKey = key
+                    
+
+            if not row[siteKey] or not row[dateKey] :
+                # omit empty data rows
+                continue
+            
+            sampleDateTime = GetDateTimeObject(context, row[dateKey], "Field File "+dateKey)
+            siteDateKey = (row[siteKey], AccessFormatDate(sampleDateTime))
+            siteTimes[siteDateKey] = (sampleDateTime.hour*60 + sampleDateTime.minute, str(sampleDateTime.time()))
+
+            if len(row[commentKey]) > 0 :
+                if len(row[siteKey]) > 0 :
+                    siteComments[siteDateKey] = row[commentKey]
+                    noComments = False
+    csvfile.close()
+    if noComments :
+        print("No comments have been found for any sites in "+fieldFile)
+    return({"Comments":siteComments, "Times":siteTimes, "Date Key":dateKey})
+
+
+## @parblock @param [in] timeCollected String Time_Collected of an Access data row, as made by AccessFormatTime()
+## @return Integer minutes since midnight.@endparblock
+def AccessTimeMinutes( timeCollected ) :
+    minutes = int(timeCollected[0:2]) % 12 * 60 + int(timeCollected[3:5])
+    if timeCollected[-2:] == "PM" :
+        minutes = minutes + 720
+    return(minutes)
+
+
+## @parblock @param [in] row AccessRow of one row of Access data
+## @param [in] fieldInfo Dictionary of field file comments and times, from ReadFieldComments()
+## @param [in] sampleMinutes Integer Time_Collected of the row in minutes, from AccessTimeMinutes()
+## @return String field file time if the row's Time_Collected doesn't agree with it, empty otherwise.@endparblock
+## Fills in the Field_Comment of one row of Access data, and checks its Time_Collected against the
+## field file, as described for FillAccessFieldComments(). Disagreeing times are returned rather than
+## warned about, see WarnFieldTimes().
 ##    
-## Uses global rovAddresses, modifies accessData.
-def FillAccessFieldComments( fieldFile ) :  
+## Uses global maxTimeDiff and context rovAddresses.
+def FillRowFieldComment( context, row, fieldInfo, sampleMinutes ) :
+    siteComments = fieldInfo["Comments"]
+    siteTimes = fieldInfo["Times"]
+    dateSiteKey = (row.Site_ID, row.Date_Collected)
+    fieldTime = ""
     
-    if fieldFile :
-        siteKey = ""
-        commentKey = ""
-        dateKey = ""
-        noComments = True
-        siteComments = {}
-        siteTimes = {}
-        with open(fieldFile, 'r', newline='') as csvfile:
-            commentfilereader = csv.DictReader(csvfile, dialect='excel')
-            for row in commentfilereader:
-                if siteKey == "" or commentKey == "" or dateKey == "" :
-                    for key in row.keys():
-                        if key.find("Site") > -1 :
-                            siteKey = key
-                        elif key.find("Date") > -1 :
-                            dateKey = key
-                        elif key.find("Comment") > -1 :
-                            commentKey = key
-                        
-
-                if not row[siteKey] or not row[dateKey] :
-                    # omit empty data rows
-                    continue
-                
-                sampleDateTime = GetDateTimeObject(row[dateKey])
-                sampleDate = YearMonthDay(sampleDateTime.date())
-                dateSiteKey = row[siteKey]+sampleDate
-                sampleTime = sampleDateTime.time()
-                siteTimes[dateSiteKey] = sampleTime
-
-                if len(row[commentKey]) > 0 :
-                    if len(row[siteKey]) > 0 :
-                        siteComments[dateSiteKey] = row[commentKey]
-                        noComments = False
-        csvfile.close()
-        if noComments :
-            print("No comments have been found for any sites in "+fieldFile)
+    # check for agreement between Time_Collected in the lab data versus the fieldFile
+    if dateSiteKey in siteTimes.keys() and row.Activity_ID[-1] == "1" :
+        fieldMinutes, fieldTimeString = siteTimes[dateSiteKey]
+        if abs(sampleMinutes - fieldMinutes) > maxTimeDiff :
+            fieldTime = fieldTimeString
     
-    for row in accessData:
-        site = row["Site_ID"]
-        sampleDateTime = GetDateTimeObject(row["Date_Collected"] + " " + row["Time_Collected"])
-        sampleDate = YearMonthDay(sampleDateTime.date())
-        dateSiteKey = site+sampleDate
-        sampleTime = sampleDateTime.time()
+    if dateSiteKey in context.rovAddresses.keys():
+        row.Field_Comment = context.rovAddresses[dateSiteKey]
         
-        # check for agreement between Time_Collected in the lab data versus the fieldFile
-        if dateSiteKey in siteTimes.keys():
-            if row["Activity_ID"][-1] == "1" and sampleTime != siteTimes[dateSiteKey] :
-                delta = abs(timedelta(hours = sampleTime.hour - (siteTimes[dateSiteKey]).hour, minutes=sampleTime.minute - (siteTimes[dateSiteKey]).minute)).total_seconds()/60.
-                if delta > maxTimeDiff :
-                    Warning(row["Activity_ID"]+" Time_Collected " +row["Time_Collected"]+ " does not match time found in "+fieldFile+" for site "+site+" field "+dateKey+": "+str(siteTimes[dateSiteKey]))
-        
-        if dateSiteKey in rovAddresses.keys():
-            row["Field_Comment"] = rovAddresses[dateSiteKey]
-            
-        if dateSiteKey in siteComments.keys():
-            if row["Field_Comment"] :
-                row["Field_Comment"] = row["Field_Comment"] + "; "+siteComments[dateSiteKey]
-            else :
-                row["Field_Comment"] = siteComments[dateSiteKey]
+    if dateSiteKey in siteComments.keys():
+        if row.Field_Comment :
+            row.Field_Comment = row.Field_Comment + "; "+siteComments[dateSiteKey]
+        else :
+            row.Field_Comment = siteComments[dateSiteKey]
+    return(fieldTime)
+
+
+## @parblock @param [in] mismatches List of (row, field file time) pairs, from FillRowFieldComment()
+## @param [in] fieldFile File pathname for the VMM temp & depth file, used in warnings
+## @param [in] fieldInfo Dictionary of field file comments and times, from ReadFieldComments()@endparblock
+## Reports all the rows whose Time_Collected doesn't agree with the field file in one warning, under the
+## warning code "Field time", listing each row's Activity_ID, site, Time_Collected and field file time,
+## so that interactive mode asks about them once per field file. The rows count as warned about, see
+## RecordWarnedIds().
+##
+## Uses context warningCode, modifies context warnedIds.
+def WarnFieldTimes( context, mismatches, fieldFile, fieldInfo ) :
+    if not mismatches :
+        return()
+    context.warningCode = "Field time"
+    Warning(context, str(len(mismatches))+" Time_Collected values do not match the times found in "+fieldFile+" field "+fieldInfo["Date Key"]+": "
+            +"; ".join(row.Activity_ID+" at site "+row.Site_ID+" "+row.Time_Collected+" against "+fieldTime for row, fieldTime in mismatches),
+            field="Time_Collected")
+    context.warningCode = ""
+    context.warnedIds.update(row.Activity_ID for row, fieldTime in mismatches)
 
 
 #    ## @parblock @param [in] testsToAverage List of which tests in a group get averaged together. @endparblock
@@ -494,87 +1430,160 @@ def FillAccessFieldComments( fieldFile ) :
 ##    to fields in the output Access data, and certain fields are modified.
 ##    
 ## Original site sample row gets:
-##        - the dupe Activity_ID name in the Associated_ID field
+##        - the dupe Activity_ID names in the Associated_ID field, separated by ", " when there are several
 ##        - FDUP in the QAQC_Comment field
-##        - calculated Percent_RPD in the Percent_RPD field
-##        - Preliminary or Rejected in the QAQC_Status
+##        - calculated Percent_RPD in the Percent_RPD field, the largest of its dupes
+##        - Preliminary or Rejected in the QAQC_Status, Rejected if any of its dupes is
 ##
 ## Dupe sample row gets:
-##        - Activity_ID FDUP changed to site name
+##        - Activity_ID FDUP changed to site name, numbered 02, 03, ... for the dupes of one original
 ##        - Site_ID changed from FDUP to actual site
 ##        - the original site sample Activity_ID name in the Associated_ID field
 ##        - FDUP in the QAQC_Comment field
 ##        - Collection_ID from original
 ##        - Field_Comment from original
-##        - calculated Percent_RPD in the Percent_RPD field, same as original
-##        - Preliminary or Rejected in the QAQC_Status, same as original
+##        - calculated Percent_RPD in the Percent_RPD field, between it and the original
+##        - Preliminary or Rejected in the QAQC_Status, for it and the original
+##
+## The originals are indexed once by GetDupeKey(), so any number of field replicates of a sample are
+## matched to it in one pass over the dupes, which are then filled by FillDupeGroups(). Where several
+## originals have the same key, ClaimDupeOriginal() matches the dupes to the first.
 ##  
-## This routine uses global data dupeSiteRows, siteTestRows, and modifies accessData.
-def FillDupeAccessData():
-    for dupeRow in dupeSiteRows.keys():
-        site = dupeSiteRows[dupeRow]
-        # swap out FDUP for the true site name
-        renamedActivity = (accessData[dupeRow]["Activity_ID"]).replace("FDUP", site, 1)
-        # get the activity ID of the original sample, by changing the last char to 1
-        origActivity = renamedActivity[:-1]+"1"
-    
-        if origActivity not in siteTestRows.keys() :
-            Warning("No original sample found for activity ID "+renamedActivity + " dupe test, skipping")
+## This routine uses context dupeSiteRows, and modifies context accessData.
+def FillDupeAccessData(context):
+    dupeKeys = set(GetDupeKey(context.accessData[dupeIndex], site) for dupeIndex, site in context.dupeSiteRows.items())
+    originals = set()
+    originalRows = {}
+    for index, row in enumerate(context.accessData) :
+        if index not in context.dupeSiteRows :
+            key = GetDupeKey(row, row.Site_ID)
+            if ClaimDupeOriginal(context, originals, key, row, key in dupeKeys) :
+                originalRows[key] = row
+    dupeGroups = {}
+    for dupeIndex, site in context.dupeSiteRows.items() :
+        dupeRow = context.accessData[dupeIndex]
+        key = GetDupeKey(dupeRow, site)
+        if key not in originalRows.keys() :
+            Warning(context, "No original sample found for activity ID "+GetDupeActivityId(dupeRow.Activity_ID, site, 1) + " dupe test, skipping")
             continue
-        origRow = siteTestRows[origActivity]
-        
-        accessData[dupeRow]["Activity_ID"] = renamedActivity
-        accessData[origRow]["Associated_ID"] = renamedActivity
-        accessData[dupeRow]["Associated_ID"] = accessData[origRow]["Activity_ID"]
-        accessData[dupeRow]["Site_ID"] = site
-        accessData[dupeRow]["Collection_ID"] = accessData[origRow]["Collection_ID"]
-        accessData[dupeRow]["Field_Comment"] = accessData[origRow]["Field_Comment"]
-        accessData[origRow]["QAQC_Comment"] = "FDUP"
-        accessData[dupeRow]["QAQC_Comment"] = "FDUP"
-        # figure out whether to reject
-        origMeas = float(accessData[origRow]["Reporting_Result"])
-        dupeMeas = float(accessData[dupeRow]["Reporting_Result"])
-        test = TestDupeMeasures(origMeas, dupeMeas, accessData[origRow]["Component_ID"])
-        percent = test["percent"]
-        reportPct = '{:3.2f}'.format(percent)
-        status = test["status"]
-        
-        accessData[origRow]["Percent_RPD"] = reportPct
-        accessData[origRow]["QAQC_Status"] = status
-        accessData[dupeRow]["Percent_RPD"] = reportPct
-        accessData[dupeRow]["QAQC_Status"] = status        
+        dupeGroups.setdefault(key, []).append((dupeRow, site))
+    FillDupeGroups([(originalRows[key], dupes) for key, dupes in dupeGroups.items()])
+
+
+## @parblock @param [in] row AccessRow of Access data
+## @param [in] site String site identifier of the sample, the true site for a dupe
+## @return Tuple of the project, date, site and analysis of the sample, the same for an original and its dupes.@endparblock
+def GetDupeKey(row, site):
+    return((row.Project_ID, row.Date_Collected, site, row.Component_ID))
+
+
+## @parblock @param [in] originals Set of the GetDupeKey() keys of the originals claimed so far
+## @param [in] key Tuple key of the original sample, from GetDupeKey()
+## @param [in] row AccessRow of the original sample
+## @param [in] hasDupes Boolean true if there are dupes with the same key
+## @return True if the dupes with the key are matched to this row, False if an earlier original has the key.@endparblock
+## The one rule for matching dupes to originals, used by both FillDupeAccessData() and StreamAccessRows():
+## the dupes of a key are matched to the first original sample, in file order, with that key. A later
+## original with the same key gets no dupe fields, and a warning when there are dupes to match.
+def ClaimDupeOriginal(context, originals, key, row, hasDupes):
+    if key not in originals :
+        originals.add(key)
+        return(True)
+    if hasDupes :
+        Warning(context, "Original sample "+row.Activity_ID+" repeats the project, date, site and analysis of an earlier original, its dupes are matched to the first one")
+    return(False)
+
+
+## @parblock @param [in] dupeActivity Activity_ID of the dupe sample, containing FDUP
+## @param [in] site String site identifier of the dupe sample
+## @param [in] replicate Integer number of the dupe among the dupes of its original, from 1
+## @return Activity_ID of the dupe sample with the site name, and the sample count 02 for the first dupe, 03 for the second, and so on.@endparblock
+def GetDupeActivityId(dupeActivity, site, replicate):
+    # swap out FDUP for the true site name, and number the dupe after the original, which is 01
+    return(dupeActivity.replace("FDUP", site, 1)[:-2] + '{:02d}'.format(replicate + 1))
+
+
+## @parblock @param [in] dupeGroups List of (original row, list of (dupe row, dupe site)) pairs, the dupes in the order found@endparblock
+## Fills in the dupe fields of each original and its dupes, as described for FillDupeAccessData(). The
+## Percent_RPD and status of all the pairs are worked out together by TestDupeMeasures(), then written
+## back to the rows.
+def FillDupeGroups(dupeGroups):
+    pairs = []
+    for origRow, dupes in dupeGroups :
+        if not dupes :
+            continue
+        renamedActivities = []
+        for replicate, (dupeRow, site) in enumerate(dupes, 1) :
+            dupeRow.Activity_ID = GetDupeActivityId(dupeRow.Activity_ID, site, replicate)
+            dupeRow.Associated_ID = origRow.Activity_ID
+            dupeRow.Site_ID = site
+            dupeRow.Collection_ID = origRow.Collection_ID
+            dupeRow.Field_Comment = origRow.Field_Comment
+            dupeRow.QAQC_Comment = "FDUP"
+            renamedActivities.append(dupeRow.Activity_ID)
+            pairs.append((origRow, dupeRow))
+        origRow.Associated_ID = ", ".join(renamedActivities)
+        origRow.QAQC_Comment = "FDUP"
+
+    # figure out whether to reject
+    tests = TestDupeMeasures([float(origRow.Reporting_Result) for origRow, dupeRow in pairs],
+                             [float(dupeRow.Reporting_Result) for origRow, dupeRow in pairs],
+                             [origRow.Component_ID for origRow, dupeRow in pairs])
+    origTests = {}
+    for (origRow, dupeRow), test in zip(pairs, tests) :
+        dupeRow.Percent_RPD = '{:3.2f}'.format(test["percent"])
+        if test["status"] :
+            dupeRow.QAQC_Status = test["status"]
+        # an original keeps the largest difference, and is rejected if any of its dupes is
+        origTest = origTests.setdefault(id(origRow), {"row":origRow, "percent":0.0, "status":""})
+        origTest["percent"] = max(origTest["percent"], test["percent"])
+        if test["status"] and origTest["status"] != "Preliminary/Rejected" :
+            origTest["status"] = test["status"]
+    for origTest in origTests.values() :
+        origTest["row"].Percent_RPD = '{:3.2f}'.format(origTest["percent"])
+        if origTest["status"] :
+            origTest["row"].QAQC_Status = origTest["status"]
 
 
 ## @parblock @param [in] a,b Sample and sample duplicate measured values
 ## @return Percentage difference between the two values.@endparblock
-## Calculate the percentage.
+## Calculate the percentage. Equal values differ by 0%, including two zeros.
 def CalculatePercent(a, b):
+    if a == b :
+        return(0.0)
+    if a + b == 0 :
+        return(200.0) # the largest difference there can be
     return(100*(abs(a-b)/(abs(a+b)/2)))
 
 
-## @parblock @param [in] origMeas Measure of original sample
-## @param [in] dupeMeas Measure of duplicate sample
-## @param [in] componentID Code of measurement
-## @return Dictionary with percentage and status Preliminary/Accepted or Preliminary/Rejected.@endparblock
+## @parblock @param [in] origMeasures List of measures of the original samples
+## @param [in] dupeMeasures List of measures of the duplicate samples, one per original measure
+## @param [in] componentIDs List of the codes of the measurements
+## @return List of dictionaries with the percentage and the status Preliminary/Accepted or Preliminary/Rejected, one per pair.@endparblock
 ## For duplicate samples, compute the percentage difference between values, and test
 ## for Rejected status. Test limits from all nutrient tests come from maxRPDTestLimits.
+## A measurement without test limits is not tested, and its status is empty, so the rows keep theirs.
 ##
 ## Uses global maxRPDTestLimits.
-def TestDupeMeasures(origMeas, dupeMeas, componentID):
-    percentage = CalculatePercent(origMeas, dupeMeas)
-    status = "Preliminary/Accepted"
-    maxDiff = maxRPDTestLimits[componentID]["diff"]
-    maxPercent = maxRPDTestLimits[componentID]["percent"]
-    if percentage > maxPercent and abs(origMeas - dupeMeas) > maxDiff :
-            status = "Preliminary/Rejected"
-    return({"percent":percentage, "status": status})
+def TestDupeMeasures(origMeasures, dupeMeasures, componentIDs):
+    tests = []
+    for origMeas, dupeMeas, componentID in zip(origMeasures, dupeMeasures, componentIDs) :
+        percentage = CalculatePercent(origMeas, dupeMeas)
+        status = ""
+        limits = maxRPDTestLimits.get(componentID)
+        if limits is not None :
+            status = "Preliminary/Accepted"
+            if percentage > limits["percent"] and abs(origMeas - dupeMeas) > limits["diff"] :
+                status = "Preliminary/Rejected"
+        tests.append({"percent":percentage, "status":status})
+    return(tests)
 
 
 ## @parblock @param [in] rowData Dictionary of one row of sample lab data
 ## @return String site identifier for the sample.@endparblock
 ## Finds the site id from the lab data.
-def GetSiteId(rowData):
-    if lab == "MWRA" :
+def GetSiteId(context, rowData):
+    if context.lab == "MWRA" :
         site = rowData["Site ID"][-4:] # get the last 4 chars
     else:
         site = rowData["Site ID"]
@@ -584,18 +1593,18 @@ def GetSiteId(rowData):
 ## @return datetime object constructed from the sample date and time.@endparblock
 ##  Lab data for the sample time is of the form mo/day/yr hr:min:00
 ##  This routine returns a datetime object constructed based on that format.
-def GetSampleDateTime(rowData):
+def GetSampleDateTime(context, rowData):
     if "Sampled Time" in rowData.keys():
-        return(GetDateTimeObject(rowData["Date/Time"]+" "+rowData["Sampled Time"]))
-    return(GetDateTimeObject(rowData["Date/Time"]))
+        return(GetDateTimeObject(context, rowData["Date/Time"]+" "+rowData["Sampled Time"], "Date/Time"))
+    return(GetDateTimeObject(context, rowData["Date/Time"], "Date/Time"))
 
 ## @parblock @param [in] rowData Dictionary of one row of sample lab data
 ## @return Dictionary of analysisCodes info for the specified test type.@endparblock
 ## Returns the analysisCode dictionary of analysis test information based on the rowData Test Name.
-def GetAnalysisInfo(rowData):
+def GetAnalysisInfo(context, rowData):
     parameter = rowData["Parameter"]
     if parameter not in analysisCodes.keys():
-        parameter = WarningWithReplace("Found unknown parameter: '"+str(parameter)+"' Legal values are " +", ".join(analysisCodes.keys()))
+        parameter = WarningWithReplace(context, "Found unknown parameter: '"+str(parameter)+"' Legal values are " +", ".join(analysisCodes.keys()))
         rowData["Parameter"] = parameter
     return(analysisCodes[parameter])
     
@@ -604,10 +1613,10 @@ def GetAnalysisInfo(rowData):
 ## @return String Activity Identifier@endparblock
 ##  The Activity ID field is a concatenation of the project abbreviation, the date, the site, 
 ##  the test performed, and the sample count. 
-def GetActivityId(projectCode, rowData):
-    sampleDate = GetSampleDateTime(rowData).date()
-    site = GetSiteId(rowData)
-    abbr = GetAnalysisInfo(rowData)["abbrev"]
+def GetActivityId(context, projectCode, rowData):
+    sampleDate = GetSampleDateTime(context, rowData).date()
+    site = GetSiteId(context, rowData)
+    abbr = GetAnalysisInfo(context, rowData)["abbrev"]
     if "analysis_rep" in rowData.keys() and IsNumber(rowData["analysis_rep"]):
         count = "0"+rowData["analysis_rep"]
     else :
@@ -618,11 +1627,12 @@ def GetActivityId(projectCode, rowData):
     return(projectCode + YearMonthDay(sampleDate) + site + abbr + count)
 
 
-## @parblock @param [in] measure String for the type of measurement
+## @parblock @param [in] projectCode Project code string, such as FLG, VMM, etc.
+## @param [in] measure String for the type of measurement
 ## @param [in] site String site identifier
 ## @return Activity type code@endparblock
 ## Returns the activity type code.
-def GetActivityType(measure, site):
+def GetActivityType(projectCode, measure, site):
     if projectCode == "CYN" and site != "FDUP" :
         return(activityCodes["Field Msr/Obs-Portable Data Logger"])
     if measure == "Depth (ft)" or measure == "Temperature (C)":
@@ -632,7 +1642,9 @@ def GetActivityType(measure, site):
     return(activityCodes["Sample-Routine"])
 
 
-## @parblock @param [in] measure String for the type of measurement
+## @parblock @param [in] projectCode Project code string, such as FLG, VMM, etc.
+## @param [in] lab Which lab performs the analysis
+## @param [in] measure String for the type of measurement
 ## @param [in] site String site identifier
 ## @param [in] siteCollections Dictionary of non-default collection methods by site
 ## @param [in] depthCollections Dictionary of non-default depth collection methods by site
@@ -649,9 +1661,7 @@ def GetActivityType(measure, site):
 ## - MGBO - manual grab from a boat
 ## - ISBN - in situ from bank
 ## - ISBO - in situ from boat
-##
-## Uses globals projectCode and lab.
-def GetCollectionMethod(measure, site, siteCollections, depthCollections):
+def GetCollectionMethod(projectCode, lab, measure, site, siteCollections, depthCollections):
     if measure == "Depth (ft)":
         if projectCode == "FLG" :
             return("N-ISBO")
@@ -680,10 +1690,98 @@ def GetCollectionMethod(measure, site, siteCollections, depthCollections):
     return(method)
 
 
+## Tuple of the Access fields, and the default unit, set by a method rule, see MakeMethodRule()
+methodRuleFields = ("Component_ID", "Activity_Type_ID", "Collection_ID", "Analytical_Method_ID", "Result_Sample_Fraction", "Unit_ID", "Data_Type_ID")
+
+## @parblock @param [in] projectCode Project code string, such as FLG, VMM, etc.
+## @param [in] lab Which lab performs the analysis
+## @param [in] parameter String for the type of measurement, a key of analysisCodes
+## @param [in] site String site identifier
+## @param [in] siteCollections Dictionary of the collection methods of the sites that do not use the default, see GetCollectionMethod()
+## @param [in] depthCollections Dictionary of the depth collection methods of the sites that do not use the default
+## @return Dictionary of the Access field values that only depend on the project, lab, parameter and site.@endparblock
+## Works out the rule for one (project, lab, parameter, site): the Component_ID, Activity_Type_ID, Collection_ID,
+## Analytical_Method_ID, Result_Sample_Fraction, Data_Type_ID and the lab's default unit (Unit_ID), as named in
+## methodRuleFields.
+##
+## Uses global analysisCodes, analysisNames and nonCriticalTests.
+def MakeMethodRule(projectCode, lab, parameter, site, siteCollections, depthCollections):
+    abbr = analysisCodes[parameter]["abbrev"]
+    return({"Component_ID":analysisCodes[parameter]["code"],
+            "Activity_Type_ID":GetActivityType(projectCode, parameter, site),
+            "Collection_ID":GetCollectionMethod(projectCode, lab, parameter, site, siteCollections, depthCollections),
+            "Analytical_Method_ID":analysisNames[lab][abbr]["name"],
+            "Result_Sample_Fraction":analysisNames[lab][abbr]["fraction"],
+            "Unit_ID":analysisNames[lab][abbr]["unitID"],
+            "Data_Type_ID":dataTypes["Non-critical"] if parameter in nonCriticalTests else dataTypes["Critical"]})
+
+
+## @parblock @param [in] sites Dictionary giving tuples of site names legal per project, keyed by project name
+## @param [in] siteCollections Dictionary of the collection methods of the sites that do not use the default
+## @param [in] depthCollections Dictionary of the depth collection methods of the sites that do not use the default
+## @return Dictionary of method rules from MakeMethodRule(), keyed by (project, lab, parameter, site).@endparblock
+## Expands the collection method, activity type and analytical method rules into one table, for
+## every file type's project and lab, every parameter the lab reports, and every site of the project
+## plus FDUP. This is done once per run, after the project sites are read.
+##
+## Uses global fileSuffixes, analysisCodes and analysisNames.
+def CompileMethodRules(sites, siteCollections, depthCollections):
+    rules = {}
+    for fileType in fileSuffixes.keys() :
+        projectCode = fileSuffixes[fileType]["project"]
+        lab = fileSuffixes[fileType]["lab"]
+        if projectCode not in sites.keys() :
+            continue
+        for parameter in analysisCodes.keys() :
+            abbr = analysisCodes[parameter]["abbrev"]
+            # skip what the lab does not report, those rows fail as they always have
+            if abbr not in analysisNames[lab].keys() or len({"name", "fraction", "unitID"} - analysisNames[lab][abbr].keys()) :
+                continue
+            for site in list(sites[projectCode]) + ["FDUP"] :
+                rules[(projectCode, lab, parameter, site)] = MakeMethodRule(projectCode, lab, parameter, site, siteCollections, depthCollections)
+    return(rules)
+
+
+## @parblock @param [in] parameter String for the type of measurement, a key of analysisCodes
+## @param [in] site String site identifier
+## @return Dictionary of the method rule for the current project and lab, see MakeMethodRule().@endparblock
+## Looks up the method rule in the table compiled in the context's config. Sites not in the table, such
+## as a replacement value entered for a warning, get their rule made the first time they are seen, and
+## kept in the context's addedRules, as the config is shared and not changed.
+##
+## Uses context config, addedRules, projectCode and lab.
+def GetMethodRule(context, parameter, site):
+    key = (context.projectCode, context.lab, parameter, site)
+    rule = context.config.methodRules.get(key)
+    if rule is None :
+        rule = context.addedRules.get(key)
+        if rule is None :
+            rule = MakeMethodRule(context.projectCode, context.lab, parameter, site,
+                                  context.config.siteCollectionExceptions, context.config.depthCollectionExceptions)
+            context.addedRules[key] = rule
+    return(rule)
+
+
+## @parblock @param [in] fileName String pathname of the CSV file to write
+## @param [in] methodRules Dictionary of method rules, from CompileMethodRules()@endparblock
+## Writes the compiled method rules as a CSV file, one row per (project, lab, parameter, site), so
+## which rule applies to which site can be checked.
+##
+## Uses global methodRuleFields.
+def WriteMethodRules(fileName, methodRules):
+    with open(fileName, 'w', newline='') as csvfile:
+        ruleWriter = csv.writer(csvfile)
+        ruleWriter.writerow(("Project", "Lab", "Parameter", "Site") + methodRuleFields)
+        for key in sorted(methodRules.keys()) :
+            ruleWriter.writerow(key + tuple(methodRules[key][field] for field in methodRuleFields))
+    csvfile.close()
+
+
 
 # Routines interpreting and formatting dates and times
 
 ## @parblock @param [in] timeStr Date or date and time as a string in one of several supported formats
+## @param [in] column Name of the column or field the string comes from, used to remember its format
 ## @return Returns the datetime object for the given date and time.@endparblock
 ## Tries to make a datetime object from the date-and-time string entered. These types are supported:
 ##        - 1/21/2020 6:00
@@ -696,36 +1794,73 @@ def GetCollectionMethod(measure, site, siteCollections, depthCollections):
 ##        - 2020/01/21 6:00 AM
 ##
 ## Other variants, including these but with different spacing, are not supported.
-def GetDateTimeObject(timeStr) :
+##
+## Strings already seen are returned from dateTimeCache, which keeps the most recently used
+## dateCacheSize strings. Otherwise the string is parsed by ParseDateTime(). The cache is shared by
+## the threads of a program converting files with Converters, so a string dropped from it by another
+## thread between the lookups is parsed again.
+##
+## Uses global dateTimeCache and dateCacheSize.
+def GetDateTimeObject(context, timeStr, column = "") :
     try :
-        dt = datetime.strptime(timeStr, "%m/%d/%Y %I:%M") # 1/21/2020 6:00
-    except :
+        dateTimeCache.move_to_end(timeStr)
+        return(dateTimeCache[timeStr])
+    except KeyError :
+        pass
+    dt = ParseDateTime(timeStr, column)
+    if dt is None :
+        Warning(context, "Unable to create datetime object from '"+timeStr+"'")
+        return("")
+    dateTimeCache[timeStr] = dt
+    if len(dateTimeCache) > dateCacheSize :
         try :
-            dt = datetime.strptime(timeStr, "%m/%d/%Y %I:%M:%S %p") # 1/21/2020 6:00:00 AM
-        except :
-            try :
-                dt = datetime.strptime(timeStr, "%m/%d/%y %I:%M") # 1/21/20 6:00
-            except :
-                try :
-                    dt = datetime.strptime(timeStr, "%b %d, %Y, %I:%M %p") # Jan 21, 2020, 6:00 AM
-                except :
-                    try :
-                        dt = datetime.strptime(timeStr, "%b %d, %Y, %I:%M") # Jan 21, 2020, 6:00
-                    except :
-                        try :
-                            dt = datetime.strptime(timeStr, "%Y%m%d") # 20200121
-                        except :
-                            try :
-                                dt = datetime.strptime(timeStr, "%m/%d/%Y") # 1/21/2020
-                            except :
-                                try :
-                                    dt = datetime.strptime(timeStr, "%Y/%m/%d %I:%M %p") # 2020/01/21 6:00 AM
-                                except :
-                                    Warning("Unable to create datetime object from '"+timeStr+"'")
-                                    return("")
+            dateTimeCache.popitem(last = False)
+        except KeyError :
+            pass
     return(dt)
 
 
+## @parblock @param [in] timeStr Date or date and time as a string
+## @param [in] column Name of the column or field the string comes from
+## @return Returns the datetime object, or None if no format matches.@endparblock
+## Tries each of dateTimeFormats on the string, without issuing a warning. The format that last
+## worked for the column is tried first, so a column of dates in one format costs one strptime()
+## per string. The supported formats cannot match the same string, so the order they are tried in
+## does not change the result.
+##
+## Uses global dateTimeFormats, modifies learnedDateFormats.
+def ParseDateTime(timeStr, column = "") :
+    learned = learnedDateFormats.get(column)
+    if learned :
+        try :
+            return(datetime.strptime(timeStr, learned))
+        except (ValueError, TypeError) :
+            pass
+    for dateFormat in dateTimeFormats :
+        if dateFormat == learned :
+            continue
+        try :
+            dt = datetime.strptime(timeStr, dateFormat)
+        except (ValueError, TypeError) :
+            continue
+        learnedDateFormats[column] = dateFormat
+        return(dt)
+    return(None)
+
+
+## @parblock @param [in] timeStrs List of date or date and time strings
+## @param [in] column Name of the column the strings come from
+## @return List of datetime objects, with "" for strings that could not be parsed.@endparblock
+## Batch version of GetDateTimeObject() for a whole column. Each distinct string is parsed
+## once, and a warning is issued once per distinct string that cannot be parsed.
+def ParseManyDateTimes(context, timeStrs, column = "") :
+    parsed = {}
+    for timeStr in timeStrs :
+        if timeStr not in parsed :
+            parsed[timeStr] = GetDateTimeObject(context, timeStr, column)
+    return([parsed[timeStr] for timeStr in timeStrs])
+
+
 ## @parblock @param [in] dateObj datetime object for a given date and time
 ## @return Returns the date as a string in the format YYYYMMDD @endparblock
 ## From a datetime object, returns string with date as YYYYMMDD.
@@ -751,176 +1886,355 @@ def AccessFormatTime(dateTimeObj) :
 ## imported. This routine finds a row which has the symbol and moves it to the first row
 ## in the accessData list.
 ##
-## Modifies global accessData
-def MoveLtGtRowToTop():
+## Modifies context accessData
+def MoveLtGtRowToTop(context):
     rowCount = 0
-    for row in accessData :
-        result = row["Actual_Result"]
+    for row in context.accessData :
+        result = row.Actual_Result
         if result.find("<") > -1 or result.find(">") > -1 :
             break
         rowCount = rowCount + 1
         
-    substitute = accessData.pop(rowCount)
-    accessData.insert(0, substitute)
+    substitute = context.accessData.pop(rowCount)
+    context.accessData.insert(0, substitute)
 
 
 ## @parblock @param [in] fileDate datetime date object for the date that's part of the input file name.@endparblock
 ## Test the Access data fields for compliance to the template checks.
 ## Issue warnings for noncompliances found.
 ##    
-## Uses global projectCode, accessData.
-def SanityChecks(fileDate):
-    # accessHeadings = ["Activity_ID","Lab_ID","Date_Collected","Time_Collected","Site_ID","Project_ID","Component_ID","Actual_Result","Actual_Result_Unit_ID","Activity_Type_ID","Actual_Result_Type_ID","Result_Sample_Fraction","Reporting_Result","Reporting_Result_Unit_ID","Reporting_Result_Type_ID","Collection_ID","Analytical_Method_ID","Associated_ID","Data_Type_ID","Media_Type_ID","Media_Subdivision_ID","Relative_Depth_ID","Result_Comment","Field_Comment","Event_Comment","QAQC_Comment","Percent_RPD","QAQC_Status"]
+## Uses context accessData.
+def SanityChecks(context, fileDate):
+    legal = GetLegalValues(context)
+    activityIds = set()
+    duplicateIds = []
+    for row in context.accessData :
+        if row.Activity_ID in activityIds :
+            duplicateIds.append(row.Activity_ID)
+        activityIds.add(row.Activity_ID)
+        
+    if len(duplicateIds) :
+        Warning(context, "Duplicate Activity_ID values: "+", ".join(duplicateIds))
     
-    legalAnalysisCodes = []
-    legalTestAbbrev = []
-    legalMethods = []
-    legalFractions = []
+    for row in context.accessData :
+        SanityCheckRow(context, row, fileDate, legal, activityIds)
+
+
+## @parblock @param [in] sites Dictionary giving tuples of site names legal per project, keyed by project name
+## @return Dictionary of the compiled validation tables, see GetLegalValues().@endparblock
+## Compiles the legal values of the Access data fields into frozensets and dictionaries, once
+## per run, so the sanity checks are set lookups. The lab methods, lab fractions and project sites
+## are kept per lab and per project.
+##
+## Uses global analysisCodes, analysisNames, unitCodes and activityCodes.
+def CompileValidationTables(sites):
     legalLimits = {}
     for key in analysisCodes.keys() :
-        legalTestAbbrev.append(analysisCodes[key]["abbrev"])
-        legalAnalysisCodes.append(analysisCodes[key]["code"])
-        #legalMethods.append(analysisNames[lab][analysisCodes[key]["abbrev"]])
-        #legalFractions.append(analysisCodes[key]["fraction"])
         legalLimits[analysisCodes[key]["code"]] = {"test":key, "lower":analysisCodes[key]["lower"], "upper":analysisCodes[key]["upper"]}
-        
-    for key in analysisNames[lab] :
-        legalMethods.append(analysisNames[lab][key]["name"])
-        legalFractions.append(analysisNames[lab][key]["fraction"])
-    
-    legalUnits = []
-    for unit in unitCodes.keys() :
-        legalUnits.append(unitCodes[unit])
-    legalActivities = []
-    for key in activityCodes :
-        legalActivities.append(activityCodes[key])
-    
-    legalCollects = ["C-BABR","C-SPBR", "C-MGW", "C-SPBN", "C-BABN", "C-MGBO", "N-DL","N-BABR","N-SPBR", "N-MGW", "N-SPBN", "N-BABN", "N-MGBO", "C-MGBN", "N-MGBN", "C-ITBN", "N-ITBN", "N-ISBO", "N-ISBN"]
+    legalMethods = {}
+    legalFractions = {}
+    for lab in analysisNames.keys() :
+        legalMethods[lab] = frozenset(analysisNames[lab][key]["name"] for key in analysisNames[lab])
+        # not every analysis of every lab has a fraction
+        legalFractions[lab] = frozenset(analysisNames[lab][key]["fraction"] for key in analysisNames[lab] if "fraction" in analysisNames[lab][key])
+    legalSites = {}
+    for prj in sites.keys() :
+        legalSites[prj] = frozenset(sites[prj])
     
-    prj = projectCode
-    if projectCode == "Field":
-        prj = "VMM"
-    activityIds = []
-    idCheck = {}
-    for row in accessData :
-        activityIds.append(row["Activity_ID"])
-        idCheck[row["Activity_ID"]] = 1
-        
-    if len(activityIds) != len(idCheck.keys()) :
-        ActIdQ = activityIds.copy()
-        for actId in idCheck.keys() :
-            ActIdQ.remove(actId)
-        Warning("Duplicate Activity_ID values: "+", ".join(ActIdQ))
-    
-    for row in accessData :
-        field = "Activity_ID"
-        id = row[field]
-        if len(id) < 13 or len(id) > 22 or not id.startswith(prj) or id.replace(" ","") != id or id.find("FDUP") > -1 :
-            Warning(field + " error: '"+id+"'")
-        field = "Lab_ID"
-        id = row[field]
-        if len(id) < 4 :
-            Warning(field + " error, suspiciously short: "+id)
-        field = "Date_Collected"
-        site = row["Site_ID"]
-        sampleDate = GetDateTimeObject(row[field]).date()
-        deltaTime = sampleDate - fileDate # deltatime object is returned from date - date
-        if abs(deltaTime.days) > maxDateDiff :
-            Warning("Site "+site+"_"+field + " error: "+row[field]+" not near to file date "+AccessFormatDate(fileDate))
-        field = "Site_ID"
-        if site not in projectSites[projectCode] :
-            Warning(field + " field error: "+site+ " not legal for "+prj)
-        field = "Project_ID"
+    return({"Analysis Codes":frozenset(legalLimits.keys()), "Limits":legalLimits, "Methods":legalMethods, "Fractions":legalFractions,
+            "Units":frozenset(unitCodes.values()), "Activities":frozenset(activityCodes.values()), "Sites":legalSites,
+            "Collects":frozenset(["C-BABR","C-SPBR", "C-MGW", "C-SPBN", "C-BABN", "C-MGBO", "N-DL","N-BABR","N-SPBR", "N-MGW", "N-SPBN", "N-BABN", "N-MGBO", "C-MGBN", "N-MGBN", "C-ITBN", "N-ITBN", "N-ISBO", "N-ISBN"]),
+            "Type IDs":frozenset([1,2]), "Statuses":frozenset(["Preliminary", "Preliminary/Rejected", "Preliminary/Accepted"])})
+
+
+## @return Dictionary of the legal values and limits used by SanityCheckRow().
+## Collects the legal values of the Access data fields, for the current project and lab, from the
+## tables compiled by CompileValidationTables(), and the site statistics, see ReadSiteStats().
+##    
+## Uses context config, projectCode and lab.
+def GetLegalValues(context):
+    # accessHeadings = ["Activity_ID","Lab_ID","Date_Collected","Time_Collected","Site_ID","Project_ID","Component_ID","Actual_Result","Actual_Result_Unit_ID","Activity_Type_ID","Actual_Result_Type_ID","Result_Sample_Fraction","Reporting_Result","Reporting_Result_Unit_ID","Reporting_Result_Type_ID","Collection_ID","Analytical_Method_ID","Associated_ID","Data_Type_ID","Media_Type_ID","Media_Subdivision_ID","Relative_Depth_ID","Result_Comment","Field_Comment","Event_Comment","QAQC_Comment","Percent_RPD","QAQC_Status"]
+    validationTables = context.config.validationTables
+    legal = validationTables.copy()
+    legal["Methods"] = validationTables["Methods"][context.lab]
+    legal["Fractions"] = validationTables["Fractions"][context.lab]
+    legal["Sites"] = validationTables["Sites"][context.projectCode]
+    legal["Project"] = context.projectCode
+    if context.projectCode == "Field":
+        legal["Project"] = "VMM"
+    legal["Site Stats"] = ReadSiteStats(context.config.siteStatsFile, GetUploadFileName(context.fileType, context.sampleDate))
+    return(legal)
+
+
+## @parblock @param [in] row AccessRow of one row of Access data
+## @param [in] fileDate datetime date object for the date that's part of the input file name
+## @param [in] legal Dictionary of legal values, from GetLegalValues()
+## @param [in] activityIds Set of the Activity_IDs in the file, for checking Associated_IDs@endparblock
+## Tests one row of Access data for compliance to the template checks, see SanityChecks().
+## Runs each rule of sanityRules in turn, under its name as the warning code, so its warnings are
+## counted in the context warningCodes. With -m, the time of each rule is added up in the context
+## ruleSeconds too. Timing the rules costs about as much as running them, so it is left out otherwise.
+##    
+## Uses global sanityRules and timeRules.
+def SanityCheckRow(context, row, fileDate, legal, activityIds):
+    context.warningRow = row
+    if timeRules :
+        ruleSeconds = context.ruleSeconds
+        for name, rule in sanityRules :
+            context.warningCode = name
+            startTime = time.perf_counter()
+            rule(context, row, fileDate, legal, activityIds)
+            ruleSeconds[name] = ruleSeconds.get(name, 0.0) + time.perf_counter() - startTime
+    else :
+        for name, rule in sanityRules :
+            context.warningCode = name
+            rule(context, row, fileDate, legal, activityIds)
+    context.warningCode = ""
+    context.warningRow = None
+
+
+## @parblock @param [in] records Integer number of Access data rows checked
+## @return Dictionary of [warnings, seconds] per sanity check rule, empty if no rows were checked.@endparblock
+## The seconds are 0 unless the rules were timed, with -m, see SanityCheckRow().
+##
+## Uses global sanityRules, and context warningCodes and ruleSeconds.
+def GetRuleStats(context, records):
+    if records == 0 :
+        return({})
+    return({name:[context.warningCodes.get(name, 0), context.ruleSeconds.get(name, 0.0)] for name, rule in sanityRules})
+
+
+# Sanity check rules, run in order by SanityCheckRow(). They all take the same parameters,
+# see SanityCheckRow(), and issue a warning for each noncompliance found.
+
+## Activity_ID is the right length, has the project prefix, and no spaces or FDUP.
+def CheckActivityId(context, row, fileDate, legal, activityIds):
+    field = "Activity_ID"
+    id = row[field]
+    if len(id) < 13 or len(id) > 22 or not id.startswith(legal["Project"]) or id.replace(" ","") != id or id.find("FDUP") > -1 :
+        Warning(context, field + " error: '"+id+"'", field=field, value=id)
+
+## Lab_ID is not suspiciously short.
+def CheckLabId(context, row, fileDate, legal, activityIds):
+    field = "Lab_ID"
+    id = row[field]
+    if len(id) < 4 :
+        Warning(context, field + " error, suspiciously short: "+id, field=field, value=id)
+
+## Date_Collected is within maxDateDiff days of the file date.
+def CheckDateCollected(context, row, fileDate, legal, activityIds):
+    field = "Date_Collected"
+    sampleDate = GetDateTimeObject(context, row[field], field).date()
+    deltaTime = sampleDate - fileDate # deltatime object is returned from date - date
+    if abs(deltaTime.days) > maxDateDiff :
+        Warning(context, "Site "+row.Site_ID+"_"+field + " error: "+row[field]+" not near to file date "+AccessFormatDate(fileDate), field=field, value=row[field])
+
+## Site_ID is a site of the project.
+def CheckSiteId(context, row, fileDate, legal, activityIds):
+    field = "Site_ID"
+    site = row[field]
+    if site not in legal["Sites"] :
+        Warning(context, field + " field error: "+site+ " not legal for "+legal["Project"], field=field, value=site)
+
+## Project_ID is the code of the project.
+def CheckProjectId(context, row, fileDate, legal, activityIds):
+    field = "Project_ID"
+    id = row[field]
+    if projectCodes[context.projectCode] != id :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Component_ID is a known analysis code.
+def CheckComponentId(context, row, fileDate, legal, activityIds):
+    field = "Component_ID"
+    id = row[field]
+    if id not in legal["Analysis Codes"] :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Actual_Result and Reporting_Result are not empty.
+def CheckResultsPresent(context, row, fileDate, legal, activityIds):
+    for field in ["Actual_Result", "Reporting_Result"] :
         id = row[field]
-        if projectCodes[projectCode] != id :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Component_ID"
+        if len(str(id)) < 1 :
+            Warning(context, "Site "+row.Site_ID+" "+field + " field error: cannot be empty", field=field, value=id)
+
+## Reporting_Result is a number within the limits of its analysis, or usual for the site once it
+## has history, see UnexpectedResult(). The user may replace the value of a sample, but not of a dupe.
+def CheckReportingResult(context, row, fileDate, legal, activityIds):
+    field = "Reporting_Result"
+    site = row.Site_ID
+    id = row[field]
+    cid = row.Component_ID
+    legalLimits = legal["Limits"]
+    if not IsNumber(str(id)) :
+        if row.QAQC_Comment != "FDUP" :
+            response = WarningWithReplace(context, "Site "+site+" "+field + " field error: "+str(id)+" is not a number", field=field, value=id)
+            if response :
+                row[field] = response
+        else :
+            Warning(context, "Dupe site "+site+" "+field + " field error: "+str(id)+" is not a number", field=field, value=id)
+    elif cid in legalLimits :
+        unexpected = UnexpectedResult(context, site, cid, id, legal)
+        if not unexpected :
+            return
+        if row.QAQC_Comment != "FDUP" :
+            response = WarningWithReplace(context, "Site "+site+" measured "+legalLimits[cid]["test"] +" "+unexpected, field=field, value=id)
+            if response :
+                row[field] = response
+        else:
+            Warning(context, "Dupe site "+site+" measured "+legalLimits[cid]["test"] +" "+unexpected, field=field, value=id)
+
+## @parblock @param [in] site String Site_ID of the result
+## @param [in] cid Integer Component_ID of the result, one of legal["Limits"]
+## @param [in] result Reporting_Result, a number or a string of one
+## @param [in] legal Dictionary of legal values, from GetLegalValues()
+## @return String saying why the result is unexpected, or empty if it is not.@endparblock
+## When the site statistics have at least siteStatsMinCount results for the site and analysis, a
+## result is unexpected if it is outside the 5% to 95% range of the recent results there, and its
+## anomaly score, its distance from the rolling mean in rolling standard deviations, is over
+## siteStatsScoreLimit. Results a site routinely has are then not warned of, even outside the
+## limits of analysisCodes. Without enough history, the limits of analysisCodes are used.
+## The statistics used, or None for the limits, are recorded in the context statsUsed, see HashStatsUsed().
+##
+## Uses global siteStatsMinCount and siteStatsScoreLimit.
+def UnexpectedResult(context, site, cid, result, legal):
+    value = float(result)
+    stats = legal["Site Stats"].get((site, cid))
+    if stats is not None and stats.count < siteStatsMinCount :
+        stats = None
+    context.statsUsed[(site, cid)] = stats
+    if stats is not None :
+        if stats.low <= value <= stats.high :
+            return("")
+        score = abs(value - stats.mean) / stats.deviation if stats.deviation > 0 else float("inf")
+        if score <= siteStatsScoreLimit :
+            return("")
+        return("unusual for the site: "+str(result)+", anomaly score "+'{:.1f}'.format(score)+" against "+str(stats.count)+
+               " past results, median "+'{:g}'.format(stats.median)+", 5% to 95% "+'{:g}'.format(stats.low)+" to "+'{:g}'.format(stats.high))
+    limits = legal["Limits"][cid]
+    if value < limits["lower"] or value > limits["upper"] :
+        return("outside expected limits: "+str(result))
+    return("")
+
+## Actual_Result_Unit_ID and Reporting_Result_Unit_ID are known units.
+def CheckUnits(context, row, fileDate, legal, activityIds):
+    for field in ["Actual_Result_Unit_ID", "Reporting_Result_Unit_ID"] :
         id = row[field]
-        cid = id
-        if id not in legalAnalysisCodes :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        for field in ["Actual_Result", "Reporting_Result"] :
-            id = row[field]
-            if len(str(id)) < 1 :
-                Warning("Site "+site+" "+field + " field error: cannot be empty")
-        field = "Reporting_Result"
+        if id not in legal["Units"] :
+            Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Activity_Type_ID is a known activity.
+def CheckActivityType(context, row, fileDate, legal, activityIds):
+    field = "Activity_Type_ID"
+    id = row[field]
+    if id not in legal["Activities"] :
+        Warning(context, field + " field error: "+id, field=field, value=id)
+
+## The result, data, media and depth type IDs are 1 or 2.
+def CheckTypeIds(context, row, fileDate, legal, activityIds):
+    for field in ["Actual_Result_Type_ID", "Reporting_Result_Type_ID","Data_Type_ID","Media_Type_ID", "Relative_Depth_ID"] :
         id = row[field]
-        if not IsNumber(str(id)) :
-            if row["QAQC_Comment"] != "FDUP" :
-                response = WarningWithReplace("Site "+site+" "+field + " field error: "+str(id)+" is not a number")
-                if response :
-                    row[field] = response
+        if id not in legal["Type IDs"] :
+            Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id+" not 1 or 2", field=field, value=id)
+
+## Result_Sample_Fraction is a fraction used by the lab.
+def CheckFraction(context, row, fileDate, legal, activityIds):
+    field = "Result_Sample_Fraction"
+    id = row[field]
+    if id not in legal["Fractions"] :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Collection_ID is a known collection method.
+def CheckCollectionId(context, row, fileDate, legal, activityIds):
+    field = "Collection_ID"
+    id = row[field]
+    if id not in legal["Collects"] :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Analytical_Method_ID is a method used by the lab.
+def CheckMethodId(context, row, fileDate, legal, activityIds):
+    field = "Analytical_Method_ID"
+    id = row[field]
+    if id not in legal["Methods"] :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Each Associated_ID is an Activity_ID of the file, with the same prefix as the row's Activity_ID.
+def CheckAssociatedId(context, row, fileDate, legal, activityIds):
+    field = "Associated_ID"
+    site = row.Site_ID
+    assoc_id = row[field]
+    if len(assoc_id) :
+        # should have dupe name
+        idList = assoc_id.split(sep = ", ")
+        for id in idList :
+            if id not in activityIds :
+                Warning(context, "Site "+site+" "+field + " field error: "+id+" not found in Activity_IDs", field=field, value=id)
+            if (row.Activity_ID[:-2] != id[:-2]) :
+                Warning(context, "Site "+site+" "+field + " field error: "+id +" does have the same prefix as the Activity_ID "+row.Activity_ID, field=field, value=id)
+
+## Media_Subdivision_ID is 21.
+def CheckMediaSubdivision(context, row, fileDate, legal, activityIds):
+    field = "Media_Subdivision_ID"
+    id = row[field]
+    if id != 21 :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Result_Comment is empty, or one of the comments added for censored values or averages.
+def CheckResultComment(context, row, fileDate, legal, activityIds):
+    field = "Result_Comment"
+    id = row[field]
+    if len(id) > 0 and (id.find("Changed censored value,") < 0 or (row.Actual_Result[0] != "<" and row.Actual_Result[0] != ">")) and (id.find("Average of ") < 0) :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## Event_Comment is empty.
+def CheckEventComment(context, row, fileDate, legal, activityIds):
+    field = "Event_Comment"
+    id = row[field]
+    if len(id) > 0 :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## QAQC_Comment is empty, or FDUP with the dupe fields filled in.
+def CheckQaqcComment(context, row, fileDate, legal, activityIds):
+    field = "QAQC_Comment"
+    site = row.Site_ID
+    id = row[field]
+    if len(id) > 0 and id != "FDUP" :
+        Warning(context, "Site "+site+" "+field + " field error: "+id, field=field, value=id)
+    elif id == "FDUP" :
+        if not IsNumber(row.Percent_RPD) or len(row.Associated_ID) < 13 :
+            Warning(context, "Site "+site+" Dupe fields Percent_RPD and/or Associated_ID have incorrect info", field=field, value=id)
+
+## Percent_RPD is empty or a number.
+def CheckPercentRpd(context, row, fileDate, legal, activityIds):
+    field = "Percent_RPD"
+    id = row[field]
+    if len(id) > 0 and not IsNumber(str(id)) :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+## QAQC_Status is one of the preliminary statuses.
+def CheckQaqcStatus(context, row, fileDate, legal, activityIds):
+    field = "QAQC_Status"
+    id = row[field]
+    if not id in legal["Statuses"] :
+        Warning(context, "Site "+row.Site_ID+" "+field + " field error: "+id, field=field, value=id)
+
+
+## @parblock @param [in] ruleStats Dictionary of [hits, seconds] per sanity check rule, summed over the run@endparblock
+## Prints the number of warnings of each sanity check rule, and with -m the time taken by each.
+##
+## Uses global sanityRules and timeRules.
+def PrintRuleStats(ruleStats):
+    if not len(ruleStats) :
+        return()
+    if timeRules :
+        print("Sanity check rules: warnings, milliseconds")
+    else :
+        print("Sanity check rules: warnings")
+    for name, rule in sanityRules :
+        if name in ruleStats :
+            if timeRules :
+                print('    {:<24}{:>8}{:>10.1f}'.format(name, ruleStats[name][0], ruleStats[name][1] * 1000))
             else :
-                Warning("Dupe site "+site+" "+field + " field error: "+str(id)+" is not a number")
-        elif float(id) < legalLimits[cid]["lower"] or float(id) > legalLimits[cid]["upper"] :
-            if row["QAQC_Comment"] != "FDUP" :
-                response = WarningWithReplace("Site "+site+" measured "+legalLimits[cid]["test"] +" outside expected limits: "+str(id))
-                if response :
-                    row[field] = response
-            else:
-                Warning("Dupe site "+site+" measured "+legalLimits[cid]["test"] +" outside expected limits: "+str(id))
-        for field in ["Actual_Result_Unit_ID", "Reporting_Result_Unit_ID"] :
-            id = row[field]
-            if id not in legalUnits :
-                Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Activity_Type_ID"
-        id = row[field]
-        if id not in legalActivities :
-            Warning(field + " field error: "+id)
-        for field in ["Actual_Result_Type_ID", "Reporting_Result_Type_ID","Data_Type_ID","Media_Type_ID", "Relative_Depth_ID"] :
-            id = row[field]
-            if id not in [1,2] :
-                Warning("Site "+site+" "+field + " field error: "+id+" not 1 or 2")
-        field = "Result_Sample_Fraction"
-        id = row[field]
-        if id not in legalFractions :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Collection_ID"
-        id = row[field]
-        if id not in legalCollects :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Analytical_Method_ID"
-        id = row[field]
-        if id not in legalMethods :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Associated_ID"
-        assoc_id = row[field]
-        if len(assoc_id) :
-            # should have dupe name
-            idList = assoc_id.split(sep = ", ")
-            for id in idList :
-                #id.strip()
-                if id not in activityIds :
-                    Warning("Site "+site+" "+field + " field error: "+id+" not found in Activity_IDs")
-                if (row["Activity_ID"][:-2] != id[:-2]) :
-                    Warning("Site "+site+" "+field + " field error: "+id +" does have the same prefix as the Activity_ID "+row["Activity_ID"])
-        field = "Media_Subdivision_ID"
-        id = row[field]
-        if id != 21 :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Result_Comment"
-        id = row[field]
-        if len(id) > 0 and (id.find("Changed censored value,") < 0 or (row["Actual_Result"][0] != "<" and row["Actual_Result"][0] != ">")) and (id.find("Average of ") < 0) :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "Event_Comment"
-        id = row[field]
-        if len(id) > 0 :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "QAQC_Comment"
-        id = row[field]
-        if len(id) > 0 and id != "FDUP" :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        elif id == "FDUP" :
-            if not IsNumber(row["Percent_RPD"]) or len(row["Associated_ID"]) < 13 :
-                Warning("Site "+site+" Dupe fields Percent_RPD and/or Associated_ID have incorrect info")
-        field = "Percent_RPD"
-        id = row[field]
-        if len(id) > 0 and not IsNumber(str(id)) :
-            Warning("Site "+site+" "+field + " field error: "+id)
-        field = "QAQC_Status"
-        id = row[field]
-        if not id in ["Preliminary", "Preliminary/Rejected", "Preliminary/Accepted"] :
-            Warning("Site "+site+" "+field + " field error: "+id)
+                print('    {:<24}{:>8}'.format(name, ruleStats[name][0]))
 
 
 ## @parblock @param [in] s String that could represent a number, including a float number
@@ -937,96 +2251,658 @@ def IsNumber(s) :
 # Routines used for user warnings
 
 ## @parblock @param [in] message Warning message string
+## @param [in] field Name of the Access field the warning is about, if any
+## @param [in] value Value of the field the warning is about, if any
 ## @return Replacement value if any, or empty string.@endparblock
 ## Some warnings may be able to be fixed by the user. The user is prompted to enter a
 ## replacement value, ignore the warning, or stop the program.
-def WarningWithReplace(message):
-    PrintWarning(message)
-    if interactive :
+def WarningWithReplace(context, message, field="", value=""):
+    PrintWarning(context, message, field, value)
+    if context.interactive :
         print("    Enter a replacement value to continue")
         print("    Enter [cr] to ignore and continue")
         print("    Enter Q to stop")
         answerString= input ()
         if answerString== "" :
-            warningFile.write("Warning ignored per user response.\n")
+            context.warningFile.write("Warning ignored per user response.\n")
             print ( "Resuming ...\n")        
             return()
         elif answerString[0] == "q" or answerString[0] == "Q" :
-            warningFile.write("Quitting per user response to warning.\n")
+            context.warningFile.write("Quitting per user response to warning.\n")
             print ( "Quitting ...\n")        
             exit(1)
         else :
-            warningFile.write("Value replaced with:"+answerString+", per user response to warning.\n")
+            context.warningFile.write("Value replaced with:"+answerString+", per user response to warning.\n")
             print ( "Resuming ...\n")
             return(answerString)    
     
     
-## @parblock @param [in] message Warning message string.@endparblock
+## @parblock @param [in] message Warning message string
+## @param [in] field Name of the Access field the warning is about, if any
+## @param [in] value Value of the field the warning is about, if any@endparblock
 ## In the event of a warning, print the warning to the screen and to the warnings
 ## file. If interactive mode is in use, ask the user to ignore the warning or quit 
 ## running the program. 
-def Warning(message):
-    PrintWarning(message)
-    if interactive :
+def Warning(context, message, field="", value=""):
+    PrintWarning(context, message, field, value)
+    if context.interactive :
         print("    Enter [cr] to ignore and continue running the program")
         print("    Enter Q to stop the program")
         answerString = input ()
         if answerString == "" :
-            warningFile.write("Warning ignored per user response.\n")
+            context.warningFile.write("Warning ignored per user response.\n")
             print ( "Resuming ...\n")        
             return()
         elif answerString[0] == "q" or answerString[0] == "Q" :
-            warningFile.write("Quitting per user response to warning.\n")
+            context.warningFile.write("Quitting per user response to warning.\n")
             print ( "Quitting ...\n")        
             exit(1)
         
-## @parblock @param [in] message Warning message string@endparblock
+## @parblock @param [in] message Warning message string
+## @param [in] field Name of the Access field the warning is about, if any
+## @param [in] value Value of the field the warning is about, if any@endparblock
 ## Issue warnings about anomalies found in the data, also write them to a file.
-def PrintWarning(message):
-    global warningCount, warningFile
+## When not in interactive mode, the warnings are collected in the context instead, with
+## repeats of the same warning counted, and written once per input file by CloseWarning().
+## Warnings from the sanity checks are recorded with the name of the check and the row's
+## Activity_ID and site, see SanityCheckRow(), which is also added to the context warnedIds. The warnings
+## are also counted by that code, for the metrics.
+##
+## Uses global interactive, and context sampleDate and fileType to name the warnings file, and counts the warning in the context.
+def PrintWarning(context, message, field="", value=""):
+    context.warningCount = context.warningCount + 1
+    if context.warningRow is not None :
+        context.warnedIds.add(context.warningRow.Activity_ID)
+    code = context.warningCode if context.warningCode else "Conversion"
+    context.warningCodes[code] = context.warningCodes.get(code, 0) + 1
+    if not context.interactive :
+        entry = context.warningEntries.get(message)
+        if entry is None :
+            row = context.warningRow
+            entry = {"code":code,
+                     "Activity_ID":row.Activity_ID if row else "", "site":row.Site_ID if row else "",
+                     "field":field, "value":str(value), "message":message, "count":0}
+            context.warningEntries[message] = entry
+        entry["count"] = entry["count"] + 1
+        return()
     print("Warning:", message)
-    if warningFile == sys.stdout :
-        filename = "."+os.sep+"For Script"+os.sep+"Warnings_"+YearMonthDay(sampleDate)+"_"+fileType+".txt"
-        warningFile = open (filename, "w")
-    warningFile.write(message+"\n")
-    warningCount = warningCount + 1
+    if context.warningFile == sys.stdout :
+        context.warningFile = open (GetWarningFileName(context)+".txt", "w")
+    context.warningFile.write(message+"\n")
+
+
+## @return String pathname, without the extension, of the warnings files for the context's input file.
+##
+## Uses global warningsDir, and context sampleDate and fileType.
+def GetWarningFileName(context):
+    return(os.path.join(warningsDir, "Warnings_"+YearMonthDay(context.sampleDate)+"_"+context.fileType))
+
+
+## @details Writes the replicate statistics kept by AverageLabRows() for the context's input file, with
+## -rs, to a CSV file next to its warnings files: the site, date, FDUP?, result, number of replicates,
+## average, standard deviation and coefficient of variation in percent of each averaged result. The
+## standard deviation and coefficient of variation are blank for fewer than two replicates.
+##
+## Uses global warningsDir, and context sampleDate, fileType and replicateRows.
+def WriteReplicateStats(context):
+    fileName = os.path.join(warningsDir, "Replicates_"+YearMonthDay(context.sampleDate)+"_"+context.fileType+".csv")
+    with open(fileName, 'w', newline='') as csvfile:
+        statsWriter = csv.writer(csvfile)
+        statsWriter.writerow(("Site ID", "Date/Time", "FDUP?", "Parameter", "Replicates", "Average", "Standard Deviation", "CV (%)"))
+        for site, sampleTime, fdup, parameter, count, average, deviation, variation in context.replicateRows :
+            statsWriter.writerow((site, sampleTime, fdup, parameter, count, average,
+                                  "" if deviation is None else '{:.3f}'.format(deviation), "" if variation is None else '{:.1f}'.format(variation)))
+
 
-## @details Closes the warning file if it has been opened.
-def CloseWarning() :
-    global warningFile
-    if warningFile != sys.stdout :
-        warningFile.close()
-        warningFile = sys.stdout
+## @details Writes the warnings collected for the context's input file when not in interactive mode:
+## a text file listing each distinct warning once, with how many times it occurred, followed by the
+## number of warnings from each check, and a JSON Lines file with one object per distinct warning,
+## holding its code, Activity_ID, site, field, value, message and count. The Activity_ID, site and
+## value are those of the first occurrence. Prints one line saying where the warnings are.
+##
+## Uses context warningEntries, warningCount and inputFile.
+def WriteWarningEntries(context):
+    fileName = GetWarningFileName(context)
+    codeCounts = {}
+    with open(fileName+".txt", 'w') as textFile:
+        for entry in context.warningEntries.values() :
+            if entry["count"] > 1 :
+                textFile.write(entry["message"]+" ("+str(entry["count"])+" times)\n")
+            else :
+                textFile.write(entry["message"]+"\n")
+            codeCounts[entry["code"]] = codeCounts.get(entry["code"], 0) + entry["count"]
+        textFile.write("\nWarnings by check:\n")
+        for code in codeCounts.keys() :
+            textFile.write("    "+code+": "+str(codeCounts[code])+"\n")
+    with open(fileName+".jsonl", 'w') as jsonFile:
+        for entry in context.warningEntries.values() :
+            jsonFile.write(json.dumps(entry)+"\n")
+    print("Warning: "+str(context.warningCount)+" warnings for "+(context.inputFile if context.inputFile else "this run")+", listed in "+fileName+".txt")
+    context.warningEntries = {}
+
+## @details Closes the context warning file if it has been opened.
+def CloseWarning(context) :
+    if len(context.warningEntries) :
+        WriteWarningEntries(context)
+    if context.warningFile != sys.stdout :
+        context.warningFile.close()
+        context.warningFile = sys.stdout
 
 
 ## @parblock @param [in] projectFile String part of file name that is project-specific
 ## @param [in] formattedDate Date string as YYYYMMDD, from input file name @endparblock
 ##  Write the collected access data to a .csv file.
+## When the context defers its writes, for the pipeline, the file's bytes are made in memory and kept
+## in the context's deferredWrites instead, for RunPipeline() to write.
 ##    For Upload - output folder for the script; contains 
 ##        - YYYYMMDD_forupload_MWRA.csv
 ##        - YYYYMMDD_forupload_VMMtempdepth.csv
 ##        - YYYYMMDD_forupload_Flagging.csv
 ##        - Uploaded Archive - Folder to manually move the uploaded files into when uploading is done         
+##    With -bf, the files are written to the backfill output folder instead, see BackfillFiles().
 ##    
-##  Uses global accessHeadings, accessData
-def WriteAccessDataFile(projectFile, formattedDate):
-    MakeDirIfNeeded(".", "For Upload")
-    with open("For Upload" + os.sep + formattedDate+"_forupload_"+projectFile+".csv", 'w', newline='') as csvfile:
-        accessFileWriter = csv.DictWriter(csvfile, fieldnames=accessHeadings, quoting=csv.QUOTE_NONNUMERIC)
-        accessFileWriter.writeheader()
-        for row in accessData:
-            accessFileWriter.writerow(row)
-    csvfile.close()
+##  Uses global accessHeadings and uploadDir, context accessData
+def WriteAccessDataFile(context, projectFile, formattedDate):
+    MakeDirIfNeeded(".", uploadDir)
+    fileName = os.path.join(uploadDir, formattedDate+"_forupload_"+projectFile+".csv")
+    if context.deferWrites :
+        # encoded as open() would, so the bytes written later are those of a usual run
+        csvfile = io.TextIOWrapper(io.BytesIO(), newline='')
+    else :
+        csvfile = open(fileName, 'w', newline='')
+    with csvfile:
+        accessFileWriter = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+        accessFileWriter.writerow(accessHeadings)
+        accessFileWriter.writerows(row.values() for row in context.accessData)
+        if context.deferWrites :
+            csvfile.flush()
+            context.deferredWrites.append((fileName, csvfile.buffer.getvalue()))
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] fileDate datetime date object for the date that's part of the input file name
+## @return String pathname of the upload file written for the input file.@endparblock
+##
+## Uses global uploadDir.
+def GetUploadFileName(fileType, fileDate):
+    return(os.path.join(uploadDir, YearMonthDay(fileDate)+"_forupload_"+fileType+".csv"))
+
+
+## @parblock @param [in] rows Iterable of Access data rows, AccessRows from context accessData or dictionaries read from an upload file@endparblock
+## Writes the Access data rows to the SQLite database, in one transaction, with executemany() on
+## batches of rows. A row whose Activity_ID is already in the database replaces that row, so
+## converting an input file again updates its rows rather than adding to them.
+##
+## Uses global accessHeadings and databaseBatchSize.
+def WriteAccessDatabase(rows):
+    names = ",".join(accessHeadings)
+    updates = ",".join(heading+"=excluded."+heading for heading in accessHeadings if heading != "Activity_ID")
+    statement = "INSERT INTO AccessData ("+names+") VALUES ("+",".join("?" * len(accessHeadings))+") " \
+                "ON CONFLICT(Activity_ID) DO UPDATE SET "+updates
+    connection = OpenAccessDatabase()
+    try :
+        with connection :
+            batch = []
+            for row in rows :
+                batch.append(TypedAccessRow(row))
+                if len(batch) >= databaseBatchSize :
+                    connection.executemany(statement, batch)
+                    batch = []
+            if batch :
+                connection.executemany(statement, batch)
+    finally :
+        connection.close()
+
+
+## @return sqlite3 connection to the database.
+## Opens the SQLite database, creating the AccessData table and its indexes if they are not there.
+## The table has a column for each of accessHeadings, typed as in accessColumnTypes, with Activity_ID
+## as the primary key. Dates and times are stored as ISO 8601 text, so they sort and compare in order.
+## Worker processes of -j wait for each other's transactions to finish.
+##
+## Uses global databaseFile, accessHeadings and accessColumnTypes.
+def OpenAccessDatabase():
+    connection = sqlite3.connect(databaseFile, timeout=60)
+    columns = []
+    for heading in accessHeadings :
+        columnType = accessColumnTypes.get(heading, "TEXT")
+        if columnType in ("DATE", "TIME") :
+            columnType = "TEXT"
+        columns.append(heading+" "+columnType+(" PRIMARY KEY" if heading == "Activity_ID" else ""))
+    with connection :
+        connection.execute("CREATE TABLE IF NOT EXISTS AccessData ("+", ".join(columns)+")")
+        for heading in ("Site_ID", "Date_Collected", "Component_ID") :
+            connection.execute("CREATE INDEX IF NOT EXISTS AccessData_"+heading+" ON AccessData ("+heading+")")
+    return(connection)
+
+
+# Routines for the Activity_ID index, which catches Activity_IDs already in the upload files of past runs
+
+## @return sqlite3 connection to the Activity_ID index, in autocommit mode.
+## Opens the Activity_ID index, creating its table if it is not there. The table has a row per
+## Activity_ID and upload file, keyed by both without a rowid, so a lookup by Activity_ID reads the
+## key's b-tree only, and an upload file is recorded whole even when its Activity_IDs are in others.
+## Batch is the conversionBatch that recorded the row, and Uploaded is 1 once the upload file has
+## been seen in uploadedArchiveDir. A second index finds the Activity_IDs of one upload file.
+##
+## Uses global activityIndexFile.
+def OpenActivityIndex():
+    connection = sqlite3.connect(activityIndexFile, timeout=60, isolation_level=None)
+    connection.execute("CREATE TABLE IF NOT EXISTS ActivityIDs (Activity_ID TEXT, Upload_File TEXT, Batch TEXT, Uploaded INTEGER NOT NULL, "
+                       "PRIMARY KEY (Activity_ID, Upload_File)) WITHOUT ROWID")
+    connection.execute("CREATE INDEX IF NOT EXISTS ActivityIDs_Upload_File ON ActivityIDs (Upload_File)")
+    return(connection)
+
+
+## @parblock @param [in] activityIds Set of the Activity_IDs of an upload file
+## @param [in] uploadFile String pathname of the upload file
+## @return List of (Activity_ID, upload file name, uploaded) triples for the Activity_IDs in other upload files that count, see below.@endparblock
+## Looks up all of the Activity_IDs of an upload file in the index at once, as a join with a temporary
+## table of them, and then records them as that upload file's, in one transaction. Upload files are
+## recorded by name without their folder, so converting an input file again, or backfilling it, only
+## finds its own Activity_IDs, which are replaced.
+##
+## The Activity_IDs are recorded when the upload file is written, but only count against the other
+## upload files of the same batch of conversions, which are imported together, until the file is
+## accepted: once it is in uploadedArchiveDir, where upload files are moved when imported. The upload
+## files there are marked as uploaded first, for good. So an upload file that was converted but
+## never imported doesn't stop its corrected input file from being converted under another name.
+##
+## Uses global uploadedArchiveDir and conversionBatch.
+def IndexActivityIds(activityIds, uploadFile):
+    uploadName = os.path.basename(uploadFile)
+    archived = [(name,) for name in os.listdir(uploadedArchiveDir)] if os.path.isdir(uploadedArchiveDir) else []
+    connection = OpenActivityIndex()
+    try :
+        # -j workers take turns, so two new files with the same Activity_ID can't both miss the other
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany("UPDATE ActivityIDs SET Uploaded = 1 WHERE Upload_File = ? AND Uploaded = 0", archived)
+        connection.execute("CREATE TEMP TABLE NewIDs (Activity_ID TEXT PRIMARY KEY) WITHOUT ROWID")
+        connection.executemany("INSERT INTO NewIDs VALUES (?)", ((activityId,) for activityId in activityIds))
+        # CROSS JOIN keeps the new Activity_IDs as the outer loop, each one a search of the key
+        collisions = connection.execute("SELECT Activity_ID, Upload_File, Uploaded FROM NewIDs CROSS JOIN ActivityIDs USING (Activity_ID) "
+                                        "WHERE Upload_File != ? AND (Uploaded = 1 OR Batch = ?) ORDER BY Upload_File, Activity_ID",
+                                        (uploadName, conversionBatch)).fetchall()
+        connection.execute("DELETE FROM ActivityIDs WHERE Upload_File = ?", (uploadName,))
+        connection.execute("INSERT INTO ActivityIDs SELECT Activity_ID, ?, ?, ? FROM NewIDs", (uploadName, conversionBatch, int((uploadName,) in archived)))
+        connection.execute("DROP TABLE NewIDs")
+        connection.execute("COMMIT")
+    finally :
+        # closing before the commit rolls the transaction back
+        connection.close()
+    return(collisions)
+
+
+## @parblock @param [in] activityIds Set of the Activity_IDs of the context's upload file
+## @param [in] uploadFile String pathname of the upload file@endparblock
+## Warns of the Activity_IDs of the upload file that are already in upload files that were imported,
+## or that are converted in the same batch, which the Access import would reject, with one warning per
+## upload file. The Activity_IDs are recorded in the index for the runs to come, see IndexActivityIds().
+def CheckPastActivityIds(context, activityIds, uploadFile):
+    pastUploads = OrderedDict()
+    for activityId, uploadName, uploaded in IndexActivityIds(activityIds, uploadFile) :
+        pastUploads.setdefault((uploadName, uploaded), []).append(activityId)
+    context.warningCode = "Past Activity_ID"
+    for (uploadName, uploaded), pastIds in pastUploads.items() :
+        where = "uploaded file " if uploaded else "upload file of this run "
+        Warning(context, "Activity_ID values already in "+where+uploadName+": "+", ".join(pastIds))
+    context.warningCode = ""
+
+
+## @parblock @param [in] uploadFile String pathname of an upload file whose last output is reused@endparblock
+## Moves the Activity_IDs of a reused upload file into the current batch of conversions, so that the
+## other upload files of the batch, which are imported with it, are checked against them.
+##
+## Uses global conversionBatch.
+def JoinActivityBatch(uploadFile):
+    connection = OpenActivityIndex()
+    try :
+        connection.execute("UPDATE ActivityIDs SET Batch = ? WHERE Upload_File = ?", (conversionBatch, os.path.basename(uploadFile)))
+    finally :
+        connection.close()
+
+
+# Routines for the site statistics, which the range check of Reporting_Result uses once a site has history
+
+## @parblock @param [in] statsFile String pathname of the site statistics database
+## @return sqlite3 connection to the site statistics, in autocommit mode.@endparblock
+## Opens the site statistics, creating its tables if they are not there. SiteStats has a row per
+## site and Component_ID, keyed by both without a rowid: the count of results, the rolling mean and
+## variance, the 5%, 50% and 95% quantiles of the recent results, and those results, as a JSON list,
+## for finding the quantiles again. StatsResults keeps the results each upload file added, as a JSON
+## list per site and Component_ID, so that the contribution of an upload file can be taken out again.
+## StatsFiles has a row per upload file converted or added: Warned, the JSON list of the Activity_IDs
+## warned of when it was last converted, and once its results are in, Accepted, the order in which
+## they went in, and Stamp, the size and modification time of the file they were read from.
+def OpenSiteStats(statsFile):
+    connection = sqlite3.connect(statsFile, timeout=60, isolation_level=None)
+    connection.execute("CREATE TABLE IF NOT EXISTS SiteStats (Site_ID TEXT, Component_ID INTEGER, Count INTEGER, Mean REAL, Variance REAL, "
+                       "Low REAL, Median REAL, High REAL, Recent TEXT, PRIMARY KEY (Site_ID, Component_ID)) WITHOUT ROWID")
+    connection.execute("CREATE TABLE IF NOT EXISTS StatsResults (Upload_File TEXT NOT NULL, Site_ID TEXT, Component_ID INTEGER, Results TEXT)")
+    connection.execute("CREATE INDEX IF NOT EXISTS StatsResultsFile ON StatsResults (Upload_File)")
+    connection.execute("CREATE INDEX IF NOT EXISTS StatsResultsSite ON StatsResults (Site_ID, Component_ID)")
+    connection.execute("CREATE TABLE IF NOT EXISTS StatsFiles (Upload_File TEXT PRIMARY KEY, Warned TEXT, Accepted INTEGER, Stamp TEXT) WITHOUT ROWID")
+    return(connection)
+
+
+## @parblock @param [in] statsFile String pathname of the site statistics database, empty for none
+## @param [in] uploadFile String pathname of the upload file whose results are checked, or empty
+## @return Dictionary of SiteStats named tuples keyed by (Site_ID, Component_ID), empty if there are no site statistics.@endparblock
+## Reads the site statistics for the range check, see UnexpectedResult(), so that each result is
+## scored with a dictionary lookup. The table has a row per site and analysis, so it is small. When
+## the upload file's own results are in the statistics, as when an imported file is converted again,
+## the statistics of its sites and analyses are worked out again without them, so that no file is
+## checked against itself.
+def ReadSiteStats(statsFile, uploadFile=""):
+    if not statsFile or not os.path.exists(statsFile) :
+        return({})
+    uploadName = os.path.basename(uploadFile)
+    connection = OpenSiteStats(statsFile)
+    try :
+        siteStats = {}
+        for site, cid, count, mean, variance, low, median, high in connection.execute(
+                "SELECT Site_ID, Component_ID, Count, Mean, Variance, Low, Median, High FROM SiteStats") :
+            siteStats[(site, cid)] = SiteStats(count, mean, variance ** 0.5, low, median, high)
+        for site, cid in connection.execute("SELECT Site_ID, Component_ID FROM StatsResults WHERE Upload_File = ?", (uploadName,)).fetchall() :
+            siteStats.pop((site, cid), None)
+            count, mean, variance, recent = SumSiteResults(connection, site, cid, uploadName)
+            if count :
+                ordered = sorted(recent)
+                siteStats[(site, cid)] = SiteStats(count, mean, variance ** 0.5, Quantile(ordered, 0.05), Quantile(ordered, 0.5), Quantile(ordered, 0.95))
+    finally :
+        connection.close()
+    return(siteStats)
+
+
+## @parblock @param [in] values List of floats, sorted
+## @param [in] fraction Float quantile to find, from 0 to 1
+## @return Float quantile of the values, interpolated between the two nearest.@endparblock
+def Quantile(values, fraction):
+    position = fraction * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return(values[lower] + (values[upper] - values[lower]) * (position - lower))
+
+
+## @parblock @param [in] stats Tuple of the count, mean, variance and list of recent results to add to
+## @param [in] results List of float results to add, oldest first
+## @return Tuple of the count, mean, variance and list of recent results, with the results added.@endparblock
+## The mean and variance are updated one result at a time with a weight of 1/n, which makes them the
+## mean and variance of all the results until there are siteStatsWindow of them, and a rolling mean
+## and variance of about the last siteStatsWindow results after that. The last siteStatsWindow
+## results are kept, for the quantiles.
+##
+## Uses global siteStatsWindow.
+def AddSiteResults(stats, results):
+    count, mean, variance, recent = stats
+    for result in results :
+        count = count + 1
+        weight = 1.0 / min(count, siteStatsWindow)
+        delta = result - mean
+        mean = mean + weight * delta
+        variance = (1.0 - weight) * (variance + weight * delta * delta)
+    return((count, mean, variance, (recent + results)[-siteStatsWindow:]))
+
+
+## @parblock @param [in] connection sqlite3 connection to the site statistics, from OpenSiteStats()
+## @param [in] site String Site_ID
+## @param [in] cid Integer Component_ID
+## @param [in] leaveOut String name of an upload file whose results are left out, or empty
+## @return Tuple of the count, mean, variance and list of recent results, see AddSiteResults().@endparblock
+## Works out the statistics of a site and analysis again from the results kept in StatsResults, in
+## the order their upload files were first added.
+def SumSiteResults(connection, site, cid, leaveOut=""):
+    stats = (0, 0.0, 0.0, [])
+    for (results,) in connection.execute("SELECT Results FROM StatsResults JOIN StatsFiles USING (Upload_File) WHERE Site_ID = ? AND Component_ID = ? "
+                                         "AND Upload_File != ? ORDER BY Accepted, StatsResults.rowid", (site, cid, leaveOut)) :
+        stats = AddSiteResults(stats, json.loads(results))
+    return(stats)
+
+
+## @parblock @param [in] uploadFile String pathname of the upload file written
+## @param [in] warnedIds Set of the Activity_IDs of the rows that had warnings@endparblock
+## Records the rows of an upload file that had warnings, when it is converted, for when its results
+## are added to the site statistics. Its results are not added now: only upload files that were
+## imported count, see AcceptSiteStats(). So no file is checked against the results of the files
+## converted in the same run, or against its own from an earlier conversion.
+##
+## Uses global siteStatsFile.
+def RecordWarnedIds(uploadFile, warnedIds):
+    connection = OpenSiteStats(siteStatsFile)
+    try :
+        connection.execute("INSERT INTO StatsFiles (Upload_File, Warned) VALUES (?,?) ON CONFLICT (Upload_File) DO UPDATE SET Warned = excluded.Warned",
+                           (os.path.basename(uploadFile), json.dumps(sorted(warnedIds))))
+    finally :
+        connection.close()
+
+
+## @parblock @param [in] rows Iterable of dictionaries read from an upload file
+## @param [in] uploadName String name of the upload file, without its folder
+## @param [in] stamp String size and modification time of the upload file@endparblock
+## Adds the numeric Reporting_Results of an upload file to the site statistics, in one transaction,
+## see AddSiteResults(). Only results that passed review go in: dupe samples are left out, since they
+## repeat their original, and so are results with a Rejected QAQC_Status and results of the rows
+## warned of when the file was converted, see RecordWarnedIds(), so that repeated bad values don't
+## widen the range they are checked against.
+##
+## The results are also kept per upload file, in StatsResults. When an upload file is added again,
+## as when a corrected input file was converted and imported again, its earlier results are taken out
+## and the statistics of the sites and analyses they were for are worked out again from the results
+## kept, see SumSiteResults(), so that only the last version of each upload file counts.
+##
+## Uses global analysisCodes and siteStatsFile.
+def AddSiteStats(rows, uploadName, stamp):
+    knownCodes = frozenset(analysis["code"] for analysis in analysisCodes.values())
+    connection = OpenSiteStats(siteStatsFile)
+    try :
+        connection.execute("BEGIN IMMEDIATE")
+        entry = connection.execute("SELECT Warned, Accepted FROM StatsFiles WHERE Upload_File = ?", (uploadName,)).fetchone()
+        warnedIds = frozenset(json.loads(entry[0])) if entry and entry[0] else frozenset()
+        newResults = OrderedDict()
+        for row in rows :
+            result = row["Reporting_Result"]
+            if row["QAQC_Comment"] == "FDUP" or row["QAQC_Status"].endswith("Rejected") or row["Activity_ID"] in warnedIds \
+                    or not IsNumber(result) or not IsNumber(row["Component_ID"]) :
+                continue
+            cid = int(row["Component_ID"])
+            if cid in knownCodes :
+                newResults.setdefault((row["Site_ID"], cid), []).append(float(result))
+
+        accepted = entry[1] if entry and entry[1] is not None else connection.execute("SELECT COALESCE(MAX(Accepted), 0) + 1 FROM StatsFiles").fetchone()[0]
+        connection.execute("INSERT INTO StatsFiles (Upload_File, Accepted, Stamp) VALUES (?,?,?) "
+                           "ON CONFLICT (Upload_File) DO UPDATE SET Accepted = excluded.Accepted, Stamp = excluded.Stamp", (uploadName, accepted, stamp))
+        pastKeys = connection.execute("SELECT Site_ID, Component_ID FROM StatsResults WHERE Upload_File = ?", (uploadName,)).fetchall()
+        connection.execute("DELETE FROM StatsResults WHERE Upload_File = ?", (uploadName,))
+        connection.executemany("INSERT INTO StatsResults VALUES (?,?,?,?)",
+                               [(uploadName, site, cid, json.dumps(results)) for (site, cid), results in newResults.items()])
+        updates = []
+        removals = []
+        for site, cid in OrderedDict.fromkeys(list(newResults.keys()) + pastKeys) :
+            if pastKeys :
+                # the upload file was added before, start again from the results kept
+                stats = SumSiteResults(connection, site, cid)
+            else :
+                stats = connection.execute("SELECT Count, Mean, Variance, Recent FROM SiteStats WHERE Site_ID = ? AND Component_ID = ?", (site, cid)).fetchone()
+                stats = AddSiteResults((stats[0], stats[1], stats[2], json.loads(stats[3])) if stats else (0, 0.0, 0.0, []), newResults[(site, cid)])
+            count, mean, variance, recent = stats
+            if count == 0 :
+                removals.append((site, cid))
+                continue
+            ordered = sorted(recent)
+            updates.append((site, cid, count, mean, variance, Quantile(ordered, 0.05), Quantile(ordered, 0.5), Quantile(ordered, 0.95), json.dumps(recent)))
+        connection.executemany("DELETE FROM SiteStats WHERE Site_ID = ? AND Component_ID = ?", removals)
+        connection.executemany("INSERT OR REPLACE INTO SiteStats VALUES (?,?,?,?,?,?,?,?,?)", updates)
+        connection.execute("COMMIT")
+    finally :
+        # closing before the commit rolls the transaction back
+        connection.close()
+
+
+## @parblock @param [in] folder String pathname of a folder of upload files
+## @param [in] replaced Boolean true to add the upload files already added again if they were replaced since
+## @return Tuple of the number of upload files added and the number in the folder.@endparblock
+## Adds the results of the upload files in a folder to the site statistics, oldest first, see
+## AddSiteStats(). Upload files already added are skipped, or with replaced, those whose size and
+## modification time are the same as when they were added.
+##
+## Uses global siteStatsFile.
+def AddUploadFolder(folder, replaced):
+    uploadFiles = sorted(name for name in os.listdir(folder) if fnmatch.fnmatch(name, "2*_forupload_*.csv")) if os.path.isdir(folder) else []
+    connection = OpenSiteStats(siteStatsFile)
+    try :
+        stamps = dict(connection.execute("SELECT Upload_File, Stamp FROM StatsFiles WHERE Accepted IS NOT NULL"))
+    finally :
+        connection.close()
+    added = 0
+    for name in uploadFiles :
+        pathName = os.path.join(folder, name)
+        status = os.stat(pathName)
+        stamp = str(status.st_size)+" "+str(status.st_mtime_ns)
+        if name in stamps and (not replaced or stamps[name] == stamp) :
+            continue
+        with open(pathName, 'r', newline='') as csvfile:
+            AddSiteStats(csv.DictReader(csvfile), name, stamp)
+        added = added + 1
+    return((added, len(uploadFiles)))
+
+
+## Adds the results of the upload files imported since the last run to the site statistics: those
+## in uploadedArchiveDir that are not in them yet, or that were replaced there since. This is done
+## once per batch of conversions, before any file is converted, so all of the files of a batch, in
+## any number of -j workers, are checked against the same statistics.
+##
+## Uses global siteStatsFile and uploadedArchiveDir.
+def AcceptSiteStats():
+    if not siteStatsFile :
+        return()
+    added, uploadCount = AddUploadFolder(uploadedArchiveDir, True)
+    if added :
+        print("Added the results of "+str(added)+" imported upload files to "+siteStatsFile)
+
+
+## @parblock @param [in] historyDir String pathname of a folder of upload files@endparblock
+## Adds the results of the upload files in a folder to the site statistics, oldest first, for -ss.
+## Upload files already in the statistics are skipped, so -ss can be run again as the folder grows.
+##
+## Uses global siteStatsFile.
+def BuildSiteStats(historyDir):
+    added, uploadCount = AddUploadFolder(historyDir, False)
+    print("Added the results of "+str(added)+" of "+str(uploadCount)+" upload files in "+historyDir+" to "+siteStatsFile)
+
+
+## @parblock @param [in] rows Iterable of Access data rows, AccessRows from context accessData or dictionaries read from an upload file
+## @param [in] fileName String pathname of the Parquet file to write@endparblock
+## Writes the Access data rows to a Parquet file, with a column type for each Access field from
+## accessColumnTypes: 32 bit integers, 64 bit floats, dates, times in seconds, and strings, with
+## dictionary encoded strings for the columns in dictionaryColumns. Rows are written in row groups of
+## parquetRowGroupSize rows, so the rows are never all held as columns at once. A value that does
+## not fit its column's type, which the sanity checks will have warned about, is left empty.
+##
+## Uses global accessHeadings, accessColumnTypes, dictionaryColumns and parquetRowGroupSize.
+def WriteAccessParquetFile(rows, fileName):
+    arrowTypes = {"INTEGER":pyarrow.int32(), "REAL":pyarrow.float64(), "DATE":pyarrow.date32(), "TIME":pyarrow.time32("s"), "TEXT":pyarrow.string()}
+    fields = []
+    for heading in accessHeadings :
+        arrowType = arrowTypes[accessColumnTypes.get(heading, "TEXT")]
+        if heading in dictionaryColumns :
+            arrowType = pyarrow.dictionary(pyarrow.int32(), arrowType)
+        fields.append(pyarrow.field(heading, arrowType))
+    schema = pyarrow.schema(fields)
+
+    with pyarrow.parquet.ParquetWriter(fileName, schema) as writer :
+        batch = []
+        for row in rows :
+            batch.append(TypedAccessRow(row))
+            if len(batch) >= parquetRowGroupSize :
+                writer.write_table(MakeArrowTable(batch, schema))
+                batch = []
+        if batch :
+            writer.write_table(MakeArrowTable(batch, schema))
+
+
+## @parblock @param [in] typedRows List of tuples of row values, from TypedAccessRow()
+## @param [in] schema pyarrow schema of the Access data columns, from WriteAccessParquetFile()
+## @return pyarrow Table of the rows.@endparblock
+## Builds each column from its values at once. Values that do not fit the column type become null.
+##
+## Uses global accessHeadings and accessColumnTypes.
+def MakeArrowTable(typedRows, schema):
+    arrays = []
+    for heading, values in zip(accessHeadings, zip(*typedRows)) :
+        columnType = accessColumnTypes.get(heading, "TEXT")
+        if columnType == "INTEGER" :
+            values = [value if isinstance(value, int) else None for value in values]
+        elif columnType == "REAL" :
+            values = [float(value) if isinstance(value, (int, float)) else None for value in values]
+        elif columnType == "DATE" or columnType == "TIME" :
+            # each distinct date or time is parsed once
+            parsed = {}
+            for value in set(values) :
+                parsed[value] = ParseIsoValue(value, columnType)
+            values = [parsed[value] for value in values]
+        else :
+            values = [None if value is None else str(value) for value in values]
+        arrowType = schema.field(heading).type
+        if pyarrow.types.is_dictionary(arrowType) :
+            arrays.append(pyarrow.array(values, type=arrowType.value_type).dictionary_encode())
+        else :
+            arrays.append(pyarrow.array(values, type=arrowType))
+    return(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+
+## @parblock @param [in] value ISO 8601 date or time string, from TypedAccessRow()
+## @param [in] columnType "DATE" or "TIME"
+## @return date or time object, or None if the value is not an ISO 8601 date or time.@endparblock
+def ParseIsoValue(value, columnType):
+    try :
+        if columnType == "DATE" :
+            return(datetime.strptime(value, "%Y-%m-%d").date())
+        return(datetime.strptime(value, "%H:%M:%S").time())
+    except (ValueError, TypeError) :
+        return(None)
+
+
+## @parblock @param [in] row AccessRow of one row of Access data, or dictionary of one read from an upload file
+## @return Tuple of the row's values, in the order of accessHeadings, typed as in accessColumnTypes.@endparblock
+## Numbers are converted from the strings they may be held as, dates and times in the Access formats
+## become ISO 8601 text, and empty values become None. A value that cannot be converted, which the
+## sanity checks will have warned about, is kept as it is.
+##
+## Uses global accessHeadings and accessColumnTypes.
+def TypedAccessRow(row):
+    values = []
+    for heading in accessHeadings :
+        value = row[heading]
+        columnType = accessColumnTypes.get(heading)
+        if columnType is None or value is None :
+            values.append(value)
+        elif value == "" :
+            values.append(None)
+        else :
+            try :
+                if columnType == "INTEGER" :
+                    value = int(value)
+                elif columnType == "REAL" :
+                    value = float(value)
+                elif columnType == "DATE" :
+                    value = datetime.strptime(value, "%m/%d/%Y").date().isoformat()
+                elif columnType == "TIME" :
+                    value = datetime.strptime(value, "%I:%M:%S %p").time().isoformat()
+            except ValueError :
+                pass
+            values.append(value)
+    return(tuple(values))
 
 
 ## @parblock @param [in] path path to containing folder
 ## @param [in] dirName containing folder name to make @endparblock
 ## Check for existence of folder dirName in path, create if missing.
+## The folder is simply made, which fails if it is already there, rather than listing path first.
 def MakeDirIfNeeded(path, dirName) :
-    for entry in os.scandir(path):
-        if entry.name == dirName and entry.is_dir():
-            return()
-    os.mkdir(path+os.sep+dirName)
+    try :
+        os.mkdir(os.path.join(path, dirName))
+    except FileExistsError :
+        pass # already there, or made by another worker process in the meantime
 
 
 ## @parblock @param [in] dataFile file to move
@@ -1039,6 +2915,975 @@ def MoveCompletedFile(dataFile, path, dirName):
     fileName = dataFile.split(os.sep)[-1]
     shutil.move(dataFile, path+os.sep+dirName+os.sep+fileName)
 
+
+# Routines for the conversion manifest, which lets a re-run skip the input files that have not changed
+
+## @parblock @param [in] fileName String pathname of the file to hash, may be empty
+## @param [in] fileHashes Dictionary of the hashes already found in this run, keyed by pathname
+## @return String SHA-256 hex digest of the file contents, empty if there is no such file.@endparblock
+## Hashes the contents of a file. Files used by several input files, like the VMMtempdepth
+## file or projectSites.txt, are only read once per run.
+def HashFile(fileName, fileHashes):
+    if not fileName or not os.path.exists(fileName) :
+        return("")
+    if fileName not in fileHashes.keys() :
+        digest = hashlib.sha256()
+        with open(fileName, 'rb') as hashedFile:
+            for block in iter(lambda: hashedFile.read(1 << 20), b"") :
+                digest.update(block)
+        fileHashes[fileName] = digest.hexdigest()
+    return(fileHashes[fileName])
+
+
+## @parblock @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @param [in] fileHashes Dictionary of the hashes already found in this run, keyed by pathname
+## @return Dictionary of the hashes the conversion of the input file depends on.@endparblock
+## The output of an input file depends on its contents, the contents of its associated field file,
+## the sites in projectSites.txt, and the rules in this script. The database written with -db, and
+## whether -pq, -col, -s and -rs are used, are recorded too, so input files are converted again when
+## these change. So is the state of the Activity_ID index, which the warnings depend on, see
+## HashUploadedArchive(), and whether -nss and -nai turn the site statistics and the index off. The
+## site statistics used are checked per input file once the hashes match, see SiteStatsChanged().
+##
+## Uses global scriptFile, databaseFile, parquetExport, columnar, streaming, replicateStats and siteStatsFile.
+def GetConversionHashes(processFileInfo, fileHashes):
+    return({"Input":HashFile(processFileInfo["File"], fileHashes),
+            "Field File":HashFile(processFileInfo["Field File"], fileHashes),
+            "Sites":HashFile("Automate"+os.sep+"projectSites.txt", fileHashes),
+            "Script":HashFile(scriptFile, fileHashes), "Database":databaseFile,
+            "Parquet":parquetExport, "Columnar":columnar, "Streaming":streaming, "Replicate Stats":replicateStats,
+            "Site Stats":bool(siteStatsFile), "Activity Index":HashUploadedArchive(fileHashes)})
+
+
+## @parblock @param [in] statsUsed Dictionary of the SiteStats used by the range check, or None where it used the fixed limits, keyed by (Site_ID, Component_ID)
+## @return String SHA-256 hex digest of the statistics used.@endparblock
+## The range check of an input file depends only on the statistics of the sites and analyses of its
+## results, see UnexpectedResult(), so only those are hashed, not the whole of the site statistics.
+def HashStatsUsed(statsUsed):
+    used = [[site, cid, list(stats) if stats is not None else None] for (site, cid), stats in sorted(statsUsed.items())]
+    return(hashlib.sha256(json.dumps(used).encode()).hexdigest())
+
+
+## @parblock @param [in] entry Dictionary of the manifest or backfill checkpoint entry of an input file
+## @param [in] uploadFile String pathname of the input file's upload file
+## @return Boolean true if the site statistics the last conversion used have changed since.@endparblock
+## The statistics of the sites and analyses recorded with the entry are read again as the upload file
+## would now be checked against them, see ReadSiteStats(), and hashed as they were when it was converted,
+## see HashStatsUsed(). Other upload files being added to the statistics don't matter.
+##
+## Uses global siteStatsFile and siteStatsMinCount.
+def SiteStatsChanged(entry, uploadFile):
+    used = entry.get("Site Stats")
+    if used is None :
+        return(True)
+    if not used["Keys"] :
+        return(False)
+    siteStats = ReadSiteStats(siteStatsFile, uploadFile)
+    statsUsed = {}
+    for site, cid in used["Keys"] :
+        stats = siteStats.get((site, cid))
+        statsUsed[(site, cid)] = stats if stats is not None and stats.count >= siteStatsMinCount else None
+    return(HashStatsUsed(statsUsed) != used["Hash"])
+
+
+## @parblock @param [in] fileHashes Dictionary of the hashes already found in this run, keyed by pathname
+## @return String SHA-256 hex digest of the names of the files in uploadedArchiveDir, empty with -nai.@endparblock
+## The Activity_ID check depends on which upload files were imported, see IndexActivityIds(), so an
+## input file is converted again once another upload file is moved to the archive.
+##
+## Uses global activityIndexFile and uploadedArchiveDir.
+def HashUploadedArchive(fileHashes):
+    if not activityIndexFile :
+        return("")
+    if uploadedArchiveDir not in fileHashes.keys() :
+        names = sorted(os.listdir(uploadedArchiveDir)) if os.path.isdir(uploadedArchiveDir) else []
+        fileHashes[uploadedArchiveDir] = hashlib.sha256("\n".join(names).encode()).hexdigest()
+    return(fileHashes[uploadedArchiveDir])
+
+
+## @return Dictionary of manifest entries keyed by input file name, empty if there is no manifest.
+## Reads the conversion manifest left by the last run. A manifest that cannot be read is ignored,
+## which only means every input file is converted again.
+##
+## Uses global manifestFile.
+def ReadManifest():
+    if not os.path.exists(manifestFile) :
+        return({})
+    try :
+        with open(manifestFile, 'r') as jsonFile:
+            manifest = json.load(jsonFile)
+    except (OSError, ValueError) :
+        print("Could not read "+manifestFile+", converting all input files.")
+        return({})
+    return(manifest)
+
+
+## @parblock @param [in] manifest Dictionary of manifest entries keyed by input file name@endparblock
+## Writes the conversion manifest for the next run. Entries for input files that are no longer in
+## the For Script folder, because they were moved or removed, are dropped.
+##
+## Uses global manifestFile.
+def WriteManifest(manifest):
+    for inputFile in list(manifest.keys()) :
+        if not os.path.exists(inputFile) :
+            del manifest[inputFile]
+    with open(manifestFile+".tmp", 'w') as jsonFile:
+        json.dump(manifest, jsonFile, indent=1, sort_keys=True)
+    os.replace(manifestFile+".tmp", manifestFile)
+
+
+## @parblock @param [in] manifest Dictionary of manifest entries keyed by input file name
+## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @param [in] hashes Dictionary of hashes from GetConversionHashes()
+## @param [in] fileHashes Dictionary of the hashes already found in this run, keyed by pathname
+## @return Result dictionary as from ConvertInputFile() when the last output can be reused, None otherwise.@endparblock
+## The last output of an input file is reused when none of the hashes have changed, nor the site
+## statistics its range check used, see SiteStatsChanged(), and the output file is still the one that
+## was written. When there were warnings, they are in the warnings file
+## from the last run. In interactive mode, files that had warnings are converted again, so the user
+## is asked about the warnings.
+##
+## Uses global interactive and siteStatsFile.
+def CheckManifest(manifest, processFileInfo, hashes, fileHashes):
+    entry = manifest.get(processFileInfo["File"])
+    if entry is None or entry["Hashes"] != hashes :
+        return(None)
+    if interactive and entry["Warnings"] :
+        return(None)
+    if entry["Output"] and HashFile(entry["Output"], fileHashes) != entry["Output Hash"] :
+        return(None)
+    if siteStatsFile and entry["Output"] and SiteStatsChanged(entry, entry["Output"]) :
+        return(None)
+    return({"File":processFileInfo["File"], "Records":entry["Records"], "Warnings":entry["Warnings"], "Rules":{}, "Metrics":None,
+            "Move":entry["Records"] > 0 and (entry["Warnings"] == 0 or interactive)})
+
+
+## @parblock @param [in] manifest Dictionary of manifest entries keyed by input file name
+## @param [in] fileType Type of file
+## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @param [in] hashes Dictionary of hashes from GetConversionHashes(), taken before the conversion
+## @param [in] result Result dictionary from ConvertInputFile()@endparblock
+## Records the conversion of an input file in the manifest, with a hash of the output file written,
+## and the site statistics its range check used.
+def RecordConversion(manifest, fileType, processFileInfo, hashes, result):
+    outputFile = ""
+    if result["Records"] :
+        outputFile = GetUploadFileName(fileType, processFileInfo["Date"])
+    manifest[processFileInfo["File"]] = {"File Type":fileType, "Hashes":hashes, "Output":outputFile,
+                                         "Output Hash":HashFile(outputFile, {}), "Records":result["Records"], "Warnings":result["Warnings"],
+                                         "Site Stats":result["Site Stats"]}
+
+
+## @details Reads projectSites.txt, and compiles the validation tables and method rules for the sites,
+## into the Converter the input files are converted with. Called at startup, and again in watch mode
+## when projectSites.txt changes.
+##
+## Uses global interactive, columnar and siteStatsFile. Sets global converter.
+def LoadSiteData():
+    global converter
+    converter = Converter(useColumnar=columnar, config=CompileConfig(runContext, "Automate", True, bool(siteStatsFile)), useInteractive=interactive)
+
+
+## @parblock @param [in] context ConversionContext the warnings are kept in
+## @param [in] dir Name of the folder with the site info file, projectSites.txt
+## @param [in] writeMissing Boolean true to create projectSites.txt when it is missing, see ReadSiteData()
+## @param [in] useSiteStats Boolean true to check Reporting_Results against the site statistics in the folder
+## @return ConverterConfig of the site data and the tables compiled from it.@endparblock
+## Reads projectSites.txt, see ReadSiteData(), and compiles the validation tables and method rules
+## for its sites. This is the work done once, however many files are then converted with the result.
+## The site statistics file is named by its absolute pathname in the folder, so the conversions give the
+## same results whatever the working directory. The tables are made read only, see FreezeTable().
+##
+## Uses global siteStatsName.
+def CompileConfig(context, dir, writeMissing=True, useSiteStats=True):
+    sites, siteCollections, depthCollections = ReadSiteData(context, dir, writeMissing)
+    sites["Field"] = sites["VMM"]
+    statsFile = os.path.join(os.path.abspath(dir), siteStatsName) if useSiteStats else ""
+    return(ConverterConfig(FreezeTable(sites), FreezeTable(siteCollections), FreezeTable(depthCollections),
+                           FreezeTable(CompileValidationTables(sites)), FreezeTable(CompileMethodRules(sites, siteCollections, depthCollections)),
+                           statsFile))
+
+
+## @parblock @param [in] table Dictionary, list, or other value of the tables compiled for a ConverterConfig
+## @return The table made read only: dictionaries as MappingProxyTypes and lists as tuples, including those within.@endparblock
+## A ConverterConfig is shared by all the conversions made with it, from any number of threads, so
+## nothing in it can be changed. The read only dictionaries can be pickled for the -j workers, see
+## InitializeWorker(), as copyreg is told to rebuild them.
+def FreezeTable(table):
+    if isinstance(table, dict) :
+        return(MappingProxyType({key:FreezeTable(value) for key, value in table.items()}))
+    if isinstance(table, list) :
+        return(tuple(FreezeTable(value) for value in table))
+    return(table)
+
+
+# Routines for the pipeline (-p), which overlaps reading, converting and writing of the input files
+
+## @parblock @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @return Dictionary of the contents of the input file and its associated field file, if any, as bytes keyed by pathname.@endparblock
+## Reads an input file and its field file ahead of their conversion, for OpenInputFile().
+def ReadInputFiles(processFileInfo):
+    contents = {}
+    for fileName in (processFileInfo["File"], processFileInfo["Field File"]) :
+        if fileName :
+            with open(fileName, 'rb') as inputFile:
+                contents[fileName] = inputFile.read()
+    return(contents)
+
+
+## @parblock @param [in] result Dictionary from ConvertInputFile() with the upload files still to be written@endparblock
+## Writes the upload files of a converted input file, and then moves the input file if it can be
+## moved, so an input file is never moved before its upload file is on disk.
+##
+## Uses global fileMove.
+def FinishInputFile(result):
+    for fileName, contents in result.pop("Output Files") :
+        with open(fileName, 'wb') as outputFile:
+            outputFile.write(contents)
+    if fileMove and result["Move"] :
+        MoveCompletedFile(result["File"], "."+os.sep+"For Script", "Processed Files")
+
+
+## @parblock @param [in] workList List of (fileType, file info) pairs to convert, in the order of fileTypes
+## @return List of result dictionaries from ConvertInputFile(), one per input file, in the order of workList.@endparblock
+## Converts the input files with reading, converting and writing overlapped across files, as three
+## tasks joined by queues of pipelineDepth files. The reader reads the next input files and their field
+## files into memory while one is converting, the converter converts one file at a time in its own
+## thread with the files read ahead, and the writer writes the upload files and moves the input files
+## in the background. The queues being bounded keeps the reader from getting far ahead of the
+## converter, or the converter of the writer, so no more than a few files are held in memory.
+## The results are only returned once every upload file has been written.
+##
+## Uses global pipelineDepth and prefetchedFiles.
+async def RunPipeline(workList):
+    readQueue = asyncio.Queue(maxsize=pipelineDepth)
+    writeQueue = asyncio.Queue(maxsize=pipelineDepth)
+    results = []
+
+    async def ReadFiles():
+        for fileType, processFileInfo in workList :
+            contents = await asyncio.to_thread(ReadInputFiles, processFileInfo)
+            await readQueue.put((fileType, processFileInfo, contents))
+        await readQueue.put(None)
+
+    async def ConvertFiles():
+        while True :
+            work = await readQueue.get()
+            if work is None :
+                break
+            fileType, processFileInfo, contents = work
+            prefetchedFiles.update(contents)
+            try :
+                result = await asyncio.to_thread(ConvertInputFile, fileType, processFileInfo)
+            finally :
+                # contents the conversion did not read are not kept for the next file
+                prefetchedFiles.clear()
+            results.append(result)
+            await writeQueue.put(result)
+        await writeQueue.put(None)
+
+    async def WriteFiles():
+        while True :
+            result = await writeQueue.get()
+            if result is None :
+                break
+            await asyncio.to_thread(FinishInputFile, result)
+
+    MakeDirIfNeeded(".", uploadDir)
+    await asyncio.gather(ReadFiles(), ConvertFiles(), WriteFiles())
+    return(results)
+
+
+## @parblock @param [in] archiveDir Name of the folder within For Script to also look in for associated files, or empty
+## @return List of result dictionaries from ConvertInputFile(), one per input file found.@endparblock
+## Converts the input files in the For Script folder, in the order of fileTypes, skipping those the
+## manifest shows have not changed, see CheckManifest(). The files to convert are all found before
+## any is converted, see GetWorkPlan(). Converted files without warnings are moved,
+## unless -nfm is used. The Activity_IDs of the upload files reused join the batch, see JoinActivityBatch().
+## The upload files imported since the last batch are added to the site statistics first, see AcceptSiteStats().
+##
+## Uses global forceConvert, jobs, pipeline, fileMove, columnar, streaming, databaseFile, parquetExport and activityIndexFile. Sets global noFilesFound
+## and conversionBatch.
+def ConvertForScriptFiles(archiveDir=""):
+    global noFilesFound, conversionBatch
+    conversionBatch = str(time.time())
+    AcceptSiteStats()
+    ## Dictionary of manifest entries from the last run, keyed by input file name
+    manifest = ReadManifest()
+    ## Dictionary of file hashes found in this run, keyed by pathname
+    fileHashes = {}
+    ## Dictionary of the hashes each input file's conversion depends on, keyed by input file name
+    conversionHashes = {}
+    ## List of result dictionaries for the input files whose last output is reused
+    reusedResults = []
+
+    ## List of (fileType, file info) pairs to convert, in the order of fileTypes
+    workList = []
+    workPlan = GetWorkPlan(archiveDir)
+    if len(workPlan) > 0 :
+        noFilesFound = False
+    for fileType, processFileInfo in workPlan :
+        hashes = GetConversionHashes(processFileInfo, fileHashes)
+        conversionHashes[processFileInfo["File"]] = hashes
+        result = None if forceConvert else CheckManifest(manifest, processFileInfo, hashes, fileHashes)
+        if result :
+            print("No changes to "+processFileInfo["File"]+" since the last run, its output is reused")
+            if activityIndexFile and result["Records"] :
+                JoinActivityBatch(GetUploadFileName(fileType, processFileInfo["Date"]))
+            reusedResults.append(result)
+        else :
+            workList.append((fileType, processFileInfo))
+
+    ## List of result dictionaries from ConvertInputFile(), one per input file
+    results = []
+    if pipeline :
+        # the writer moves each input file once its upload file is written
+        results = asyncio.run(RunPipeline(workList))
+    elif jobs > 1 and len(workList) > 1 :
+        # VMMtempdepth files are read as associated files by other workers, so nothing is moved
+        # until all of the workers are done
+        MakeDirIfNeeded(".", uploadDir)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=InitializeWorker, initargs=GetWorkerSettings()) as pool :
+            results = list(pool.map(ConvertInputFile, [work[0] for work in workList], [work[1] for work in workList]))
+        for result in results :
+            if fileMove and result["Move"] :
+                MoveCompletedFile(result["File"], "."+os.sep+"For Script", "Processed Files")
+    else :
+        for fileType, processFileInfo in workList :
+            result = ConvertInputFile(fileType, processFileInfo)
+            if fileMove and result["Move"] :
+                MoveCompletedFile(result["File"], "."+os.sep+"For Script", "Processed Files")
+            results.append(result)
+
+    for (fileType, processFileInfo), result in zip(workList, results) :
+        RecordConversion(manifest, fileType, processFileInfo, conversionHashes[processFileInfo["File"]], result)
+    # reused VMMtempdepth files may be associated files of the files converted above, so these move last
+    for result in reusedResults :
+        if fileMove and result["Move"] :
+            MoveCompletedFile(result["File"], "."+os.sep+"For Script", "Processed Files")
+    WriteManifest(manifest)
+    return(results + reusedResults)
+
+
+## @return List of result dictionaries from ConvertInputFile(), one per input file converted.@endparblock
+## Converts the input files in the backfill source folder again, for regenerating the uploads of past
+## seasons after a rule change. Only the files dated within the -bf range are converted, in the order
+## of fileTypes, with their associated files looked up in the same folder. The conversions run in
+## -j worker processes, one per CPU unless -j is given, without user queries on warnings. The
+## upload and warnings files are written to the backfill output folder, and no input file is moved.
+##
+## Each converted file is recorded in backfillCheckpoint.jsonl in the output folder as soon as it is
+## done, so a backfill that is stopped can be run again and goes on where it stopped. Files already
+## recorded are skipped, unless they, their associated file, projectSites.txt or this script have
+## changed since, see GetConversionHashes(), or the site statistics they were checked against, see
+## SiteStatsChanged(), or -f is used. The conversion manifest is not used.
+## The upload files imported since the last batch are added to the site statistics first, see AcceptSiteStats().
+##
+## Uses global fileTypes, forceConvert, backfillDates, backfillSource, backfillOutput and jobs. Sets global uploadDir,
+## warningsDir, noFilesFound and conversionBatch.
+def BackfillFiles():
+    global uploadDir, warningsDir, noFilesFound, conversionBatch
+    conversionBatch = str(time.time())
+    AcceptSiteStats()
+    uploadDir = backfillOutput
+    warningsDir = backfillOutput
+    os.makedirs(backfillOutput, exist_ok=True)
+    checkpointFile = os.path.join(backfillOutput, "backfillCheckpoint.jsonl")
+    ## Dictionary of the checkpoint entry of each input file, from earlier backfills, keyed by input file name
+    checkpoint = ReadCheckpoint(checkpointFile)
+    ## Dictionary of file hashes found in this run, keyed by pathname
+    fileHashes = {}
+    ## Dictionary of the hashes each input file's conversion depends on, keyed by input file name
+    conversionHashes = {}
+
+    ## List of (fileType, file info) pairs to convert, in the order of fileTypes
+    workList = []
+    skipped = 0
+    inputIndex = IndexInputFiles(backfillSource)
+    for fileType in fileTypes :
+        for processFileInfo in GetProjectInputFileList(fileType, inputIndex) :
+            if not backfillDates[0] <= processFileInfo["Date"] <= backfillDates[1] :
+                continue
+            noFilesFound = False
+            hashes = GetConversionHashes(processFileInfo, fileHashes)
+            entry = checkpoint.get(processFileInfo["File"])
+            if not forceConvert and entry is not None and entry["Hashes"] == hashes and \
+                    not (siteStatsFile and SiteStatsChanged(entry, GetUploadFileName(fileType, processFileInfo["Date"]))) :
+                skipped = skipped + 1
+            else :
+                conversionHashes[processFileInfo["File"]] = hashes
+                workList.append((fileType, processFileInfo))
+    if skipped :
+        print(str(skipped)+" input files were already converted by an earlier backfill, skipping them")
+    print("Converting "+str(len(workList))+" input files from "+backfillSource+" into "+backfillOutput)
+
+    ## List of result dictionaries from ConvertInputFile(), in the order the conversions finish
+    results = []
+    with open(checkpointFile, 'a+') as checkpointOut:
+        if checkpointOut.tell() > 0 :
+            checkpointOut.seek(checkpointOut.tell() - 1)
+            if checkpointOut.read(1) != "\n" :
+                checkpointOut.write("\n") # ends the line of a backfill stopped while writing it
+        if jobs > 1 and len(workList) > 1 :
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=InitializeWorker, initargs=GetWorkerSettings()) as pool :
+                futures = [pool.submit(ConvertInputFile, fileType, processFileInfo) for fileType, processFileInfo in workList]
+                for future in concurrent.futures.as_completed(futures) :
+                    result = future.result()
+                    RecordCheckpoint(checkpointOut, result, conversionHashes[result["File"]])
+                    results.append(result)
+        else :
+            for fileType, processFileInfo in workList :
+                result = ConvertInputFile(fileType, processFileInfo)
+                RecordCheckpoint(checkpointOut, result, conversionHashes[result["File"]])
+                results.append(result)
+    return(results)
+
+
+## @parblock @param [in] checkpointFile String pathname of the backfill checkpoint file
+## @return Dictionary of the checkpoint entry of each input file, with the hashes it was converted with, keyed by input file name, empty if there is no checkpoint.@endparblock
+## Reads the checkpoint written by RecordCheckpoint(). A line that cannot be read, such as the last
+## line of a backfill that was stopped while writing it, is ignored, so that file is converted again.
+def ReadCheckpoint(checkpointFile):
+    checkpoint = {}
+    if not os.path.exists(checkpointFile) :
+        return(checkpoint)
+    with open(checkpointFile, 'r') as jsonFile:
+        for line in jsonFile :
+            try :
+                entry = json.loads(line)
+                checkpoint[entry["File"]] = {"Hashes":entry["Hashes"], "Site Stats":entry.get("Site Stats")}
+            except (ValueError, KeyError, TypeError) :
+                continue
+    return(checkpoint)
+
+
+## @parblock @param [in] checkpointOut Backfill checkpoint file, open for appending
+## @param [in] result Result dictionary from ConvertInputFile()
+## @param [in] hashes Dictionary of hashes from GetConversionHashes()@endparblock
+## Adds a line for a converted input file to the backfill checkpoint, and flushes it, so that it is
+## kept even if the backfill is stopped right after.
+def RecordCheckpoint(checkpointOut, result, hashes):
+    checkpointOut.write(json.dumps({"File":result["File"], "Hashes":hashes, "Records":result["Records"], "Warnings":result["Warnings"],
+                                    "Site Stats":result["Site Stats"]})+"\n")
+    checkpointOut.flush()
+
+
+## @return Dictionary of (size, modification time) of each input file in the For Script folder, keyed by file name.
+## Only files named like input files are included, not the warnings files.
+def GetForScriptSnapshot():
+    dir = "For Script"
+    snapshot = {}
+    for entry in os.scandir(dir) :
+        if entry.is_file() and fnmatch.fnmatch(entry.name, '2[0-9][0-9][0-9][01][0-9][0-3][0-9]_forscript_*.csv') :
+            stat = entry.stat()
+            snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return(snapshot)
+
+
+## @parblock @param [in] pollSeconds Float seconds between looks at the For Script folder@endparblock
+## Runs until stopped with Ctrl-C, converting input files as they land in the For Script folder.
+## The configuration and compiled tables stay loaded between conversions. A file is taken as complete
+## once the folder has not changed for one poll, so files still being copied in are left alone, and
+## the files that changed are converted. Files whose associated VMMtempdepth file was already moved to
+## Processed Files use it from there. Files left with warnings are converted again when they, their
+## associated file, or projectSites.txt change. projectSites.txt is reloaded when it changes. With -m,
+## the metrics files are written after each conversion.
+##
+## Uses global interactive and metricsDir.
+def WatchForScript(pollSeconds):
+    sitesFile = "Automate"+os.sep+"projectSites.txt"
+    sitesHash = HashFile(sitesFile, {})
+    lastSnapshot = None
+    convertedSnapshot = {}
+    print("Watching the For Script folder every "+str(pollSeconds)+" seconds, Ctrl-C to stop.")
+    try :
+        while True :
+            newSitesHash = HashFile(sitesFile, {})
+            if newSitesHash != sitesHash :
+                print("Reloading "+sitesFile)
+                LoadSiteData()
+                sitesHash = newSitesHash
+                convertedSnapshot = None
+            snapshot = GetForScriptSnapshot()
+            if snapshot == lastSnapshot and snapshot != convertedSnapshot :
+                passStart = time.time()
+                results = ConvertForScriptFiles("Processed Files")
+                CloseWarning(runContext)
+                records = sum(result["Records"] for result in results)
+                warnings = sum(result["Warnings"] for result in results)
+                elapsed_time = (time.time() - passStart) * 1000
+                if metricsDir :
+                    WriteMetrics(results, elapsed_time / 1000)
+                print('{}{}{}{}{}{:4.1f} {}'.format("Created ", records, " data entries with ", warnings, " warnings in ", elapsed_time, "milliseconds."))
+                snapshot = GetForScriptSnapshot()
+                convertedSnapshot = snapshot
+            lastSnapshot = snapshot
+            time.sleep(pollSeconds)
+    except KeyboardInterrupt :
+        print("Stopped watching the For Script folder.")
+
+
+## @parblock @param [in] results List of result dictionaries from ConvertForScriptFiles()
+## @param [in] seconds Float wall time of the run@endparblock
+## Writes the metrics of the run to the metrics folder, as waterdataparser_metrics.json, and as
+## waterdataparser.prom in the Prometheus text format, for the node exporter's textfile collector.
+## Each file is replaced as a whole, so a collector never reads half of one. Input files whose last
+## output was reused have no metrics of their own, they are only counted.
+##
+## Uses global metricsDir.
+def WriteMetrics(results, seconds):
+    fileMetrics = [result["Metrics"] for result in results if result["Metrics"]]
+    runMetrics = {"Timestamp":time.time(), "Seconds":seconds, "Files Converted":len(fileMetrics),
+                  "Files Reused":len(results) - len(fileMetrics), "Records":sum(result["Records"] for result in results),
+                  "Warnings":sum(result["Warnings"] for result in results), "Files":fileMetrics}
+    os.makedirs(metricsDir, exist_ok=True)
+    WriteFileReplacing(metricsDir+os.sep+"waterdataparser_metrics.json", json.dumps(runMetrics, indent=1)+"\n")
+    WriteFileReplacing(metricsDir+os.sep+"waterdataparser.prom", FormatPrometheusMetrics(runMetrics))
+
+
+## @parblock @param [in] runMetrics Dictionary of run metrics, as made by WriteMetrics()
+## @return String of the metrics in the Prometheus text format.@endparblock
+## Every metric is a gauge, as each run replaces the file. The per-file metrics are labeled with the
+## input file name and template.
+##
+## Uses global prometheusMetrics.
+def FormatPrometheusMetrics(runMetrics):
+    samples = {}
+    for name in prometheusMetrics.keys() :
+        samples[name] = []
+    samples["waterdataparser_last_run_timestamp_seconds"].append(("", runMetrics["Timestamp"]))
+    samples["waterdataparser_run_seconds"].append(("", runMetrics["Seconds"]))
+    samples["waterdataparser_run_records"].append(("", runMetrics["Records"]))
+    samples["waterdataparser_run_warnings"].append(("", runMetrics["Warnings"]))
+    samples["waterdataparser_run_files"].append((PrometheusLabels({"state":"converted"}), runMetrics["Files Converted"]))
+    samples["waterdataparser_run_files"].append((PrometheusLabels({"state":"reused"}), runMetrics["Files Reused"]))
+    for metrics in runMetrics["Files"] :
+        fileLabels = {"file":metrics["File"], "template":metrics["Template"]}
+        samples["waterdataparser_file_seconds"].append((PrometheusLabels(fileLabels), metrics["Seconds"]))
+        samples["waterdataparser_file_records"].append((PrometheusLabels(fileLabels), metrics["Records"]))
+        samples["waterdataparser_bytes_read"].append((PrometheusLabels(fileLabels), metrics["Bytes Read"]))
+        samples["waterdataparser_bytes_written"].append((PrometheusLabels(fileLabels), metrics["Bytes Written"]))
+        for reason, count in metrics["Dropped"].items() :
+            samples["waterdataparser_rows_dropped"].append((PrometheusLabels(dict(fileLabels, reason=reason)), count))
+        for category, count in metrics["Warnings"].items() :
+            samples["waterdataparser_warnings"].append((PrometheusLabels(dict(fileLabels, category=category)), count))
+        for stage in metrics["Stages"] :
+            labels = PrometheusLabels(dict(fileLabels, stage=stage["Stage"]))
+            samples["waterdataparser_stage_seconds"].append((labels, stage["Seconds"]))
+            samples["waterdataparser_stage_rows_in"].append((labels, stage["Rows In"]))
+            samples["waterdataparser_stage_rows_out"].append((labels, stage["Rows Out"]))
+
+    lines = []
+    for name, helpText in prometheusMetrics.items() :
+        lines.append("# HELP "+name+" "+helpText)
+        lines.append("# TYPE "+name+" gauge")
+        for labels, value in samples[name] :
+            lines.append(name+labels+" "+str(value))
+    return("\n".join(lines)+"\n")
+
+
+## @parblock @param [in] labels Dictionary of label values keyed by label name
+## @return String of the labels in the Prometheus text format, with the values escaped.@endparblock
+def PrometheusLabels(labels):
+    pairs = []
+    for name, value in labels.items() :
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(name+'="'+value+'"')
+    return("{"+",".join(pairs)+"}")
+
+
+## @parblock @param [in] fileName String pathname of the file to write
+## @param [in] text String contents of the file@endparblock
+## Writes the text to a temporary file next to fileName, then replaces fileName with it.
+def WriteFileReplacing(fileName, text):
+    with open(fileName+".tmp", 'w') as outputFile:
+        outputFile.write(text)
+    os.replace(fileName+".tmp", fileName)
+
+
+## @details Converts lab data files with a ConverterConfig, see CompileConfig(). The site data is read,
+## and the validation tables and method rules are compiled, once, when the Converter is made, and then
+## used as they are by each conversion. This program converts its input files with one, see
+## LoadSiteData(), and so can Python programs that import this file rather than run it, such as a
+## service converting files many times a minute. For example:
+##
+##     import WaterDataParser
+##     converter = WaterDataParser.Converter("C:/WQ_Database/Automate")
+##     rows, warnings = converter.ConvertFile("For Script/20200603_forscript_MWRA.csv", "MWRA")
+##
+## Each conversion has a ConversionContext of its own, from NewContext(), which the conversion routines
+## are given, and the config is read only, so a Converter can convert files from several threads at
+## once, and the module globals are not changed.
+class Converter :
+
+    ## @parblock @param [in] automateDir String pathname of the folder with projectSites.txt and the site statistics, by default the folder of this file
+    ## @param [in] useColumnar Boolean true to convert with the columnar engine
+    ## @param [in] config ConverterConfig to use, from CompileConfig(), by default compiled from the site data in automateDir
+    ## @param [in] useInteractive Boolean true to query the user on warnings, as with -i@endparblock
+    ## When the Converter compiles its own config, the site data is only read: when projectSites.txt is
+    ## missing, the internal site lists are used and the file is not written.
+    def __init__(self, automateDir="", useColumnar=False, config=None, useInteractive=False) :
+        ## List of the warning dictionaries from reading the site data, in the form ConvertFile() returns
+        self.siteWarnings = []
+        if config is None :
+            if not automateDir :
+                automateDir = os.path.dirname(os.path.abspath(__file__))
+            context = ConversionContext("", {"File":"", "Date":None, "Field File":""})
+            config = CompileConfig(context, automateDir, writeMissing=False)
+            self.siteWarnings = list(context.warningEntries.values())
+        ## ConverterConfig of the site data and the tables compiled from it
+        self.config = config
+        ## Boolean true to convert with the columnar engine
+        self.columnar = useColumnar
+        ## Boolean true to query the user on warnings
+        self.interactive = useInteractive
+
+    ## @parblock @param [in] fileType Type of file, a key of fileSuffixes
+    ## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+    ## @return ConversionContext for converting the file with this Converter's config and engine.@endparblock
+    def NewContext(self, fileType, processFileInfo) :
+        return(ConversionContext(fileType, processFileInfo, self.config, self.interactive, self.columnar))
+
+    ## @parblock @param [in] path String pathname of the lab data file
+    ## @param [in] template Type of file, a key of fileSuffixes, such as "MWRA"
+    ## @param [in] fieldFile String pathname of the associated VMMtempdepth file, or empty for none
+    ## @param [in] fileDate datetime date object the sample dates are checked against, by default the
+    ## YYYYMMDD date the file name starts with
+    ## @return Tuple of the list of AccessRows of the file, in upload file order, and the list of warning
+    ## dictionaries, as written to the JSON Lines warnings file, see PrintWarning().@endparblock
+    ## Converts a file in memory, see ConvertAccessRows(), as with -a: the user is never queried, and the
+    ## warnings are returned instead of being written to a warnings file. No upload file is written and
+    ## no file is moved.
+    ## Raises ValueError for an unknown template, or a file name without a date when fileDate is not given.
+    ##
+    ## Uses global fileSuffixes.
+    def ConvertFile(self, path, template, fieldFile="", fileDate=None) :
+        if template not in fileSuffixes.keys() :
+            raise ValueError("Unknown template "+template+", expected one of "+", ".join(fileSuffixes.keys()))
+        if fileDate is None :
+            fileDate = datetime.strptime(os.path.basename(path)[0:8], "%Y%m%d").date()
+        context = ConversionContext(template, {"File":path, "Date":fileDate, "Field File":fieldFile}, self.config, False, self.columnar)
+        if fileSuffixes[template]["associated"] and not fieldFile :
+            Warning(context, fileSuffixes[template]["associated"]+" file not found to go with "+path+"; no field comments available.")
+        if ConvertAccessRows(context, template, path, fieldFile) == 0 :
+            Warning(context, "No data found in "+path)
+        return(context.accessData, list(context.warningEntries.values()))
+
+
+## @details Holds the state for converting one input file: the file info, the project and lab from the
+## file type, the lab and Access data, the row indexes used for dupes and field comments, and the
+## warnings file and count. Each input file gets its own context, so that input files can be converted
+## independently of each other, including in separate worker processes with -j.
+class ConversionContext :
+    ## @parblock @param [in] fileType Type of file, empty for warnings outside of converting an input file
+    ## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+    ## @param [in] config ConverterConfig to convert with, None for warnings outside of converting an input file
+    ## @param [in] useInteractive Boolean true to query the user on warnings
+    ## @param [in] useColumnar Boolean true to convert with the columnar engine@endparblock
+    def __init__(self, fileType, processFileInfo, config=None, useInteractive=False, useColumnar=False) :
+        ## Which type of file
+        self.fileType = fileType
+        ## Project code from the fileType.
+        self.projectCode = fileSuffixes[fileType]["project"] if fileType else ""
+        ## Which lab performs the analysis
+        self.lab = fileSuffixes[fileType]["lab"] if fileType else ""
+        ## File name to process for data
+        self.inputFile = processFileInfo["File"]
+        ## Sample datetime date object from input filename
+        self.sampleDate = processFileInfo["Date"]
+        ## Auxilliary file used for VMM site comments, empty except for VMM
+        self.fieldFile = processFileInfo["Field File"]
+        ## ConverterConfig of the site data and the tables compiled from it, see CompileConfig()
+        self.config = config
+        ## Boolean true to query the user on warnings, see Warning()
+        self.interactive = useInteractive
+        ## Boolean true to convert with the columnar engine, see ConvertAccessRows()
+        self.columnar = useColumnar
+        ## Dictionary of the method rules made for sites not in the config's table, see GetMethodRule()
+        self.addedRules = {}
+        ## This list of dictionaries contains the data from the input file.
+        self.labData = []
+        ## This list of dictionaries contains the data to output. The output data is populated from the
+        ## input data per rules coded in FillAccessData(), FillAccessFieldComments(), and FillDupeAccessData().
+        self.accessData = []
+        ## Keep track of sites processed
+        self.siteRows = []
+        ## Dictionary keeps track of sample address from lab file for ROV sites
+        self.rovAddresses = {}
+        ## Dictionary of which dupe sites are on which rows of access data
+        self.dupeSiteRows = {}
+        ## Handle to the warnings file for this input file, sys.stdout until a warning occurs
+        self.warningFile = sys.stdout
+        ## Dictionary of warnings collected when not in interactive mode, keyed by message, see PrintWarning()
+        self.warningEntries = {}
+        ## Name of the sanity check running, recorded with its warnings
+        self.warningCode = ""
+        ## AccessRow being checked, whose Activity_ID and site are recorded with its warnings
+        self.warningRow = None
+        ## Set of the Activity_IDs of the rows that had warnings, left out of the site statistics
+        self.warnedIds = set()
+        ## Integer counts warnings for this input file
+        self.warningCount = 0
+        ## Dictionary of the seconds taken by each sanity check rule, when timed with -m, see SanityCheckRow()
+        self.ruleSeconds = {}
+        ## Dictionary of the SiteStats used by the range check, or None where it used the fixed limits, keyed by (Site_ID, Component_ID)
+        self.statsUsed = {}
+        ## Dictionary of warning counts keyed by the code recorded with each warning, see PrintWarning()
+        self.warningCodes = {}
+        ## Ordered dictionary of seconds and rows in and out per conversion stage, see RecordStage()
+        self.stageMetrics = OrderedDict()
+        ## Dictionary of the number of lab data rows left out of the output, keyed by reason
+        self.droppedRows = {"Empty Site ID":0, "Invalid Formatted Entry":0, "FDUP depth/temperature":0}
+        ## Boolean true to keep the upload file in memory for the pipeline to write, see WriteAccessDataFile()
+        self.deferWrites = False
+        ## List of (pathname, bytes) of the upload files not yet written, when deferWrites is true
+        self.deferredWrites = []
+        ## List of the replicate statistics of the averaged results, with -rs, see WriteReplicateStats()
+        self.replicateRows = []
+
+
+## @parblock @param [in] fileType Type of file, sets the project, lab and expected column headings
+## @param [in] processFileInfo Dictionary of file info, from GetProjectInputFileList()
+## @return Dictionary with the input file name, counts of records and warnings, the rule summary, the
+## metrics, whether the input file can be moved, and with -p the upload files still to be written.@endparblock
+## Converts one input file into its Access upload file. The conversion uses a new ConversionContext
+## from the converter, see Converter.NewContext(), which is passed to the conversion routines. Warnings
+## go to a warnings file for this input file only. The input file itself is not moved here, that is left to the caller.
+## The metrics are from GetFileMetrics(). With -p the upload file is not written here either, its
+## bytes are returned under "Output Files" for the pipeline's writer, see RunPipeline().
+##
+## With -rs the replicate statistics are written too, see WriteReplicateStats().
+##
+## Uses global fileSuffixes, converter, streaming and pipeline.
+def ConvertInputFile(fileType, processFileInfo):
+    context = converter.NewContext(fileType, processFileInfo)
+    context.deferWrites = pipeline
+    inputFile = context.inputFile
+    fieldFile = context.fieldFile
+    startTime = time.perf_counter()
+
+    if fileSuffixes[fileType]["associated"] and not fieldFile :
+        Warning(context, fileSuffixes[fileType]["associated"]+" file not found to go with "+inputFile+"; no field comments available.")
+
+    if streaming :
+        # rows are written as they are converted
+        records = StreamAccessDataFile(context, fileType, inputFile, fieldFile, context.sampleDate)
+    else :
+        records = ConvertAccessData(context, fileType, inputFile, fieldFile)
+    if records == 0 :
+        Warning(context, "No data found in "+inputFile)
+    if context.replicateRows :
+        WriteReplicateStats(context)
+
+    CloseWarning(context)
+    result = {"File":inputFile, "Records":records, "Warnings":context.warningCount, "Rules":GetRuleStats(context, records),
+              "Site Stats":{"Keys":sorted(context.statsUsed.keys()), "Hash":HashStatsUsed(context.statsUsed)},
+              "Metrics":GetFileMetrics(context, records, time.perf_counter() - startTime),
+              "Move":records > 0 and (context.warningCount == 0 or context.interactive)}
+    if context.deferWrites :
+        result["Output Files"] = context.deferredWrites
+    return(result)
+
+
+## @parblock @param [in] records Integer number of Access data rows written
+## @param [in] seconds Float wall time of the conversion@endparblock
+## @return Dictionary of the metrics of the context's conversion: the file name and template, the
+## records, the seconds, the stages from RecordStage(), the rows dropped by reason, the warnings by
+## code, and the bytes read from the input and field files and written to the upload file.
+def GetFileMetrics(context, records, seconds):
+    bytesRead = 0
+    for fileName in (context.inputFile, context.fieldFile) :
+        if fileName and os.path.isfile(fileName) :
+            bytesRead = bytesRead + os.path.getsize(fileName)
+    uploadFile = GetUploadFileName(context.fileType, context.sampleDate)
+    deferredFiles = dict(context.deferredWrites)
+    if uploadFile in deferredFiles :
+        bytesWritten = len(deferredFiles[uploadFile])
+    else :
+        bytesWritten = os.path.getsize(uploadFile) if records and os.path.isfile(uploadFile) else 0
+    stages = [dict(metrics, Stage=name) for name, metrics in context.stageMetrics.items()]
+    return({"File":os.path.basename(context.inputFile), "Template":context.fileType, "Records":records, "Seconds":seconds,
+            "Stages":stages, "Dropped":dict(context.droppedRows), "Warnings":dict(context.warningCodes),
+            "Bytes Read":bytesRead, "Bytes Written":bytesWritten})
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] inputFile String pathname to the lab data file
+## @param [in] fieldFile String pathname to the associated field file, or empty
+## @return Number of Access data rows.@endparblock
+## Converts the lab data of the context into Access data held in memory, with the row or the columnar
+## engine, and checks it. Nothing is written.
+## Each stage is recorded by RecordStage(), under the name of the row engine's routine, so the
+## metrics of both engines can be compared.
+##
+## Uses global fileSuffixes, labAttributes and columnar.
+def ConvertAccessRows(context, fileType, inputFile, fieldFile):
+    if context.columnar :
+        # the same steps, a column at a time
+        startTime = time.perf_counter()
+        labColumns = GetLabFileColumns(context, fileType, inputFile)
+        rowCount = len(labColumns["Site ID"])
+        RecordStage(context, "GetLabFileData", startTime, rowCount, rowCount + context.droppedRows["Empty Site ID"])
+        if "averageInRow" in fileSuffixes[fileType].keys() :
+            startTime = time.perf_counter()
+            AverageColumnData(context, labColumns, fileSuffixes[fileType]["averageInRow"])
+            RecordStage(context, "AverageRowData", startTime, rowCount)
+        startTime = time.perf_counter()
+        labColumns = SerializeColumns(context, labColumns, fileSuffixes[fileType]["testsPerRow"])
+        RecordStage(context, "SerializeData", startTime, len(labColumns["Site ID"]))
+        startTime = time.perf_counter()
+        ## Boolean asserts if < or > was found in any of the "Actual_Result" fields
+        ltGtFound = FillAccessDataColumns(context, labColumns)
+        RecordStage(context, "FillAccessData", startTime, len(context.accessData))
+    else :
+        # get the data from the file
+        startTime = time.perf_counter()
+        GetLabFileData(context, fileType, inputFile)
+        RecordStage(context, "GetLabFileData", startTime, len(context.labData), len(context.labData) + context.droppedRows["Empty Site ID"])
+
+        if "averageInRow" in fileSuffixes[fileType].keys() :
+            startTime = time.perf_counter()
+            AverageRowData(context, fileSuffixes[fileType]["averageInRow"])
+            RecordStage(context, "AverageRowData", startTime, len(context.labData))
+
+        # convert the lab data to one row per test parameter
+        startTime = time.perf_counter()
+        SerializeData(context, fileSuffixes[fileType]["testsPerRow"])
+        RecordStage(context, "SerializeData", startTime, len(context.labData))
+
+        # fill all the Access data except field comments and duplicates
+        startTime = time.perf_counter()
+        ## Boolean asserts if < or > was found in any of the "Actual_Result" fields
+        ltGtFound = FillAccessData(context)
+        RecordStage(context, "FillAccessData", startTime, len(context.accessData))
+
+    # Here is where we update the data for the sample duplicates
+    if labAttributes[context.lab]["dupeSupport"] :
+        startTime = time.perf_counter()
+        FillDupeAccessData(context)
+        RecordStage(context, "FillDupeAccessData", startTime, len(context.accessData))
+
+    #if "testsToAverage" in fileSuffixes[fileType].keys() : # only used for ne_cyano_data_entry files
+    #    ApplyAnalysisRepetition(fileSuffixes[fileType]["testsToAverage"])
+
+    # fill the Access data field comments, when they come from a separate file
+    if fileSuffixes[fileType]["associated"] and fieldFile :
+        startTime = time.perf_counter()
+        FillAccessFieldComments(context, fieldFile)
+        RecordStage(context, "FillAccessFieldComments", startTime, len(context.accessData))
+
+    records = len(context.accessData)
+    if records :
+        if ltGtFound :
+            startTime = time.perf_counter()
+            MoveLtGtRowToTop(context)
+            RecordStage(context, "MoveLtGtRowToTop", startTime, records)
+
+        # check the data looks valid
+        startTime = time.perf_counter()
+        SanityChecks(context, context.sampleDate)
+        RecordStage(context, "SanityChecks", startTime, records)
+    return(records)
+
+
+## @parblock @param [in] fileType Type of file
+## @param [in] inputFile String pathname to the lab data file
+## @param [in] fieldFile String pathname to the associated field file, or empty
+## @return Number of Access data rows written.@endparblock
+## Converts the lab data of the context into Access data held in memory, see ConvertAccessRows(),
+## checks its Activity_IDs against past upload files, see CheckPastActivityIds(), then writes the
+## upload file, with -db the database, and with -pq the Parquet file, and records the rows with
+## warnings for the site statistics, see RecordWarnedIds(). No file is written if there is no data.
+##
+## Uses global databaseFile, parquetExport, activityIndexFile and siteStatsFile.
+def ConvertAccessData(context, fileType, inputFile, fieldFile):
+    records = ConvertAccessRows(context, fileType, inputFile, fieldFile)
+    if records :
+        if activityIndexFile :
+            startTime = time.perf_counter()
+            CheckPastActivityIds(context, set(row.Activity_ID for row in context.accessData), GetUploadFileName(fileType, context.sampleDate))
+            RecordStage(context, "CheckPastActivityIds", startTime, records)
+
+        # write the output Access data file
+        startTime = time.perf_counter()
+        WriteAccessDataFile(context, fileType, YearMonthDay(context.sampleDate))
+        RecordStage(context, "WriteAccessDataFile", startTime, records)
+
+        if databaseFile :
+            startTime = time.perf_counter()
+            WriteAccessDatabase(context.accessData)
+            RecordStage(context, "WriteAccessDatabase", startTime, records)
+        if siteStatsFile :
+            RecordWarnedIds(GetUploadFileName(fileType, context.sampleDate), context.warnedIds)
+        if parquetExport :
+            startTime = time.perf_counter()
+            WriteAccessParquetFile(context.accessData, GetUploadFileName(fileType, context.sampleDate)[:-len(".csv")]+".parquet")
+            RecordStage(context, "WriteAccessParquetFile", startTime, records)
+    return(records)
+
+
+## @parblock @param [in] name String name of the stage
+## @param [in] startTime Float time.perf_counter() value taken when the stage started
+## @param [in] rowsOut Integer number of rows the stage produced
+## @param [in] rowsIn Integer number of rows the stage started with, None for the rows out of the stage before@endparblock
+## Records the wall time and the rows in and out of a conversion stage, for the metrics.
+##
+## Fills context stageMetrics.
+def RecordStage(context, name, startTime, rowsOut, rowsIn=None):
+    seconds = time.perf_counter() - startTime
+    if rowsIn is None :
+        rowsIn = next(reversed(context.stageMetrics.values()))["Rows Out"] if context.stageMetrics else 0
+    context.stageMetrics[name] = {"Seconds":seconds, "Rows In":rowsIn, "Rows Out":rowsOut}
+
+
+## @return Tuple of the arguments of InitializeWorker(), from the settings of this process.
+##
+## Uses global converter, columnar, streaming, databaseFile, parquetExport, uploadDir, warningsDir, activityIndexFile, replicateStats,
+## siteStatsFile, conversionBatch and timeRules.
+def GetWorkerSettings():
+    return((os.getcwd(), converter.config, columnar, streaming, databaseFile, parquetExport, uploadDir, warningsDir, activityIndexFile, replicateStats, siteStatsFile,
+            conversionBatch, timeRules))
+
+
+## @parblock @param [in] workingDir Working directory of the main process, as set by SetPath()
+## @param [in] config ConverterConfig of the main process, from CompileConfig()
+## @param [in] useColumnar Boolean true to use the columnar conversion engine
+## @param [in] useStreaming Boolean true to use the streaming conversion
+## @param [in] useDatabase String pathname of the SQLite database to also write, or empty
+## @param [in] useParquet Boolean true to also write Parquet files
+## @param [in] useUploadDir String pathname of the folder to write the upload files to
+## @param [in] useWarningsDir String pathname of the folder to write the warnings files to
+## @param [in] useActivityIndex String pathname of the Activity_ID index, or empty
+## @param [in] useReplicateStats Boolean true to write the replicate statistics
+## @param [in] useSiteStats String pathname of the site statistics, or empty
+## @param [in] useBatch String that marks the Activity_IDs recorded by the batch of conversions
+## @param [in] useTimeRules Boolean true to time the sanity check rules@endparblock
+## Sets up a worker process used to convert input files with -j. Workers never query the user
+## on warnings, since they have no console input. The arguments come from GetWorkerSettings().
+## The tables compiled by the main process are used as they are, by the worker's Converter.
+##
+## Sets global converter, interactive, columnar, streaming, databaseFile, parquetExport, uploadDir, warningsDir, activityIndexFile, replicateStats,
+## siteStatsFile, conversionBatch and timeRules.
+def InitializeWorker(workingDir, config, useColumnar, useStreaming, useDatabase, useParquet, useUploadDir, useWarningsDir, useActivityIndex,
+                     useReplicateStats, useSiteStats, useBatch, useTimeRules):
+    global converter, interactive, columnar, streaming, databaseFile, parquetExport, uploadDir, warningsDir, activityIndexFile, replicateStats, siteStatsFile
+    global conversionBatch, timeRules
+    os.chdir(workingDir)
+    converter = Converter(useColumnar=useColumnar, config=config)
+    interactive = False
+    runContext.interactive = False
+    columnar = useColumnar
+    streaming = useStreaming
+    databaseFile = useDatabase
+    parquetExport = useParquet
+    uploadDir = useUploadDir
+    warningsDir = useWarningsDir
+    activityIndexFile = useActivityIndex
+    replicateStats = useReplicateStats
+    siteStatsFile = useSiteStats
+    conversionBatch = useBatch
+    timeRules = useTimeRules
+
         
 
 #  ############################################-
@@ -1046,16 +3891,23 @@ def MoveCompletedFile(dataFile, path, dirName):
 #  ############################################-
 
 
-import sys, os.path, argparse, csv, time, shutil, fnmatch, json
-from datetime import datetime, timedelta
-
-## Save start time
-start_time = time.time()
+import sys, os.path, argparse, csv, time, shutil, fnmatch, json, hashlib, sqlite3, operator, concurrent.futures, asyncio, io, copyreg
+from datetime import datetime
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+try :
+    import numpy
+except ImportError :
+    numpy = None # the replicate averages fall back to plain lists
+try :
+    import pyarrow, pyarrow.parquet
+except ImportError :
+    pyarrow = None # -pq is not available
+# the read only tables of a ConverterConfig are pickled as copies for the -j workers, and made read only again by FreezeTable()
+copyreg.pickle(MappingProxyType, lambda table: (FreezeTable, (dict(table),)))
 
 ## Integer counts warnings
 warningCount = 0
-## Global handle to current warnings file
-warningFile = sys.stdout
 ## Boolean true causes input files to move to archive when done with no warnings
 fileMove = True
 ## Integer keeps track of data points saved to output files
@@ -1064,8 +3916,70 @@ recordCount = 0
 noFilesFound = True
 ## Boolean true if interactive mode, which asks user to resolve warnings
 interactive = True
-
-ParseArguments()
+## Boolean true to use the columnar conversion engine
+columnar = False
+## Boolean true to stream rows from the input file to the upload file without holding the file in memory
+streaming = False
+## Float seconds between looks at the For Script folder in watch mode, zero to convert the files found once and quit
+watchSeconds = 0
+## Boolean true to convert every input file, even if the manifest shows it has not changed since the last run
+forceConvert = False
+## String pathname of the folder the upload files are written to
+uploadDir = "For Upload"
+## String pathname of the folder the warnings files are written to
+warningsDir = "."+os.sep+"For Script"
+## Tuple of the first and last datetime date objects of the input files to convert again with -bf, None for a usual run
+backfillDates = None
+## String pathname of the folder of input files to convert again with -bf, see BackfillFiles()
+backfillSource = "For Script"+os.sep+"Processed Files"
+## String pathname of the folder -bf writes the upload and warnings files to
+backfillOutput = "Backfill"
+## String pathname of the conversion manifest, relative to the WQ_Database folder, see ReadManifest()
+manifestFile = "Automate"+os.sep+"conversionManifest.json"
+## String absolute pathname of this script, whose rules are part of the manifest hashes
+scriptFile = os.path.abspath(__file__)
+## String pathname of the index of the Activity_IDs of past upload files, relative to the WQ_Database folder, see IndexActivityIds(), empty to not check them
+activityIndexFile = "Automate"+os.sep+"activityIndex.db"
+## String pathname of the folder upload files are moved to once imported, relative to the WQ_Database folder, see IndexActivityIds()
+uploadedArchiveDir = "For Upload"+os.sep+"Uploaded Archive"
+## String that marks the Activity_IDs recorded by the current batch of conversions, see IndexActivityIds()
+conversionBatch = ""
+## String name of the site statistics file, in the Automate folder
+siteStatsName = "siteStatistics.db"
+## String pathname of the site statistics, relative to the WQ_Database folder, see AddSiteStats(), empty to use the limits of analysisCodes only
+siteStatsFile = "Automate"+os.sep+siteStatsName
+## String absolute pathname of a folder of upload files to add to the site statistics with -ss, see BuildSiteStats()
+siteStatsHistory = ""
+## Integer number of recent results per site and analysis the quantiles are found from, and that mostly weigh in the rolling mean and variance
+siteStatsWindow = 100
+## Integer number of past results a site needs for an analysis before its statistics replace the limits of analysisCodes
+siteStatsMinCount = 10
+## Float anomaly score, in rolling standard deviations from the rolling mean, over which a result outside the usual range of its site is warned of
+siteStatsScoreLimit = 3.0
+## String pathname to write the method rules to, see WriteMethodRules(), empty to convert files as usual
+dumpRulesFile = ""
+## Integer number of worker processes used to convert input files, 1 converts them in this process
+jobs = 1
+## Boolean true to overlap the reading, converting and writing of the input files, see RunPipeline()
+pipeline = False
+## Integer number of input files each stage of the pipeline may get ahead of the next
+pipelineDepth = 2
+## Dictionary of the contents of input files read ahead by the pipeline, as bytes keyed by pathname, see OpenInputFile()
+prefetchedFiles = {}
+## String absolute pathname of the folder to write the metrics files to, see WriteMetrics(), empty for no metrics
+metricsDir = ""
+## Boolean true to time each sanity check rule, see SanityCheckRow(), set with -m
+timeRules = False
+## String absolute pathname of a SQLite database to also write the Access data to, see WriteAccessDatabase(), empty for none
+databaseFile = ""
+## Integer number of rows given to each executemany() call when writing the database
+databaseBatchSize = 1000
+## Boolean true to also write the Access data to a Parquet file next to each upload file, see WriteAccessParquetFile()
+parquetExport = False
+## Integer number of rows in each row group of the Parquet files
+parquetRowGroupSize = 65536
+## Boolean true to write the count, average, standard deviation and CV of the replicates of each averaged result, see WriteReplicateStats()
+replicateStats = False
 
 ## Dictionary of project codes keyed by project name. "Field" is a pseudo-project, used in the case of VMM sampler data without lab data.
 projectCodes = {"CYN":1, "FLG":3, "VMM":7, "Field":7}
@@ -1089,6 +4003,19 @@ fileSuffixes = {"MWRA":{"project":"VMM", "lab":"MWRA", "testsPerRow":[], "associ
                          "averageInRow":{"Phycocyanin":"FQ PC Rep", "Chlorophyll A":"FQ CA Rep"}},
                 #"Hydrolab":{"project":"CYN", "lab":"Hydrolab", "testsPerRow":[], "associated":"", "columns":()}
                }
+## Tuple of the lab data columns the conversion uses, when a template has them. Only these, the tests
+## of the template and the replicates it averages are read from input files, see CompileLabProjections().
+usedLabColumns = ("Site ID", "Sample ID", "Date/Time", "Sampled Time", "Parameter", "Formatted Entry", "Display String",
+                  "FDUP?", "Test Comment", "Field Comments", "analysis_rep")
+
+## Dictionary of the column projection of each template, keyed by file type, see CompileLabProjections()
+labProjections = CompileLabProjections()
+
+## Integer size in bytes of the blocks input files are read in
+readBufferSize = 1 << 20
+## Integer number of lab data rows averaged at a time by the streaming conversion, see AverageRows()
+averageBatchSize = 4096
+
 # Alpha template headings Alpha Sample ID, Site ID, Date/Time, Parameter, Result, FDUP?
 # VMMtempdepth template headings are Site ID, Date/Time, Temperature (C), Depth (ft), Field Comments
 # Flagging template headings are G&L Lab. ID #, Site ID, Date/Time, E. coli Result (CFU/100mL), Temperature (C), Depth (ft), Field Comments, FDUP?
@@ -1200,12 +4127,28 @@ maxRPDTestLimits = {11:{"diff":100,"percent":100}, # Enterococci
                     28:{"diff":0.0,"percent":20}   # Phycocyanin
                    } 
 
+## Tuple of the date and time formats supported by GetDateTimeObject(), in the order they are tried
+dateTimeFormats = ("%m/%d/%Y %I:%M",        # 1/21/2020 6:00
+                   "%m/%d/%Y %I:%M:%S %p",  # 1/21/2020 6:00:00 AM
+                   "%m/%d/%y %I:%M",        # 1/21/20 6:00
+                   "%b %d, %Y, %I:%M %p",   # Jan 21, 2020, 6:00 AM
+                   "%b %d, %Y, %I:%M",      # Jan 21, 2020, 6:00
+                   "%Y%m%d",                # 20200121
+                   "%m/%d/%Y",              # 1/21/2020
+                   "%Y/%m/%d %I:%M %p")     # 2020/01/21 6:00 AM
+## Dictionary of the date format that last worked, keyed by column name
+learnedDateFormats = {}
+## Maximum number of date strings kept in dateTimeCache
+dateCacheSize = 10000
+## Ordered dictionary of datetime objects keyed by date string, least recently used first
+dateTimeCache = OrderedDict()
+
 ## get the date now
 now = time.localtime()
-## Datetime object for time now, later used for file date
-sampleDate = GetDateTimeObject(str(now[0])+str(now[1])+str(now[2]))
-## Which type of file, set empty for now
-fileType = ""
+## Conversion context of the run, which holds the warnings that occur outside of converting an input file
+runContext = ConversionContext("", {"File":"", "Date":None, "Field File":""}, None, interactive)
+## Datetime object for time now, used as the file date for those warnings
+runContext.sampleDate = ParseDateTime(str(now[0])+str(now[1])+str(now[2]))
 ## Dictionary giving tuples of site names legal per project, keyed by project name
 projectSites = {}
 ## Site collection type at each site uses "C-BABR" except these exception sites
@@ -1213,12 +4156,6 @@ siteCollectionExceptions = {}
 ## Depth measures at all sites are N-DL, except these
 depthCollectionExceptions = {}
 
-SetPath("For Script")
-
-# set site info
-ReadWriteSiteData("Automate")
-projectSites["Field"] = projectSites["VMM"]
-
 ## Dictionary of data type codes keyed by name
 dataTypes = {"Critical":1, "Non-critical":2, "Unknown":3}
 
@@ -1234,106 +4171,133 @@ relativeDepthTypes = {"Surface":1, "Midwater":2, "Near Bottom":3, "Bottom":4, "S
 ## Tuple listing the Access file output headings
 accessHeadings = ("Activity_ID","Lab_ID","Date_Collected","Time_Collected","Site_ID","Project_ID","Component_ID","Actual_Result","Actual_Result_Unit_ID","Activity_Type_ID","Actual_Result_Type_ID","Result_Sample_Fraction","Reporting_Result","Reporting_Result_Unit_ID","Reporting_Result_Type_ID","Collection_ID","Analytical_Method_ID","Associated_ID","Data_Type_ID","Media_Type_ID","Media_Subdivision_ID","Relative_Depth_ID","Result_Comment","Field_Comment","Event_Comment","QAQC_Comment","Percent_RPD","QAQC_Status")
 
+## @details One row of Access data, with a slot for each of accessHeadings rather than a dictionary per
+## row, which takes several times less memory. The fields are attributes named by heading, as
+## row.Site_ID, and can also be read and set by a heading held in a variable, as row[field], as
+## the sanity checks do. A new row has no fields set, FillAccessRow() and FillAccessDataColumns()
+## set every one of them. values() gives the fields in the order of accessHeadings, for csv.writer.
+class AccessRow :
+    __slots__ = accessHeadings
+
+    # a heading is the name of its slot
+    __getitem__ = object.__getattribute__
+    __setitem__ = object.__setattr__
+
+    ## @return Tuple of the fields, in the order of accessHeadings.
+    def values(self) :
+        return(accessRowValues(self))
+
+## Routine that gets the fields of an AccessRow as a tuple, in the order of accessHeadings
+accessRowValues = operator.attrgetter(*accessHeadings)
+
+## Dictionary of the type of the Access data columns that are not text, keyed by heading, see TypedAccessRow()
+accessColumnTypes = {"Date_Collected":"DATE", "Time_Collected":"TIME", "Project_ID":"INTEGER", "Component_ID":"INTEGER",
+                     "Actual_Result_Unit_ID":"INTEGER", "Activity_Type_ID":"INTEGER", "Actual_Result_Type_ID":"INTEGER",
+                     "Reporting_Result":"REAL", "Reporting_Result_Unit_ID":"INTEGER", "Reporting_Result_Type_ID":"INTEGER",
+                     "Data_Type_ID":"INTEGER", "Media_Type_ID":"INTEGER", "Media_Subdivision_ID":"INTEGER",
+                     "Relative_Depth_ID":"INTEGER", "Percent_RPD":"REAL"}
+
+## Tuple of the Access data columns with few distinct values, which are dictionary encoded in the Parquet files
+dictionaryColumns = ("Site_ID", "Analytical_Method_ID")
+
+## List of (rule name, rule routine) pairs, the sanity checks run by SanityCheckRow() on each row, in order
+sanityRules = [("Activity_ID", CheckActivityId), ("Lab_ID", CheckLabId), ("Date_Collected", CheckDateCollected),
+               ("Site_ID", CheckSiteId), ("Project_ID", CheckProjectId), ("Component_ID", CheckComponentId),
+               ("Results present", CheckResultsPresent), ("Reporting_Result", CheckReportingResult), ("Unit IDs", CheckUnits),
+               ("Activity_Type_ID", CheckActivityType), ("Type IDs", CheckTypeIds), ("Result_Sample_Fraction", CheckFraction),
+               ("Collection_ID", CheckCollectionId), ("Analytical_Method_ID", CheckMethodId), ("Associated_ID", CheckAssociatedId),
+               ("Media_Subdivision_ID", CheckMediaSubdivision), ("Result_Comment", CheckResultComment), ("Event_Comment", CheckEventComment),
+               ("QAQC_Comment", CheckQaqcComment), ("Percent_RPD", CheckPercentRpd), ("QAQC_Status", CheckQaqcStatus)]
+
+## Named tuple of the site data and the tables compiled from it, made once by CompileConfig() and read only, see FreezeTable():
+## projectSites, siteCollectionExceptions, depthCollectionExceptions, validationTables from CompileValidationTables(),
+## methodRules from CompileMethodRules(), and the absolute pathname of the site statistics, siteStatsFile, empty for none
+ConverterConfig = namedtuple("ConverterConfig", ("projectSites", "siteCollectionExceptions", "depthCollectionExceptions",
+                                                 "validationTables", "methodRules", "siteStatsFile"))
+## Named tuple of the statistics of the past results of a site and analysis, see ReadSiteStats(): the count, the rolling
+## mean and standard deviation, and the 5%, 50% and 95% quantiles of the recent results
+SiteStats = namedtuple("SiteStats", ("count", "mean", "deviation", "low", "median", "high"))
+## Converter the input files are converted with, made by LoadSiteData(), or by InitializeWorker() in -j workers
+converter = None
+
+## Dictionary of the help text of each metric in the Prometheus metrics file, keyed by metric name, see FormatPrometheusMetrics()
+prometheusMetrics = OrderedDict([
+    ("waterdataparser_last_run_timestamp_seconds", "Time the last run finished, in seconds since the epoch."),
+    ("waterdataparser_run_seconds", "Wall time of the last run, in seconds."),
+    ("waterdataparser_run_records", "Access data rows in the upload files of the last run."),
+    ("waterdataparser_run_warnings", "Warnings for the input files of the last run."),
+    ("waterdataparser_run_files", "Input files of the last run, converted or with their last output reused."),
+    ("waterdataparser_file_seconds", "Wall time of converting the input file, in seconds."),
+    ("waterdataparser_file_records", "Access data rows written for the input file."),
+    ("waterdataparser_bytes_read", "Bytes of the input file and its associated field file."),
+    ("waterdataparser_bytes_written", "Bytes of the upload file written for the input file."),
+    ("waterdataparser_rows_dropped", "Lab data rows of the input file left out of the upload file, by reason."),
+    ("waterdataparser_warnings", "Warnings for the input file, by the check or step that issued them."),
+    ("waterdataparser_stage_seconds", "Wall time of the conversion stage, in seconds."),
+    ("waterdataparser_stage_rows_in", "Rows going into the conversion stage."),
+    ("waterdataparser_stage_rows_out", "Rows coming out of the conversion stage.")])
+
 ## list of fileTypes, VMMtempdepth must be last
 fileTypes = []
 fileTypes = list(fileSuffixes.keys())
 fileTypes.remove("VMMtempdepth")
 fileTypes.append("VMMtempdepth")
 
-for fileType in fileTypes:
-    
-    ## Project code from the fileType.
-    projectCode = fileSuffixes[fileType]["project"]
-    
-    ## Which lab performs the analysis
-    lab = fileSuffixes[fileType]["lab"]
-    
-    ## List of files to process for this project, each file is in a tuple of info.
-    fileList = GetProjectInputFileList(fileType)
+# Everything above this point only sets up configuration, so that worker processes started with -j
+# can import this file without running the program.
+if __name__ == "__main__" :
 
-    if len(fileList) > 0 :
-        noFilesFound = False
-        for processFileInfo in fileList:
-            ## File name to process for data
-            inputFile = processFileInfo["File"]
+    ## Save start time
+    start_time = time.time()
 
-            ## Sample datetime date object from input filename
-            sampleDate = processFileInfo["Date"]
-            
-            ## Auxilliary file used for VMM site comments, empty except for VMM
-            fieldFile = processFileInfo["Field File"]
-            
-            if fileSuffixes[fileType]["associated"] and not fieldFile :
-                Warning(fileSuffixes[fileType]["associated"]+" file not found to go with "+inputFile+"; no field comments available.")
-            
-            ## This list of dictionaries contains the data to output. The output data is populated from the 
-            ## input data per rules coded in FillAccessData(), FillAccessFieldComments(), and FillDupeAccessData().
-            accessData = []
+    ParseArguments()
+    runContext.interactive = interactive
 
-            ## Keep track of sites processed
-            siteRows = []
-        
-            ## This list of dictionaries contains the data from the input file.
-            labData = []
-            # get the data from the file
-            GetLabFileData(fileType, inputFile)
-
-            if "averageInRow" in fileSuffixes[fileType].keys() :
-                AverageRowData(fileSuffixes[fileType]["averageInRow"])
-                
-            # convert the lab data to one row per test parameter
-            SerializeData(fileSuffixes[fileType]["testsPerRow"])
-
-            ## Dictionary keeps track of sample address from lab file for ROV sites
-            rovAddresses = {}
-            ## Dictionary of rows of access data, keyed by activityID
-            siteTestRows = {}
-            ## Dictionary of which dupe sites are on which rows of access data
-            dupeSiteRows = {}
-
-            # fill all the Access data except field comments and duplicates
-            ## Boolean asserts if < or > was found in any of the "Actual_Result" fields
-            ltGtFound = FillAccessData()
-
-            # Here is where we update the data for the sample duplicates
-            if labAttributes[lab]["dupeSupport"] :
-                FillDupeAccessData()
-            
-            #if "testsToAverage" in fileSuffixes[fileType].keys() : # only used for ne_cyano_data_entry files
-            #    ApplyAnalysisRepetition(fileSuffixes[fileType]["testsToAverage"])
+    SetPath("For Script")
 
-            # fill the Access data field comments, when they come from a separate file
+    # set site info
+    LoadSiteData()
+    if dumpRulesFile :
+        WriteMethodRules(dumpRulesFile, converter.config.methodRules)
+        print("Wrote "+str(len(converter.config.methodRules))+" method rules to "+dumpRulesFile)
+        exit(0)
+    if siteStatsHistory :
+        BuildSiteStats(siteStatsHistory)
+        exit(0)
 
-            if fileSuffixes[fileType]["associated"] and fieldFile :
-                FillAccessFieldComments(fieldFile)
-            
-            if len(accessData):
-                if ltGtFound :
-                    MoveLtGtRowToTop()
+    if watchSeconds :
+        WatchForScript(watchSeconds)
+        exit(0)
 
-                # check the data looks valid
-                SanityChecks(sampleDate)
+    ## List of result dictionaries from ConvertInputFile(), one per input file
+    if backfillDates :
+        results = BackfillFiles()
+    else :
+        results = ConvertForScriptFiles()
 
-                # write the output Access data file
-                WriteAccessDataFile(fileType, YearMonthDay(sampleDate))
+    # merge the per-file results into the run summary
+    ## Dictionary of [warnings, seconds] per sanity check rule, summed over all the files
+    ruleStats = {}
+    for result in results :
+        recordCount = recordCount + result["Records"]
+        warningCount = warningCount + result["Warnings"]
+        for name in result["Rules"] :
+            stats = ruleStats.setdefault(name, [0, 0.0])
+            stats[0] = stats[0] + result["Rules"][name][0]
+            stats[1] = stats[1] + result["Rules"][name][1]
+    CloseWarning(runContext)
+    warningCount = warningCount + runContext.warningCount
 
-                recordCount = recordCount + len(accessData)
+    if noFilesFound :
+        print("Warning: No input files found to process.")
+        warningCount = warningCount + 1
 
-                if fileMove and (warningCount == 0 or interactive):
-                    MoveCompletedFile(inputFile, "."+os.sep+"For Script", "Processed Files")
-            else :
-                Warning("No data found in "+inputFile)
-                
-        CloseWarning()
-    else :
-        print("No input files found for file type "+fileType)
-    
-if noFilesFound :
-    print("Warning: No input files found to process.")
-    warningCount = warningCount + 1
+    PrintRuleStats(ruleStats)
 
-## Get elapsed time of program duration
-elapsed_time = (time.time() - start_time) * 1000
-print('{}{}{}{}{}{:4.1f} {}'.format("Created ", recordCount, " data entries with ", warningCount, " warnings in ", elapsed_time, "milliseconds."))
+    ## Get elapsed time of program duration
+    elapsed_time = (time.time() - start_time) * 1000
+    if metricsDir :
+        WriteMetrics(results, elapsed_time / 1000)
+    print('{}{}{}{}{}{:4.1f} {}'.format("Created ", recordCount, " data entries with ", warningCount, " warnings in ", elapsed_time, "milliseconds."))
 
-exit(0)
+    exit(0)